@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator
+from src.ai.resilience import UpstreamUnavailableError
+from src.settings import Settings, singleton
+
+settings = Settings()
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class AdmissionRejectedError(UpstreamUnavailableError):
+    pass
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    agent_id: int = field(compare=False)
+    future: "asyncio.Future[float]" = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = max(1.0, capacity)
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self._rate <= 0
+
+    def try_acquire(self) -> bool:
+        if self.unlimited:
+            return True
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def seconds_until_available(self) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self._rate)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated_at) * self._rate
+        )
+        self._updated_at = now
+
+
+@singleton
+class AdmissionController:
+    # Porta de entrada das chamadas ao provedor: limite global de taxa (token
+    # bucket), teto de chamadas simultâneas no total e por agente, e uma fila
+    # limitada por prioridade para quem precisa esperar. Um agente no teto não
+    # bloqueia a fila: os pedidos de outros agentes passam na frente dele.
+    def __init__(self) -> None:
+        self._bucket = TokenBucket(
+            settings.AI_ADMISSION_RATE_PER_SECOND, settings.AI_ADMISSION_BURST
+        )
+        self._max_concurrency = settings.AI_ADMISSION_MAX_CONCURRENCY
+        self._max_per_agent = settings.AI_ADMISSION_MAX_PER_AGENT
+        self._queue_size = settings.AI_ADMISSION_QUEUE_SIZE
+        self._queue_timeout = settings.AI_ADMISSION_QUEUE_TIMEOUT
+        self._queue: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._active: defaultdict[int, int] = defaultdict(int)
+        self._active_total = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._recent_waits: deque[float] = deque(maxlen=1000)
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_wait_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(
+        self, agent_id: int, priority: Priority = Priority.INTERACTIVE
+    ) -> AsyncIterator[float]:
+        # Entrega ao bloco o tempo de espera na fila, em segundos
+        waited = await self.acquire(agent_id, priority)
+        try:
+            yield waited
+        finally:
+            self.release(agent_id)
+
+    async def acquire(
+        self, agent_id: int, priority: Priority = Priority.INTERACTIVE
+    ) -> float:
+        if not self._queue and self._can_start(agent_id) and self._bucket.try_acquire():
+            self._start(agent_id, 0.0)
+            return 0.0
+        if len(self._queue) >= self._queue_size:
+            self.rejected += 1
+            raise AdmissionRejectedError(
+                "Muitas requisições ao agente no momento. Tente novamente mais tarde."
+            )
+        waiter = _Waiter(
+            priority=priority,
+            sequence=next(self._sequence),
+            agent_id=agent_id,
+            future=asyncio.get_running_loop().create_future(),
+            enqueued_at=time.monotonic(),
+        )
+        heapq.heappush(self._queue, waiter)
+        self._dispatch()
+        try:
+            done, _ = await asyncio.wait({waiter.future}, timeout=self._queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not done:
+            self._abandon(waiter)
+            self.timed_out += 1
+            raise AdmissionRejectedError(
+                "Tempo de espera na fila do agente excedido. Tente novamente mais tarde."
+            )
+        return waiter.future.result()
+
+    def release(self, agent_id: int) -> None:
+        self._active[agent_id] -= 1
+        if self._active[agent_id] <= 0:
+            del self._active[agent_id]
+        self._active_total -= 1
+        self._dispatch()
+
+    def stats(self) -> dict[str, int | float]:
+        waits = sorted(self._recent_waits)
+        return {
+            "queue_depth": len(self._queue),
+            "in_flight": self._active_total,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": sum(waits) / len(waits) * 1000 if waits else 0.0,
+            "p95_wait_ms": waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+        }
+
+    def _can_start(self, agent_id: int) -> bool:
+        return (
+            self._active_total < self._max_concurrency
+            and self._active[agent_id] < self._max_per_agent
+        )
+
+    def _start(self, agent_id: int, waited: float) -> None:
+        self._active[agent_id] += 1
+        self._active_total += 1
+        self.admitted += 1
+        self._recent_waits.append(waited)
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        if waiter.future.done() and not waiter.future.cancelled():
+            # Liberado no mesmo instante em que o interessado desistiu
+            self.release(waiter.agent_id)
+            return
+        waiter.future.cancel()
+        self._queue.remove(waiter)
+        heapq.heapify(self._queue)
+
+    def _dispatch(self) -> None:
+        if not self._queue or self._active_total >= self._max_concurrency:
+            return
+        now = time.monotonic()
+        remaining: list[_Waiter] = []
+        for waiter in sorted(self._queue):
+            if waiter.future.done():
+                continue
+            if not self._can_start(waiter.agent_id):
+                remaining.append(waiter)
+                continue
+            if not self._bucket.try_acquire():
+                remaining.append(waiter)
+                self._schedule_dispatch()
+                continue
+            waited = now - waiter.enqueued_at
+            self._start(waiter.agent_id, waited)
+            waiter.future.set_result(waited)
+        heapq.heapify(remaining)
+        self._queue = remaining
+
+    def _schedule_dispatch(self) -> None:
+        if self._timer is not None:
+            return
+        delay = self._bucket.seconds_until_available()
+
+        def run() -> None:
+            self._timer = None
+            self._dispatch()
+
+        self._timer = asyncio.get_running_loop().call_later(delay, run)
@@ -1,9 +1,22 @@
-import requests
-from collections import deque
-from typing import Any, Deque, Literal, TypedDict
-from src.database.models import Agent
+import asyncio
+import hashlib
+import httpx
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Literal, TypedDict
+from src.ai.admission import AdmissionController, Priority
+from src.ai.http_client import AiHttpClient
+from src.ai.resilience import (
+    UpstreamError,
+    UpstreamUnavailableError,
+    raise_for_upstream_status,
+)
+from src.ai.single_flight import Completion, UpstreamSingleFlight
+from src.ai.text_normalization import estimate_tokens
+from src.ai.upstream_router import UpstreamEndpoint, UpstreamRouter
+from src.ai.chat_resolution import AgentSnapshot
 from src.settings import Settings
-from fastapi import status
 
 settings = Settings()
 
@@ -13,73 +26,90 @@ class Message(TypedDict):
     content: str
 
 
+DeltaCallback = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class UpstreamUsage:
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    upstream_seconds: float | None = None
+    queue_wait_seconds: float | None = None
+    # Resposta recebida de uma chamada idêntica já em andamento (sem custo extra)
+    coalesced: bool = False
+    # O provedor não informou `usage`: os tokens foram estimados localmente
+    tokens_estimated: bool = False
+
+
 class GeminiComunicationHandler:
     def __init__(
-        self, agent: Agent, user_question: str, questions: list[str], answers: list[str]
+        self,
+        agent: AgentSnapshot,
+        user_question: str,
+        system_prompt: str,
+        on_delta: DeltaCallback | None = None,
+        history: list[Message] | None = None,
+        priority: Priority = Priority.INTERACTIVE,
+        max_tokens: int = 500,
     ) -> None:
         global settings
         self._agent = agent
+        self._priority = priority
+        self._max_tokens = max_tokens
         self._user_question = user_question
-        self._questions = questions
-        self._answers = answers
-        self._headers = {
-            "Authorization": f"Bearer {settings.AI_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        self._conversation_history: Deque[Message] = deque(maxlen=20)
-        self._faq_context: str | None = None
+        self._system_prompt = system_prompt
+        self._on_delta = on_delta
+        self._conversation_history: list[Message] = list(history or [])
         self._system_message: dict[str, str] | None = None
         self._data: dict[str, Any] | None = None
-        self._response: requests.Response | None = None
+        self._streamed_parts: list[str] = []
+        self.usage = UpstreamUsage()
+
+    @property
+    def partial_answer(self) -> str:
+        # O que já foi enviado ao cliente quando a chamada é interrompida
+        return "".join(self._streamed_parts)
 
-    def execute(self) -> tuple[str, int]:
+    async def execute(self) -> tuple[str, int]:
         try:
-            self._validate_parameters()
-            self._format_faq_context()
             self._conversation_history.append(
                 {"role": "user", "content": self._user_question}
             )
             self._initialize_system_message()
             self._initialize_data()
-            self._make_request_to_gemini()
-            self._validate_gemini_response()
+            if self._on_delta:
+                async with AdmissionController().slot(
+                    self._agent.id, self._priority
+                ) as waited:
+                    self.usage.queue_wait_seconds = waited
+                    started_at = time.perf_counter()
+                    await self._stream_from_gemini(self._on_delta)
+                    self.usage.upstream_seconds = time.perf_counter() - started_at
+            else:
+                # Perguntas idênticas em andamento compartilham a mesma chamada;
+                # só quem dispara a chamada (_request_completion) paga por ela
+                self.usage.coalesced = True
+                completion = await UpstreamSingleFlight().run(
+                    self._get_request_key(), self._request_completion
+                )
+                self._gemini_response_message: str = completion.answer
+                self._gemini_response_created = completion.created
             self._conversation_history.append(
                 {"role": "assistant", "content": self._gemini_response_message}
             )
+            self._estimate_missing_usage(self._gemini_response_message)
             return (self._gemini_response_message, self._gemini_response_created)
+        except asyncio.CancelledError:
+            # Fechar a resposta em andamento aborta a geração no provedor
+            self._estimate_missing_usage(self.partial_answer)
+            raise
+        except UpstreamUnavailableError:
+            raise
         except Exception as e:
             raise Exception(f"Erro ao consultar o Gemini: {e}")
 
-    def _validate_parameters(self) -> None:
-        if len(self._questions) != len(self._answers):
-            raise ValueError("A quantidade de perguntas e respostas estão divergentes!")
-
-    def _format_faq_context(self) -> None:
-        question_and_answers: list[str] = []
-        for c in range(len(self._questions)):
-            question = self._questions[c]
-            answer = self._answers[c]
-            question_and_answers.append(f"Pergunta: {question} | Resposta: {answer}")
-
-        self._faq_context = "\n".join(question_and_answers)
-
     def _initialize_system_message(self) -> None:
-        if not self._agent.behavior:
-            self._agent.behavior = (
-                "Responda de forma clara, útil e educada. Varie o estilo mantendo o sentido original. "
-                "Use uma linguagem acessível, mas mantenha profissionalismo."
-            )
-
-        self._system_message = {
-            "role": "system",
-            "content": (
-                f"Você é um assistente que responde apenas sobre o tema {self._agent.theme}, em pt-br, com base nas perguntas e respostas abaixo."
-                f"Se a pergunta não estiver presente ou relacionada ao conteúdo fornecido, diga que só pode responder perguntas sobre o tema {self._agent.theme}, mas se for algo relacionado ao tema pode responder com base no seu conhecimento sobre o tema."
-                "diga qual o tema e não fale sobre nada relacionado à pergunta do usuário e nesse caso pode ser uma resposta mais curta."
-                f"{self._agent.behavior} \n\n"
-                f"{self._faq_context}"
-            ),
-        }
+        self._system_message = {"role": "system", "content": self._system_prompt}
 
     def _initialize_data(self) -> None:
         global settings
@@ -90,27 +120,116 @@ class GeminiComunicationHandler:
             "temperature": self._agent.temperature,  # Variedade nas respostas
             "top_p": self._agent.top_p,  # Garante respostas variadas e criativas
             "n": 1,  # Uma resposta por vez
-            "stream": False,  # Resposta completa de uma vez
-            "max_tokens": 500,
+            "stream": self._on_delta is not None,  # Envia os tokens conforme chegam
+            "max_tokens": self._max_tokens,
         }
+        if self._on_delta is not None:
+            # Pede ao provedor o consumo de tokens no último evento do stream
+            self._data["stream_options"] = {"include_usage": True}
 
-    def _make_request_to_gemini(self) -> None:
-        self._response = requests.post(
-            settings.AI_API_URL,  # type: ignore[arg-type]
-            json=self._data,
-            headers=self._headers,
+    def _estimate_missing_usage(self, answer: str) -> None:
+        if self.usage.coalesced or self.usage.prompt_tokens is not None:
+            return
+        messages = (self._data or {}).get("messages") or []
+        self.usage.prompt_tokens = sum(
+            estimate_tokens(message["content"]) for message in messages
         )
+        self.usage.completion_tokens = estimate_tokens(answer)
+        self.usage.tokens_estimated = True
 
-    def _validate_gemini_response(self) -> None:
-        if not self._response:
-            raise RuntimeError("Erro ao comunicar com o agente")
-        if self._response.status_code == status.HTTP_200_OK:
-            result = self._response.json()
-            self._gemini_response_message: str = result["choices"][0]["message"][
-                "content"
-            ]
-            self._gemini_response_created = result["created"]
-        else:
-            raise RuntimeError(
-                f"Falha ao buscar dados da API. Código de Status: {self._response.status_code}"
-            )
+    def _get_request_key(self) -> str:
+        content = json.dumps(self._data, sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        return f"{self._agent.id}:{digest}"
+
+    async def _request_completion(self) -> Completion:
+        self.usage.coalesced = False
+        async with AdmissionController().slot(self._agent.id, self._priority) as waited:
+            self.usage.queue_wait_seconds = waited
+            started_at = time.perf_counter()
+            completion = await UpstreamRouter().call(self._request_completion_from)
+            self.usage.upstream_seconds = time.perf_counter() - started_at
+        self.usage.prompt_tokens = completion.prompt_tokens
+        self.usage.completion_tokens = completion.completion_tokens
+        return completion
+
+    async def _request_completion_from(self, endpoint: UpstreamEndpoint) -> Completion:
+        # Sem estado na instância: num hedge duas chamadas rodam ao mesmo tempo
+        response = await self._make_request_to_gemini(endpoint)
+        return self._validate_gemini_response(response)
+
+    async def _make_request_to_gemini(
+        self, endpoint: UpstreamEndpoint
+    ) -> httpx.Response:
+        return await AiHttpClient.get_client().post(
+            endpoint.url,
+            json=self._get_endpoint_data(endpoint),
+            headers=endpoint.headers,
+        )
+
+    def _validate_gemini_response(self, response: httpx.Response) -> Completion:
+        raise_for_upstream_status(response)
+        result = response.json()
+        usage = result.get("usage") or {}
+        return Completion(
+            answer=result["choices"][0]["message"]["content"],
+            created=result["created"],
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+
+    def _get_endpoint_data(self, endpoint: UpstreamEndpoint) -> dict[str, Any]:
+        return {**(self._data or {}), "model": endpoint.model}
+
+    async def _stream_from_gemini(self, on_delta: DeltaCallback) -> None:
+        # Só a abertura do stream passa pela política de retentativas: depois do
+        # primeiro trecho enviado ao cliente não dá para repetir sem duplicar texto
+        response = await UpstreamRouter().call(self._open_stream, self._close_stream)
+        parts = self._streamed_parts
+        created: int | None = None
+        try:
+            async for line in response.aiter_lines():
+                # Linhas de comentário (": keep-alive") e vazias separam os eventos SSE
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if created is None:
+                    created = chunk.get("created")
+                if chunk.get("usage"):
+                    self.usage.prompt_tokens = chunk["usage"].get("prompt_tokens")
+                    self.usage.completion_tokens = chunk["usage"].get(
+                        "completion_tokens"
+                    )
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    await on_delta(delta)
+        finally:
+            await response.aclose()
+        self._gemini_response_message = "".join(parts)
+        self._gemini_response_created = created or int(time.time())
+
+    async def _open_stream(self, endpoint: UpstreamEndpoint) -> httpx.Response:
+        client = AiHttpClient.get_client()
+        request = client.build_request(
+            "POST",
+            endpoint.url,
+            json=self._get_endpoint_data(endpoint),
+            headers=endpoint.headers,
+        )
+        response = await client.send(request, stream=True)
+        try:
+            raise_for_upstream_status(response)
+        except UpstreamError:
+            await response.aclose()
+            raise
+        return response
+
+    async def _close_stream(self, response: httpx.Response) -> None:
+        await response.aclose()
@@ -0,0 +1,35 @@
+from typing import Literal
+from src.ai.chat_resolution import ChatResolutionCache
+from src.ai.faq_retrieval import FaqIndexRegistry
+from src.ai.prompt_cache import SystemPromptCache
+
+# O que mudou; vai como texto na mensagem "ai_cache_changed" do broker
+AiCacheScope = Literal["agent", "knowledge_base", "chat"]
+
+
+class AiCacheInvalidator:
+    # Só os caches deste processo: as rotas chamam
+    # ConnectionManager().ai_cache_changed, que também avisa os outros workers
+    @staticmethod
+    def agent_changed(agent_id: int) -> None:
+        SystemPromptCache().invalidate_agent(agent_id)
+        ChatResolutionCache().invalidate_agent(agent_id)
+
+    @staticmethod
+    def knowledge_base_changed(knowledge_base_id: int) -> None:
+        FaqIndexRegistry.invalidate(knowledge_base_id)
+        SystemPromptCache().invalidate_knowledge_base(knowledge_base_id)
+        ChatResolutionCache().invalidate_knowledge_base(knowledge_base_id)
+
+    @staticmethod
+    def chat_changed(chat_id: int) -> None:
+        ChatResolutionCache().invalidate_chat(chat_id)
+
+    @staticmethod
+    def changed(scope: str, target_id: int) -> None:
+        if scope == "agent":
+            AiCacheInvalidator.agent_changed(target_id)
+        elif scope == "knowledge_base":
+            AiCacheInvalidator.knowledge_base_changed(target_id)
+        elif scope == "chat":
+            AiCacheInvalidator.chat_changed(target_id)
@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+from sqlalchemy import select
+from sqlalchemy.orm import Session, noload
+from src.database.models import Agent, Chat, KnowledgeBase
+from src.settings import Settings, singleton
+
+settings = Settings()
+
+
+@dataclass(frozen=True)
+class AgentSnapshot:
+    # Cópia imutável da configuração do agente: pode ser usada fora da sessão
+    # e compartilhada entre conexões
+    id: int
+    name: str
+    theme: str
+    behavior: str | None
+    temperature: float
+    top_p: float
+    faq_top_k: int | None
+    faq_token_budget: int | None
+    response_cache_enabled: bool
+    faq_short_circuit_enabled: bool
+
+    @classmethod
+    def from_agent(cls, agent: Agent) -> "AgentSnapshot":
+        return cls(
+            id=agent.id,
+            name=agent.name,
+            theme=agent.theme,
+            behavior=agent.behavior,
+            temperature=agent.temperature,
+            top_p=agent.top_p,
+            faq_top_k=agent.faq_top_k,
+            faq_token_budget=agent.faq_token_budget,
+            response_cache_enabled=agent.response_cache_enabled,
+            faq_short_circuit_enabled=agent.faq_short_circuit_enabled,
+        )
+
+
+@dataclass(frozen=True)
+class KnowledgeBaseHandle:
+    # Só id e versão: o conteúdo é lido do banco apenas quando o índice de FAQ
+    # dessa versão ainda não está em memória
+    id: int
+    version: str
+
+    def load_questions_and_answers(
+        self, session: Session
+    ) -> tuple[list[str], list[str]]:
+        knowledge_base = session.get(KnowledgeBase, self.id)
+        if not knowledge_base:
+            return [], []
+        return knowledge_base.get_questions_and_answers()
+
+
+@dataclass
+class ChatResolution:
+    chat_id: int
+    user_id: int
+    agent: AgentSnapshot
+    knowledge_base: KnowledgeBaseHandle | None
+    expires_at: float
+    valid: bool = True
+
+    def is_valid(self) -> bool:
+        return self.valid and time.monotonic() < self.expires_at
+
+    def belongs_to(self, user_id: int | None) -> bool:
+        # Só com NO_AUTH a conexão não tem usuário e qualquer chat é aceito
+        if user_id is None:
+            return settings.NO_AUTH
+        return self.user_id == user_id
+
+
+def resolve_chat(session: Session, chat_id: int) -> ChatResolution | None:
+    # Chat, agente e versão da base numa única consulta, sem carregar os
+    # usuários e grupos do agente
+    query = (
+        select(Chat.user_id, Agent, KnowledgeBase.id, KnowledgeBase.version)
+        .join(Agent, Agent.id == Chat.agent_id)
+        .outerjoin(KnowledgeBase, KnowledgeBase.id == Agent.knowledge_base_id)
+        .where(Chat.id == chat_id)
+        .options(noload(Agent.users), noload(Agent.groups))
+    )
+    row = session.execute(query).first()
+    if row is None:
+        return None
+    user_id, agent, knowledge_base_id, version = row
+    knowledge_base = None
+    if knowledge_base_id is not None:
+        if version is None:
+            # Bases antigas sem versão gravada: calcula a partir do conteúdo
+            legacy = session.get(KnowledgeBase, knowledge_base_id)
+            version = legacy.get_version() if legacy else None
+        if version is not None:
+            knowledge_base = KnowledgeBaseHandle(knowledge_base_id, version)
+    return ChatResolution(
+        chat_id=chat_id,
+        user_id=user_id,
+        agent=AgentSnapshot.from_agent(agent),
+        knowledge_base=knowledge_base,
+        expires_at=time.monotonic() + settings.AI_CHAT_RESOLUTION_TTL_SECONDS,
+    )
+
+
+@singleton
+class ChatResolutionCache:
+    # Resolução chat -> agente -> base compartilhada pelo processo. As
+    # alterações invalidam na hora, também nos outros workers pelo broker
+    # (ConnectionManager().ai_cache_changed); o TTL é só uma garantia extra
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._resolutions: OrderedDict[int, ChatResolution] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, chat_id: int) -> ChatResolution | None:
+        with self._lock:
+            resolution = self._resolutions.get(chat_id)
+            if resolution is None or not resolution.is_valid():
+                self.misses += 1
+                return None
+            self._resolutions.move_to_end(chat_id)
+            self.hits += 1
+            return resolution
+
+    def set(self, resolution: ChatResolution) -> None:
+        with self._lock:
+            self._resolutions[resolution.chat_id] = resolution
+            self._resolutions.move_to_end(resolution.chat_id)
+            while len(self._resolutions) > settings.AI_CHAT_RESOLUTION_CACHE_SIZE:
+                self._resolutions.popitem(last=False)
+
+    def invalidate_chat(self, chat_id: int) -> None:
+        self._invalidate(lambda resolution: resolution.chat_id == chat_id)
+
+    def invalidate_agent(self, agent_id: int) -> None:
+        self._invalidate(lambda resolution: resolution.agent.id == agent_id)
+
+    def invalidate_knowledge_base(self, knowledge_base_id: int) -> None:
+        self._invalidate(
+            lambda resolution: resolution.knowledge_base is not None
+            and resolution.knowledge_base.id == knowledge_base_id
+        )
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._resolutions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+    def _invalidate(self, matches: Callable[[ChatResolution], bool]) -> None:
+        with self._lock:
+            for chat_id, resolution in list(self._resolutions.items()):
+                if matches(resolution):
+                    # As conexões que guardam a mesma resolução também a descartam
+                    resolution.valid = False
+                    del self._resolutions[chat_id]
+                    self.invalidations += 1
+
+
+def get_chat_resolution(
+    session: Session, chat_id: int, resolutions: dict[int, ChatResolution]
+) -> ChatResolution | None:
+    # Procura na conexão, depois no processo e só então no banco
+    resolution = resolutions.get(chat_id)
+    if resolution is None or not resolution.is_valid():
+        resolution = ChatResolutionCache().get(chat_id)
+        if resolution is None:
+            resolution = resolve_chat(session, chat_id)
+            if resolution:
+                ChatResolutionCache().set(resolution)
+    if resolution:
+        resolutions[chat_id] = resolution
+    else:
+        resolutions.pop(chat_id, None)
+    return resolution
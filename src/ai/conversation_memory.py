@@ -0,0 +1,111 @@
+from collections import deque
+from typing import Deque
+from src.ai.ai_service import Message
+from src.ai.text_normalization import estimate_tokens
+from src.database.models import ChatHistory
+
+# Custo fixo aproximado de cada mensagem no formato de chat (papel, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Mensagem guardada com o id da linha em ChatHistory (None enquanto não gravada)
+MemoryEntry = tuple[int | None, Message]
+
+
+def count_message_tokens(message: Message) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def trim_to_token_budget(messages: list[Message], token_budget: int) -> list[Message]:
+    trimmed: list[Message] = []
+    used_tokens = 0
+    for message in reversed(messages):
+        message_tokens = count_message_tokens(message)
+        if used_tokens + message_tokens > token_budget:
+            break
+        used_tokens += message_tokens
+        trimmed.append(message)
+    trimmed.reverse()
+    return trimmed
+
+
+def build_summary_message(summary: str) -> Message:
+    return {"role": "system", "content": f"Resumo da conversa até aqui: {summary}"}
+
+
+class ConversationMemory:
+    # Cauda da conversa mantida por conexão: o histórico é lido do banco só na
+    # primeira mensagem de cada chat e depois acompanha os novos turnos em memória.
+    # Quando o chat tem resumo, só as mensagens posteriores a ele ficam aqui.
+    def __init__(self, token_budget: int) -> None:
+        self._token_budget = token_budget
+        self._chats: dict[int, Deque[MemoryEntry]] = {}
+        self._chat_tokens: dict[int, int] = {}
+        self._summaries: dict[int, str] = {}
+
+    def is_loaded(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def load(
+        self, chat_id: int, history: list[ChatHistory], summary: str | None = None
+    ) -> None:
+        self._chats[chat_id] = deque()
+        self._chat_tokens[chat_id] = 0
+        if summary:
+            self._summaries[chat_id] = summary
+        for chat_history in history:
+            self.append(
+                chat_id,
+                {
+                    "role": "user" if chat_history.is_user_message else "assistant",
+                    "content": chat_history.message,
+                },
+                chat_history.id,
+            )
+
+    def append(
+        self, chat_id: int, message: Message, message_id: int | None = None
+    ) -> None:
+        entries = self._chats.setdefault(chat_id, deque())
+        entries.append((message_id, message))
+        self._chat_tokens[chat_id] = self._chat_tokens.get(
+            chat_id, 0
+        ) + count_message_tokens(message)
+        while self._chat_tokens[chat_id] > self._token_budget and len(entries) > 1:
+            _, dropped = entries.popleft()
+            self._chat_tokens[chat_id] -= count_message_tokens(dropped)
+
+    def get_messages(self, chat_id: int) -> list[Message]:
+        messages = [message for _, message in self._chats.get(chat_id, ())]
+        summary = self._summaries.get(chat_id)
+        if not summary:
+            return trim_to_token_budget(messages, self._token_budget)
+        summary_message = build_summary_message(summary)
+        tail_budget = self._token_budget - count_message_tokens(summary_message)
+        return [summary_message] + trim_to_token_budget(messages, tail_budget)
+
+    def get_unsummarized_tokens(self, chat_id: int) -> int:
+        return self._chat_tokens.get(chat_id, 0)
+
+    def get_summary_cut(self, chat_id: int, keep_tokens: int) -> int | None:
+        # Id da mensagem mais nova que pode ir para o resumo, preservando uma
+        # cauda recente de pelo menos `keep_tokens` tokens
+        kept_tokens = 0
+        for message_id, message in reversed(self._chats.get(chat_id, ())):
+            if kept_tokens >= keep_tokens and message_id is not None:
+                return message_id
+            kept_tokens += count_message_tokens(message)
+        return None
+
+    def apply_summary(self, chat_id: int, summary: str, last_message_id: int) -> None:
+        self._summaries[chat_id] = summary
+        entries = self._chats.get(chat_id)
+        if entries is None:
+            return
+        while entries and (entries[0][0] or 0) <= last_message_id:
+            _, dropped = entries.popleft()
+            self._chat_tokens[chat_id] -= count_message_tokens(dropped)
+
+    def forget(self, chat_id: int) -> None:
+        self._chats.pop(chat_id, None)
+        self._chat_tokens.pop(chat_id, None)
+        self._summaries.pop(chat_id, None)
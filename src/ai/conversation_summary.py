@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from src.ai.admission import Priority
+from src.ai.ai_service import GeminiComunicationHandler
+from src.ai.chat_resolution import AgentSnapshot
+from src.ai.conversation_memory import ConversationMemory
+from src.ai.usage_tracker import TurnUsage, to_milliseconds, usage_writer
+from sqlalchemy.orm import Session
+from src.database.get_db import run_in_session
+from src.database.models import Agent, Chat, ChatHistory, ChatSummary
+from src.settings import Settings
+
+settings = Settings()
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Você resume conversas entre um usuário e um agente de atendimento. "
+    "Escreva um resumo curto, em português, que preserve fatos, pedidos, "
+    "decisões e pendências da conversa. Não invente informações."
+)
+
+
+def build_summary_request(previous_summary: str | None, rows: list[ChatHistory]) -> str:
+    transcript = "\n".join(
+        f"{'Usuário' if row.is_user_message else 'Agente'}: {row.message}"
+        for row in rows
+    )
+    return (
+        f"Resumo anterior:\n{previous_summary or '(nenhum)'}\n\n"
+        f"Novas mensagens:\n{transcript}\n\n"
+        "Atualize o resumo incorporando as novas mensagens."
+    )
+
+
+class ConversationSummarizer:
+    # Dispara, em segundo plano, a compactação dos turnos antigos de um chat
+    # quando a parte ainda não resumida passa do limite de tokens
+    _running: set[int] = set()
+    _tasks: set["asyncio.Task[None]"] = set()
+
+    @classmethod
+    def schedule(cls, chat_id: int, agent_id: int, memory: ConversationMemory) -> None:
+        trigger_tokens = settings.AI_SUMMARY_TRIGGER_TOKENS
+        if trigger_tokens <= 0 or chat_id in cls._running:
+            return
+        if memory.get_unsummarized_tokens(chat_id) <= trigger_tokens:
+            return
+        cut_message_id = memory.get_summary_cut(
+            chat_id, settings.AI_SUMMARY_KEEP_TOKENS
+        )
+        if cut_message_id is None:
+            return
+        cls._running.add(chat_id)
+        task = asyncio.create_task(
+            ChatSummaryUpdater(chat_id, agent_id, memory, cut_message_id).execute()
+        )
+        cls._tasks.add(task)
+
+        def finish(done: "asyncio.Task[None]") -> None:
+            cls._tasks.discard(done)
+            cls._running.discard(chat_id)
+
+        task.add_done_callback(finish)
+
+
+class ChatSummaryUpdater:
+    def __init__(
+        self,
+        chat_id: int,
+        agent_id: int,
+        memory: ConversationMemory,
+        cut_message_id: int,
+    ) -> None:
+        self._chat_id = chat_id
+        self._agent_id = agent_id
+        self._memory = memory
+        self._cut_message_id = cut_message_id
+        self._agent: AgentSnapshot | None = None
+        self._user_id: int | None = None
+        self._knowledge_base_id: int | None = None
+        self._summary: str | None = None
+        self._last_message_id: int | None = None
+
+    async def execute(self) -> None:
+        try:
+            await run_in_session(self._load_summary)
+            # Resume em lotes, do mais antigo para o mais novo, até o corte
+            while True:
+                rows = await run_in_session(self._load_rows)
+                if not rows or not self._agent:
+                    break
+                self._summary = await self._summarize(self._agent, rows)
+                self._last_message_id = rows[-1].id
+                await run_in_session(self._save_summary)
+            if self._summary and self._last_message_id is not None:
+                self._memory.apply_summary(
+                    self._chat_id, self._summary, self._last_message_id
+                )
+        except Exception as e:
+            logger.warning(f"Falha ao resumir o chat {self._chat_id}: {e}")
+
+    # As sessões são curtas para não segurar conexão do pool durante a chamada
+    # ao provedor
+    def _load_summary(self, session: Session) -> None:
+        agent = session.get(Agent, self._agent_id)
+        self._agent = AgentSnapshot.from_agent(agent) if agent else None
+        self._knowledge_base_id = agent.knowledge_base_id if agent else None
+        chat = session.get(Chat, self._chat_id)
+        self._user_id = chat.user_id if chat else None
+        chat_summary = ChatSummary.get_by_chat_id(session, self._chat_id)
+        if chat_summary:
+            self._summary = chat_summary.summary
+            self._last_message_id = chat_summary.last_message_id
+
+    def _load_rows(self, session: Session) -> list[ChatHistory]:
+        return ChatHistory.get_history_range(
+            session,
+            self._chat_id,
+            self._last_message_id,
+            self._cut_message_id,
+            settings.AI_SUMMARY_BATCH_MESSAGES,
+        )
+
+    async def _summarize(self, agent: AgentSnapshot, rows: list[ChatHistory]) -> str:
+        started_at = time.perf_counter()
+        handler = GeminiComunicationHandler(
+            agent,
+            build_summary_request(self._summary, rows),
+            SUMMARY_SYSTEM_PROMPT,
+            priority=Priority.BACKGROUND,
+            max_tokens=settings.AI_SUMMARY_MAX_TOKENS,
+        )
+        summary, _ = await handler.execute()
+        self._record_usage(handler, started_at)
+        return summary.strip()
+
+    def _record_usage(
+        self, handler: GeminiComunicationHandler, started_at: float
+    ) -> None:
+        # O resumo também consome tokens do provedor: entra no consumo do chat
+        # com a origem "summary", fora da contagem de turnos
+        if self._user_id is None:
+            return
+        usage = handler.usage
+        usage_writer.add(
+            TurnUsage(
+                chat_id=self._chat_id,
+                user_id=self._user_id,
+                agent_id=self._agent_id,
+                knowledge_base_id=self._knowledge_base_id,
+                source="summary",
+                streamed=False,
+                prompt_tokens=usage.prompt_tokens or 0,
+                completion_tokens=usage.completion_tokens or 0,
+                tokens_estimated=usage.tokens_estimated,
+                upstream_ms=to_milliseconds(usage.upstream_seconds),
+                queue_wait_ms=to_milliseconds(usage.queue_wait_seconds),
+                total_ms=round((time.perf_counter() - started_at) * 1000),
+                created_at=datetime.now(),
+            )
+        )
+
+    def _save_summary(self, session: Session) -> None:
+        if self._summary and self._last_message_id is not None:
+            ChatSummary.save(
+                session, self._chat_id, self._summary, self._last_message_id
+            )
@@ -0,0 +1,110 @@
+import threading
+import numpy as np
+import numpy.typing as npt
+from typing import Callable, Protocol
+from src.ai.text_normalization import normalize_text
+from src.settings import Settings
+
+settings = Settings()
+
+Matrix = npt.NDArray[np.float32]
+
+_FNV_PRIME = np.uint64(1099511628211)
+_MIX_MULTIPLIER = np.uint64(0xFF51AFD7ED558CCD)
+
+
+class EmbeddingBackend(Protocol):
+    dimension: int
+
+    def embed(self, texts: list[str]) -> Matrix: ...
+
+
+class HashedNgramEmbedding:
+    # Embedding local e offline: cada n-grama de caracteres do texto normalizado é
+    # espalhado em `dimension` posições por hash (com sinal, para que as colisões
+    # se cancelem em média). Textos com grafias próximas ficam com vetores próximos.
+    def __init__(
+        self,
+        dimension: int = 256,
+        ngram_sizes: tuple[int, ...] = (3, 4),
+        batch_size: int = 4096,
+    ) -> None:
+        self.dimension = dimension
+        self._ngram_sizes = ngram_sizes
+        self._batch_size = batch_size
+
+    def embed(self, texts: list[str]) -> Matrix:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), self._batch_size):
+            batch = texts[start : start + self._batch_size]
+            matrix[start : start + len(batch)] = self._embed_batch(batch)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        matrix /= norms
+        return np.ascontiguousarray(matrix)
+
+    def _embed_batch(self, texts: list[str]) -> Matrix:
+        # normalize_text só devolve ASCII, então cada caractere é um byte
+        padded = [f" {normalize_text(text)} " for text in texts]
+        lengths = np.fromiter((len(p) for p in padded), dtype=np.int64)
+        data = np.frombuffer("".join(padded).encode("ascii"), dtype=np.uint8)
+        data = data.astype(np.uint64)
+        row_of_position = np.repeat(np.arange(len(texts)), lengths)
+        counts = np.zeros(len(texts) * self.dimension, dtype=np.float64)
+
+        for size in self._ngram_sizes:
+            total = len(data) - size + 1
+            if total <= 0:
+                continue
+            hashes = np.zeros(total, dtype=np.uint64)
+            for offset in range(size):
+                hashes = (hashes * _FNV_PRIME) ^ data[offset : offset + total]
+            hashes = self._mix(hashes)
+            # Descarta n-gramas que atravessam a fronteira entre dois textos
+            rows = row_of_position[:total]
+            inside = rows == row_of_position[size - 1 : size - 1 + total]
+            hashes, rows = hashes[inside], rows[inside]
+            columns = (hashes % np.uint64(self.dimension)).astype(np.int64)
+            signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+            counts += np.bincount(
+                rows * self.dimension + columns,
+                weights=signs,
+                minlength=len(counts),
+            )
+
+        return counts.reshape(len(texts), self.dimension).astype(np.float32)
+
+    @staticmethod
+    def _mix(hashes: npt.NDArray[np.uint64]) -> npt.NDArray[np.uint64]:
+        hashes = hashes ^ (hashes >> np.uint64(33))
+        hashes = hashes * _MIX_MULTIPLIER
+        return hashes ^ (hashes >> np.uint64(33))
+
+
+EMBEDDING_BACKENDS: dict[str, Callable[[], EmbeddingBackend]] = {
+    "hashed-ngram": lambda: HashedNgramEmbedding(
+        dimension=settings.AI_EMBEDDING_DIMENSION
+    ),
+}
+
+
+class EmbeddingBackendProvider:
+    _lock = threading.Lock()
+    _backend: EmbeddingBackend | None = None
+
+    @classmethod
+    def get_backend(cls) -> EmbeddingBackend:
+        with cls._lock:
+            if cls._backend is None:
+                factory = EMBEDDING_BACKENDS.get(settings.AI_EMBEDDING_BACKEND)
+                if factory is None:
+                    raise ValueError(
+                        f"Backend de embeddings desconhecido: {settings.AI_EMBEDDING_BACKEND}"
+                    )
+                cls._backend = factory()
+            return cls._backend
+
+    @classmethod
+    def set_backend(cls, backend: EmbeddingBackend) -> None:
+        with cls._lock:
+            cls._backend = backend
@@ -0,0 +1,227 @@
+import heapq
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable
+import numpy as np
+import numpy.typing as npt
+from src.ai.embeddings import EmbeddingBackendProvider
+from src.ai.text_normalization import (
+    estimate_tokens,
+    get_meaning_markers,
+    stem,
+    tokenize,
+)
+from src.ai.vector_index import VectorIndex
+from src.settings import Settings
+
+settings = Settings()
+
+IntArray = npt.NDArray[np.int32]
+FloatArray = npt.NDArray[np.float64]
+
+
+def format_faq_pair(question: str, answer: str) -> str:
+    return f"Pergunta: {question} | Resposta: {answer}"
+
+
+class LexicalIndex:
+    # BM25 com o peso de cada par termo/documento calculado na montagem: uma
+    # busca só soma vetores numpy, sem percorrer as postings em Python
+    def __init__(
+        self,
+        questions: list[str],
+        answers: list[str],
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        self._k1 = k1
+        self._b = b
+        self.questions = questions
+        self.answers = answers
+        self._postings: dict[str, tuple[IntArray, FloatArray]] = {}
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def _build(self) -> None:
+        raw_postings: dict[str, tuple[list[int], list[int]]] = {}
+        doc_lengths: list[int] = []
+        for doc_id, (question, answer) in enumerate(zip(self.questions, self.answers)):
+            # A pergunta é contada duas vezes para pesar mais que a resposta
+            terms = stem(tokenize(question)) * 2 + stem(tokenize(answer))
+            doc_lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                doc_ids, frequencies = raw_postings.setdefault(term, ([], []))
+                doc_ids.append(doc_id)
+                frequencies.append(frequency)
+
+        total_docs = len(doc_lengths)
+        lengths = np.asarray(doc_lengths, dtype=np.float64)
+        average_length = float(lengths.mean()) if total_docs else 0.0
+        length_norm = 1 - self._b + self._b * (lengths / (average_length or 1))
+        for term, (doc_ids, frequencies) in raw_postings.items():
+            doc_frequency = len(doc_ids)
+            idf = math.log(
+                1 + (total_docs - doc_frequency + 0.5) / (doc_frequency + 0.5)
+            )
+            ids = np.asarray(doc_ids, dtype=np.int32)
+            tf = np.asarray(frequencies, dtype=np.float64)
+            weights = idf * tf * (self._k1 + 1) / (tf + self._k1 * length_norm[ids])
+            self._postings[term] = (ids, weights)
+
+    def search(self, query: str, top_k: int) -> list[tuple[int, float]]:
+        if top_k <= 0 or not self.questions:
+            return []
+        scores = np.zeros(len(self.questions), dtype=np.float64)
+        for term in set(stem(tokenize(query))):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            doc_ids, weights = postings
+            # Cada documento aparece uma vez por termo: a soma indexada é segura
+            scores[doc_ids] += weights
+        candidates = np.flatnonzero(scores)
+        if candidates.size > top_k:
+            # Mantém os empatados com o k-ésimo para desempatar pelo menor id
+            candidate_scores = scores[candidates]
+            kth = candidates.size - top_k
+            threshold = np.partition(candidate_scores, kth)[kth]
+            candidates = candidates[candidate_scores >= threshold]
+        order = np.lexsort((candidates, -scores[candidates]))[:top_k]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in candidates[order]]
+
+
+class FaqIndex:
+    # Os candidatos das duas buscas são combinados por reciprocal rank fusion
+    RRF_K = 60
+    CANDIDATES_PER_RESULT = 4
+
+    def __init__(self, questions: list[str], answers: list[str], mode: str) -> None:
+        self.questions = questions
+        self.answers = answers
+        self._mode = mode
+        self._formatted_pairs = [
+            format_faq_pair(question, answer)
+            for question, answer in zip(questions, answers)
+        ]
+        self._pair_tokens = [estimate_tokens(pair) for pair in self._formatted_pairs]
+        self._full_context: str | None = None
+        self._vectors_lock = threading.Lock()
+        self.lexical: LexicalIndex | None = None
+        self.vectors: VectorIndex | None = None
+        if mode in ("lexical", "hybrid"):
+            self.lexical = LexicalIndex(questions, answers)
+        if mode in ("semantic", "hybrid"):
+            # Só as perguntas são vetorizadas: o usuário pergunta com as mesmas
+            # palavras que a base, não com as da resposta
+            self.vectors = VectorIndex(
+                EmbeddingBackendProvider.get_backend(), questions
+            )
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def search(self, query: str, top_k: int) -> list[int]:
+        if self._mode == "lexical" and self.lexical:
+            return [doc_id for doc_id, _ in self.lexical.search(query, top_k)]
+        if self._mode == "semantic" and self.vectors:
+            return [doc_id for doc_id, _ in self.vectors.search(query, top_k)]
+
+        candidates = top_k * self.CANDIDATES_PER_RESULT
+        fused: dict[int, float] = {}
+        for ranking in (
+            self.lexical.search(query, candidates) if self.lexical else [],
+            self.vectors.search(query, candidates) if self.vectors else [],
+        ):
+            for rank, (doc_id, _) in enumerate(ranking):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (self.RRF_K + rank + 1)
+        return [
+            doc_id
+            for doc_id, _ in heapq.nlargest(
+                top_k, fused.items(), key=lambda item: item[1]
+            )
+        ]
+
+    def ensure_vectors(self) -> None:
+        # O atalho compara só com as perguntas, por isso usa o índice vetorial
+        # mesmo quando a busca de contexto é apenas léxica. Montar o índice de
+        # uma base grande leva segundos: deve rodar na thread de banco, nunca no
+        # event loop; o lock evita que duas conexões montem o mesmo índice
+        if self.vectors is not None:
+            return
+        with self._vectors_lock:
+            if self.vectors is None:
+                self.vectors = VectorIndex(
+                    EmbeddingBackendProvider.get_backend(), self.questions
+                )
+
+    def match_question(self, query: str) -> tuple[int, float] | None:
+        # Sem o índice vetorial (ensure_vectors não foi chamado) não há atalho
+        if self.vectors is None:
+            return None
+        matches = self.vectors.search(query, 1)
+        if not matches:
+            return None
+        # "Como NÃO cancelar meu pedido?" fica quase idêntica a "Como cancelar
+        # meu pedido?" na similaridade; com negação ou números diferentes a
+        # resposta pronta não serve
+        doc_id, _ = matches[0]
+        if get_meaning_markers(query) != get_meaning_markers(self.questions[doc_id]):
+            return None
+        return matches[0]
+
+    @property
+    def full_context(self) -> str:
+        if self._full_context is None:
+            self._full_context = "\n".join(self._formatted_pairs)
+        return self._full_context
+
+    def select_context(self, query: str, top_k: int, token_budget: int) -> str:
+        selected: list[str] = []
+        used_tokens = 0
+        for doc_id in self.search(query, top_k):
+            pair_tokens = self._pair_tokens[doc_id]
+            # Um par grande que não cabe não impede os menores logo abaixo
+            if used_tokens + pair_tokens > token_budget:
+                continue
+            used_tokens += pair_tokens
+            selected.append(self._formatted_pairs[doc_id])
+        return "\n".join(selected)
+
+
+class FaqIndexRegistry:
+    _lock = threading.Lock()
+    _indexes: OrderedDict[tuple[int, str], FaqIndex] = OrderedDict()
+
+    @classmethod
+    def get_index(
+        cls,
+        knowledge_base_id: int,
+        version: str,
+        load_questions_and_answers: Callable[[], tuple[list[str], list[str]]],
+    ) -> FaqIndex:
+        key = (knowledge_base_id, version)
+        with cls._lock:
+            index = cls._indexes.get(key)
+            if index is not None:
+                cls._indexes.move_to_end(key)
+                return index
+
+        questions, answers = load_questions_and_answers()
+        index = FaqIndex(questions, answers, settings.AI_FAQ_RETRIEVAL_MODE)
+        with cls._lock:
+            # Versões antigas da mesma base não serão mais consultadas
+            for stale_key in [k for k in cls._indexes if k[0] == knowledge_base_id]:
+                del cls._indexes[stale_key]
+            cls._indexes[key] = index
+            while len(cls._indexes) > settings.AI_FAQ_INDEX_CACHE_SIZE:
+                cls._indexes.popitem(last=False)
+        return index
+
+    @classmethod
+    def invalidate(cls, knowledge_base_id: int) -> None:
+        with cls._lock:
+            for key in [k for k in cls._indexes if k[0] == knowledge_base_id]:
+                del cls._indexes[key]
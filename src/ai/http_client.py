@@ -0,0 +1,34 @@
+import httpx
+from src.settings import Settings
+
+settings = Settings()
+
+
+class AiHttpClient:
+    _client: httpx.AsyncClient | None = None
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        # Um único pool por processo: as conexões com o provedor ficam em keep-alive
+        # e são reaproveitadas entre os turnos de todos os chats
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    connect=settings.AI_HTTP_CONNECT_TIMEOUT,
+                    read=settings.AI_HTTP_READ_TIMEOUT,
+                    write=settings.AI_HTTP_WRITE_TIMEOUT,
+                    pool=settings.AI_HTTP_POOL_TIMEOUT,
+                ),
+            )
+        return cls._client
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from src.ai.faq_retrieval import FaqIndex
+from src.ai.chat_resolution import AgentSnapshot
+from src.settings import Settings, singleton
+
+settings = Settings()
+
+DEFAULT_BEHAVIOR = (
+    "Responda de forma clara, útil e educada. Varie o estilo mantendo o sentido original. "
+    "Use uma linguagem acessível, mas mantenha profissionalismo."
+)
+
+
+def build_system_prompt_header(theme: str, behavior: str | None) -> str:
+    return (
+        f"Você é um assistente que responde apenas sobre o tema {theme}, em pt-br, com base nas perguntas e respostas abaixo."
+        f"Se a pergunta não estiver presente ou relacionada ao conteúdo fornecido, diga que só pode responder perguntas sobre o tema {theme}, mas se for algo relacionado ao tema pode responder com base no seu conhecimento sobre o tema."
+        "diga qual o tema e não fale sobre nada relacionado à pergunta do usuário e nesse caso pode ser uma resposta mais curta."
+        f"{behavior or DEFAULT_BEHAVIOR} \n\n"
+    )
+
+
+@dataclass
+class CompiledSystemPrompt:
+    knowledge_base_id: int
+    theme: str
+    behavior: str | None
+    header: str
+    full_prompt: str | None = None
+
+
+@singleton
+class SystemPromptCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._prompts: OrderedDict[tuple[int, str], CompiledSystemPrompt] = (
+            OrderedDict()
+        )
+
+    def get_header(
+        self, agent: AgentSnapshot, knowledge_base_id: int, knowledge_base_version: str
+    ) -> str:
+        return self._get(agent, knowledge_base_id, knowledge_base_version).header
+
+    def get_full_prompt(
+        self,
+        agent: AgentSnapshot,
+        knowledge_base_id: int,
+        knowledge_base_version: str,
+        faq_index: FaqIndex,
+    ) -> str:
+        compiled = self._get(agent, knowledge_base_id, knowledge_base_version)
+        if compiled.full_prompt is None:
+            compiled.full_prompt = compiled.header + faq_index.full_context
+        return compiled.full_prompt
+
+    def invalidate_agent(self, agent_id: int) -> None:
+        with self._lock:
+            for key in [key for key in self._prompts if key[0] == agent_id]:
+                del self._prompts[key]
+
+    def invalidate_knowledge_base(self, knowledge_base_id: int) -> None:
+        with self._lock:
+            for key, compiled in list(self._prompts.items()):
+                if compiled.knowledge_base_id == knowledge_base_id:
+                    del self._prompts[key]
+
+    def _get(
+        self, agent: AgentSnapshot, knowledge_base_id: int, knowledge_base_version: str
+    ) -> CompiledSystemPrompt:
+        key = (agent.id, knowledge_base_version)
+        with self._lock:
+            compiled = self._prompts.get(key)
+            if compiled is not None:
+                self._prompts.move_to_end(key)
+        # Outro worker pode ter alterado o agente sem invalidar este processo
+        if (
+            compiled is None
+            or compiled.theme != agent.theme
+            or compiled.behavior != agent.behavior
+        ):
+            compiled = CompiledSystemPrompt(
+                knowledge_base_id=knowledge_base_id,
+                theme=agent.theme,
+                behavior=agent.behavior,
+                header=build_system_prompt_header(agent.theme, agent.behavior),
+            )
+            with self._lock:
+                # Versões antigas da base deste agente não serão mais usadas (a
+                # base pode ter mudado em outro worker, sem invalidar este)
+                for stale_key in [k for k in self._prompts if k[0] == agent.id]:
+                    del self._prompts[stale_key]
+                self._prompts[key] = compiled
+                while len(self._prompts) > settings.AI_PROMPT_CACHE_SIZE:
+                    self._prompts.popitem(last=False)
+        return compiled
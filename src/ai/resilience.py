@@ -0,0 +1,156 @@
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import httpx
+from fastapi import status
+
+# Códigos que indicam sobrecarga ou falha temporária do provedor
+RETRYABLE_STATUS_CODES = frozenset(
+    {
+        status.HTTP_408_REQUEST_TIMEOUT,
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+        status.HTTP_502_BAD_GATEWAY,
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        status.HTTP_504_GATEWAY_TIMEOUT,
+    }
+)
+
+
+class UpstreamError(Exception):
+    def __init__(
+        self,
+        message: str,
+        status_code: int | None = None,
+        retry_after: float | None = None,
+        retryable: bool = True,
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+class UpstreamUnavailableError(Exception):
+    pass
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def raise_for_upstream_status(response: httpx.Response) -> None:
+    if response.status_code == status.HTTP_200_OK:
+        return
+    raise UpstreamError(
+        f"Falha ao buscar dados da API. Código de Status: {response.status_code}",
+        status_code=response.status_code,
+        retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        retryable=response.status_code in RETRYABLE_STATUS_CODES,
+    )
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        attempt_timeout: float,
+    ) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempt_timeout = attempt_timeout
+
+    def get_delay(self, attempt: int, retry_after: float | None = None) -> float | None:
+        # Backoff exponencial com jitter completo; o Retry-After do provedor tem
+        # prioridade, mas se pedir mais do que o teto é melhor desistir logo
+        if retry_after is not None:
+            return retry_after if retry_after <= self.backoff_max else None
+        ceiling = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float) -> None:
+        self._failure_threshold = max(1, failure_threshold)
+        self._recovery_seconds = recovery_seconds
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self._recovery_seconds
+        ):
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        # Meio aberto: só uma requisição de teste por vez decide se o circuito fecha
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def is_available(self) -> bool:
+        state = self.state
+        return state == self.CLOSED or (
+            state == self.HALF_OPEN and not self._probe_in_flight
+        )
+
+    def record_success(self) -> None:
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if (
+            self._state == self.HALF_OPEN
+            or self.consecutive_failures >= self._failure_threshold
+        ):
+            if self._state != self.OPEN:
+                self.times_opened += 1
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        # Requisição abandonada (ex.: perdedora de um hedge) não conta como falha
+        self._probe_in_flight = False
+
+    def stats(self) -> dict[str, str | int]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
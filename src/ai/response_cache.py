@@ -0,0 +1,105 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable
+from src.ai.text_normalization import normalize_text
+from src.ai.chat_resolution import AgentSnapshot
+from src.settings import Settings, singleton
+
+settings = Settings()
+
+ResponseCacheKey = tuple[Hashable, ...]
+
+
+@dataclass
+class CachedResponse:
+    answer: str
+    created: int
+    expires_at: float
+    size: int
+
+
+def build_response_cache_key(
+    agent: AgentSnapshot, knowledge_base_version: str, question: str
+) -> ResponseCacheKey:
+    return (
+        agent.id,
+        agent.theme,
+        agent.behavior,
+        agent.temperature,
+        agent.top_p,
+        knowledge_base_version,
+        normalize_text(question),
+    )
+
+
+@singleton
+class ResponseCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[ResponseCacheKey, CachedResponse] = OrderedDict()
+        self._max_entries = settings.AI_RESPONSE_CACHE_MAX_ENTRIES
+        self._max_bytes = settings.AI_RESPONSE_CACHE_MAX_BYTES
+        self._ttl = settings.AI_RESPONSE_CACHE_TTL_SECONDS
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: ResponseCacheKey) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: ResponseCacheKey, answer: str, created: int) -> None:
+        size = sys.getsizeof(answer) + sum(sys.getsizeof(part) for part in key)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedResponse(
+                answer=answer,
+                created=created,
+                expires_at=time.monotonic() + self._ttl,
+                size=size,
+            )
+            self._bytes += size
+            while (
+                len(self._entries) > self._max_entries or self._bytes > self._max_bytes
+            ):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key: ResponseCacheKey) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
@@ -0,0 +1,67 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from src.settings import singleton
+
+
+@dataclass(frozen=True)
+class Completion:
+    # Compartilhada entre todos os interessados de uma mesma chamada
+    answer: str
+    created: int
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+@singleton
+class UpstreamSingleFlight:
+    # Requisições idênticas em andamento compartilham uma única chamada ao provedor.
+    # A chamada roda em uma task própria e cada interessado aguarda uma cópia
+    # protegida (shield), então o cancelamento de um não derruba os demais. Quando
+    # o último interessado desiste, a chamada é cancelada e o provedor para de gerar.
+    def __init__(self) -> None:
+        self._in_flight: dict[str, asyncio.Task[Completion]] = {}
+        self._waiters: dict[asyncio.Task[Completion], int] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def run(
+        self, key: str, request: Callable[[], Awaitable[Completion]]
+    ) -> Completion:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(request())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._release(task)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+    def _release(self, task: asyncio.Task[Completion]) -> None:
+        waiters = self._waiters.pop(task, 1) - 1
+        if waiters > 0:
+            self._waiters[task] = waiters
+        elif not task.done():
+            task.cancel()
+            self.abandoned += 1
+
+    def _finish(self, key: str, task: asyncio.Task[Completion]) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Evita o aviso de exceção não lida quando todos os interessados desistiram
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,68 @@
+import re
+import unicodedata
+
+# Palavras muito frequentes em pt-br que não ajudam a diferenciar perguntas.
+# Já estão sem acento porque são comparadas com o texto normalizado.
+STOP_WORDS = frozenset(
+    """
+    a ao aos as ate com como da das de dela dele deles do dos e ela elas ele eles em
+    entre era essa esse esta estao este eu foi for ha isso isto ja la lhe mais mas me
+    mesmo meu minha muito na nao nas nem no nos nossa nosso num numa o os ou para
+    pela pelas pelo pelos por qual quando que quem se sem ser seu seus sua suas so
+    sao tambem te tem tenho ter um uma umas uns voce voces vc vcs pra pro
+    """.split()
+)
+
+# Mudam o sentido da pergunta, mas quase não pesam na similaridade ("não" é
+# até stop word): perguntas que diferem nelas não são a mesma pergunta
+NEGATION_WORDS = frozenset(
+    "nao nem nunca jamais sem nenhum nenhuma ninguem nada".split()
+)
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_WORD_JOINERS = re.compile(r"(?<=[a-z0-9])[-'](?=[a-z0-9])")
+
+# Truncar os termos aproxima um stemmer leve: "acesso", "acessar" e "acessos"
+# caem no mesmo termo
+STEM_LENGTH = 5
+
+# Aproximação usada para orçamento de prompt: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+
+def fold_accents(text: str) -> str:
+    if text.isascii():
+        return text
+    # NFKD separa a letra do acento; o encode descarta o que não é ASCII
+    decomposed = unicodedata.normalize("NFKD", text)
+    return decomposed.encode("ascii", "ignore").decode("ascii")
+
+
+def normalize_text(text: str) -> str:
+    folded = _WORD_JOINERS.sub("", fold_accents(text).lower())
+    return _NON_WORD.sub(" ", folded).strip()
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        term
+        for term in normalize_text(text).split()
+        if term not in STOP_WORDS and len(term) > 1
+    ]
+
+
+def get_meaning_markers(text: str) -> tuple[frozenset[str], frozenset[str]]:
+    # Negações e números presentes no texto
+    words = normalize_text(text).split()
+    return (
+        frozenset(word for word in words if word in NEGATION_WORDS),
+        frozenset(word for word in words if word.isdigit()),
+    )
+
+
+def stem(terms: list[str]) -> list[str]:
+    return [term[:STEM_LENGTH] for term in terms]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
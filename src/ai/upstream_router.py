@@ -0,0 +1,294 @@
+import asyncio
+import json
+import random
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+from urllib.parse import urlparse
+import httpx
+from src.ai.resilience import (
+    CircuitBreaker,
+    RetryPolicy,
+    UpstreamError,
+    UpstreamUnavailableError,
+)
+from src.settings import Settings, singleton
+
+settings = Settings()
+
+T = TypeVar("T")
+
+# Peso das observações novas nas médias móveis de latência e de erro
+EWMA_ALPHA = 0.2
+# Latência assumida para endpoints que ainda não responderam nada
+DEFAULT_LATENCY_SECONDS = 1.0
+# Curta: vira o motivo do fechamento do websocket, limitado a 123 bytes
+UNAVAILABLE_MESSAGE = (
+    "O provedor de IA está indisponível no momento. Tente novamente mais tarde."
+)
+
+
+class UpstreamEndpoint:
+    def __init__(
+        self, name: str, url: str, model: str, api_key: str, weight: float
+    ) -> None:
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.weight = weight
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=settings.AI_CIRCUIT_FAILURE_THRESHOLD,
+            recovery_seconds=settings.AI_CIRCUIT_RECOVERY_SECONDS,
+        )
+        self.latency_ewma: float | None = None
+        self.error_rate_ewma = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    @property
+    def health_score(self) -> float:
+        # Endpoints mais rápidos, com menos erros e menos ocupados recebem mais
+        # tráfego, sempre proporcional ao peso configurado
+        latency = self.latency_ewma or DEFAULT_LATENCY_SECONDS
+        reliability = (1 - self.error_rate_ewma) ** 2
+        return self.weight * reliability / (latency * (1 + self.in_flight))
+
+    def record_result(self, latency: float | None, failed: bool) -> None:
+        self.requests += 1
+        if failed:
+            self.failures += 1
+        self.error_rate_ewma += EWMA_ALPHA * (float(failed) - self.error_rate_ewma)
+        if latency is not None:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += EWMA_ALPHA * (latency - self.latency_ewma)
+
+    def record_abandoned(self, elapsed: float) -> None:
+        # Perdedora de um hedge: só sabemos que a resposta levaria mais que isso
+        if self.latency_ewma is None or elapsed > self.latency_ewma:
+            self.record_result(elapsed, failed=False)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "model": self.model,
+            "weight": self.weight,
+            **self.circuit_breaker.stats(),
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "latency_ewma_ms": (self.latency_ewma or 0.0) * 1000,
+            "error_rate": self.error_rate_ewma,
+            "health_score": self.health_score,
+        }
+
+
+def load_endpoints() -> list[UpstreamEndpoint]:
+    # AI_ENDPOINTS: lista JSON de {"url", "model", "api_key", "weight", "name"};
+    # sem ela, o endpoint único de AI_API_URL/AI_MODEL/AI_API_KEY é usado
+    if not settings.AI_ENDPOINTS:
+        configured: list[dict[str, Any]] = [{"url": settings.AI_API_URL}]
+    else:
+        try:
+            configured = json.loads(settings.AI_ENDPOINTS)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"AI_ENDPOINTS não é um JSON válido: {e}")
+        if not isinstance(configured, list) or not configured:
+            raise ValueError("AI_ENDPOINTS deve ser uma lista não vazia de endpoints")
+
+    endpoints = []
+    for item in configured:
+        if not isinstance(item, dict) or not item.get("url"):
+            raise ValueError("Todo endpoint em AI_ENDPOINTS precisa de uma url")
+        weight = float(item.get("weight", 1))
+        if weight <= 0:
+            raise ValueError(f"Peso inválido para o endpoint {item['url']}")
+        endpoints.append(
+            UpstreamEndpoint(
+                name=item.get("name") or urlparse(item["url"]).netloc or item["url"],
+                url=item["url"],
+                model=str(item.get("model") or settings.AI_MODEL),
+                api_key=str(item.get("api_key") or settings.AI_API_KEY),
+                weight=weight,
+            )
+        )
+    return endpoints
+
+
+@singleton
+class UpstreamRouter:
+    # Caminho único das chamadas ao provedor: escolhe o endpoint pela saúde,
+    # repete com backoff em falhas temporárias e, opcionalmente, dispara uma
+    # segunda requisição (hedge) para outro endpoint quando a primeira demora.
+    def __init__(self) -> None:
+        self.endpoints = load_endpoints()
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.AI_UPSTREAM_MAX_ATTEMPTS,
+            backoff_base=settings.AI_UPSTREAM_BACKOFF_BASE,
+            backoff_max=settings.AI_UPSTREAM_BACKOFF_MAX,
+            attempt_timeout=settings.AI_UPSTREAM_ATTEMPT_TIMEOUT,
+        )
+        self._hedge_delay = settings.AI_HEDGE_DELAY_MS / 1000
+        self.retries = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    async def call(
+        self,
+        request: Callable[[UpstreamEndpoint], Awaitable[T]],
+        on_discard: Callable[[T], Awaitable[None]] | None = None,
+    ) -> T:
+        # on_discard libera resultados que chegaram tarde em um hedge (ex.: um
+        # stream já aberto que não será lido)
+        failed: set[UpstreamEndpoint] = set()
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt(request, on_discard, failed)
+            except UpstreamError as error:
+                if not error.retryable:
+                    raise
+                attempt += 1
+                delay = None
+                if attempt < self.retry_policy.max_attempts:
+                    delay = self.retry_policy.get_delay(attempt - 1, error.retry_after)
+                if delay is None:
+                    # Falha temporária que as retentativas não resolveram: o
+                    # cliente recebe "tente mais tarde" (1013), não erro interno
+                    raise UpstreamUnavailableError(UNAVAILABLE_MESSAGE) from error
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    def choose_endpoint(
+        self, avoid: set[UpstreamEndpoint] | frozenset[UpstreamEndpoint] = frozenset()
+    ) -> UpstreamEndpoint | None:
+        available = [
+            endpoint
+            for endpoint in self.endpoints
+            if endpoint.circuit_breaker.is_available()
+        ]
+        preferred = [endpoint for endpoint in available if endpoint not in avoid]
+        candidates = preferred or available
+        if not candidates:
+            return None
+        weights = [endpoint.health_score for endpoint in candidates]
+        return random.choices(candidates, weights=weights)[0]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+    async def _attempt(
+        self,
+        request: Callable[[UpstreamEndpoint], Awaitable[T]],
+        on_discard: Callable[[T], Awaitable[None]] | None,
+        failed: set[UpstreamEndpoint],
+    ) -> T:
+        primary = self.choose_endpoint(failed)
+        if primary is None:
+            self.rejected += 1
+            raise UpstreamUnavailableError(UNAVAILABLE_MESSAGE)
+        first = asyncio.ensure_future(self._request_endpoint(request, primary, failed))
+        tasks = {first}
+        try:
+            if self._hedge_delay > 0 and len(self.endpoints) > 1:
+                done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay)
+                secondary = None if done else self.choose_endpoint(failed | {primary})
+                if secondary is not None and secondary is not primary:
+                    self.hedged += 1
+                    tasks.add(
+                        asyncio.ensure_future(
+                            self._request_endpoint(request, secondary, failed)
+                        )
+                    )
+            pending = set(tasks)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        tasks.discard(task)
+                        return task.result()
+                    if error is None or task is first:
+                        error = task.exception()
+            raise error or UpstreamError("Nenhum endpoint respondeu")
+        finally:
+            await self._discard(tasks, on_discard)
+
+    async def _request_endpoint(
+        self,
+        request: Callable[[UpstreamEndpoint], Awaitable[T]],
+        endpoint: UpstreamEndpoint,
+        failed: set[UpstreamEndpoint],
+    ) -> T:
+        breaker = endpoint.circuit_breaker
+        if not breaker.allow_request():
+            raise UpstreamError(f"Endpoint {endpoint.name} indisponível")
+        endpoint.in_flight += 1
+        started_at = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                request(endpoint), self.retry_policy.attempt_timeout
+            )
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            endpoint.record_abandoned(time.monotonic() - started_at)
+            raise
+        except asyncio.TimeoutError:
+            endpoint.timeouts += 1
+            error = UpstreamError(
+                f"Tempo limite de resposta do endpoint {endpoint.name} excedido"
+            )
+        except httpx.TransportError as e:
+            error = UpstreamError(f"Falha de conexão com {endpoint.name}: {e}")
+        except UpstreamError as e:
+            error = e
+        else:
+            breaker.record_success()
+            endpoint.record_result(time.monotonic() - started_at, failed=False)
+            return result
+        finally:
+            endpoint.in_flight -= 1
+
+        if not error.retryable:
+            # Erro do próprio pedido (ex.: 400): o endpoint respondeu normalmente
+            breaker.record_success()
+            endpoint.record_result(time.monotonic() - started_at, failed=False)
+            raise error
+        breaker.record_failure()
+        endpoint.record_result(None, failed=True)
+        failed.add(endpoint)
+        raise error
+
+    async def _discard(
+        self,
+        tasks: set["asyncio.Task[T]"],
+        on_discard: Callable[[T], Awaitable[None]] | None,
+    ) -> None:
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if on_discard is not None and not isinstance(result, BaseException):
+                await on_discard(result)
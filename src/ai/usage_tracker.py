@@ -0,0 +1,43 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from src.database.batch_writer import BatchWriter
+from src.database.models import ChatUsage
+from src.settings import Settings
+
+settings = Settings()
+
+
+@dataclass
+class TurnUsage:
+    chat_id: int
+    user_id: int
+    agent_id: int
+    knowledge_base_id: int | None
+    source: str
+    streamed: bool
+    prompt_tokens: int
+    completion_tokens: int
+    tokens_estimated: bool
+    upstream_ms: int | None
+    queue_wait_ms: int | None
+    total_ms: int
+    created_at: datetime
+
+
+def to_milliseconds(seconds: float | None) -> int | None:
+    return round(seconds * 1000) if seconds is not None else None
+
+
+def insert_turn_usages(session: Session, turns: list[TurnUsage]) -> None:
+    session.execute(insert(ChatUsage), [asdict(turn) for turn in turns])
+
+
+usage_writer: BatchWriter[TurnUsage] = BatchWriter(
+    "chat_usage",
+    insert_turn_usages,
+    batch_size=settings.AI_USAGE_BATCH_SIZE,
+    flush_interval=settings.AI_USAGE_FLUSH_INTERVAL,
+    max_pending=settings.AI_USAGE_MAX_PENDING,
+)
@@ -0,0 +1,36 @@
+import numpy as np
+from src.ai.embeddings import EmbeddingBackend, Matrix
+
+
+class VectorIndex:
+    def __init__(self, backend: EmbeddingBackend, texts: list[str]) -> None:
+        self._backend = backend
+        # Linhas já normalizadas: o produto escalar é a similaridade de cosseno
+        self._matrix: Matrix = np.ascontiguousarray(
+            backend.embed(texts), dtype=np.float32
+        )
+
+    def __len__(self) -> int:
+        return int(self._matrix.shape[0])
+
+    def search(self, query: str, top_k: int) -> list[tuple[int, float]]:
+        return self.search_batch([query], top_k)[0]
+
+    def search_batch(
+        self, queries: list[str], top_k: int
+    ) -> list[list[tuple[int, float]]]:
+        total = len(self)
+        if total == 0 or top_k <= 0:
+            return [[] for _ in queries]
+        top_k = min(top_k, total)
+        scores = self._backend.embed(queries) @ self._matrix.T
+        # argpartition é O(n); só os k melhores são ordenados
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        return [
+            [(int(doc_id), float(score)) for doc_id, score in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(candidates, candidate_scores)
+        ]
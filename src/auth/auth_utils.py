@@ -1,4 +1,14 @@
-from fastapi import Depends, HTTPException, Header, status
+import threading
+import time
+from collections import OrderedDict
+from fastapi import (
+    Depends,
+    HTTPException,
+    Header,
+    WebSocket,
+    WebSocketException,
+    status,
+)
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
@@ -6,9 +16,9 @@ from typing import Any
 from passlib.context import CryptContext
 from src.constants import Role
 from src.database.models import User
-from src.database.get_db import get_db
-from src.schemas.auth import CurrentUser
-from src.settings import Settings
+from src.database.get_db import get_db, run_in_session
+from src.schemas.auth import CurrentUser, TokenClaims
+from src.settings import Settings, singleton
 
 settings = Settings()
 SECRET_KEY = settings.SECRET_KEY
@@ -19,6 +29,48 @@ NO_AUTH = settings.NO_AUTH
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+@singleton
+class CurrentUserCache:
+    # Usuários já validados, para não consultar o banco a cada requisição. Ao
+    # desativar ou alterar um usuário a entrada é descartada em todos os
+    # workers (ConnectionManager().user_changed); o TTL é só uma garantia extra
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._users: OrderedDict[int, tuple[CurrentUser, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> CurrentUser | None:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[1] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user: CurrentUser) -> None:
+        expires_at = time.monotonic() + settings.AUTH_USER_CACHE_TTL_SECONDS
+        with self._lock:
+            self._users[user.id] = (user, expires_at)
+            self._users.move_to_end(user.id)
+            while len(self._users) > settings.AUTH_USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._users),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
 class Auth:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -59,21 +111,77 @@ class Auth:
     ) -> CurrentUser | None:
         if NO_AUTH:
             return None
+        claims = Auth.decode_access_token(token)
+        user = CurrentUserCache().get(claims.user_id)
+        if user is None:
+            with db as session:
+                user = Auth.load_current_user(session, claims.user_id)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Credenciais inválidas",
+            )
+        return user
+
+    @staticmethod
+    def decode_access_token(token: str) -> TokenClaims:
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais inválidas"
         )
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             user_id: int = int(payload.get("sub", 0))
-            if user_id is None:
+            expires_at = int(payload["exp"])
+            if not user_id:
                 raise credentials_exception
-            with db as session:
-                user = session.query(User).filter(User.id == user_id).first()
-                if user is None or not user.enabled:
-                    raise credentials_exception
-        except JWTError:
+        except (JWTError, KeyError, ValueError):
+            raise credentials_exception
+        return TokenClaims(user_id=user_id, expires_at=expires_at)
+
+    @staticmethod
+    def load_current_user(session: Session, user_id: int) -> CurrentUser | None:
+        user = session.query(User).filter(User.id == user_id).first()
+        if user is None or not user.enabled:
+            return None
+        current_user = CurrentUser.model_validate(user)
+        CurrentUserCache().set(current_user)
+        return current_user
+
+    @staticmethod
+    async def authenticate_token(token: str | None) -> tuple[CurrentUser, TokenClaims]:
+        # Mesma validação das rotas HTTP, para o websocket: o banco só é
+        # consultado quando o usuário não está no cache
+        credentials_exception = WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason="Credenciais inválidas"
+        )
+        if not token:
+            raise credentials_exception
+        try:
+            claims = Auth.decode_access_token(token)
+        except HTTPException:
+            raise credentials_exception
+        user = CurrentUserCache().get(claims.user_id)
+        if user is None:
+            user = await run_in_session(
+                lambda session: Auth.load_current_user(session, claims.user_id)
+            )
+        if user is None:
             raise credentials_exception
-        return CurrentUser.model_validate(user)
+        return user, claims
+
+    @staticmethod
+    async def get_websocket_user(
+        websocket: WebSocket,
+    ) -> tuple[CurrentUser, TokenClaims] | None:
+        # Navegadores não enviam cabeçalhos no websocket: aceita o token também
+        # pela query string (?token=...)
+        if NO_AUTH:
+            return None
+        token = websocket.query_params.get("token")
+        authorization = websocket.headers.get("authorization")
+        if not token and authorization:
+            token = authorization.split(" ")[-1]
+        return await Auth.authenticate_token(token)
 
 
 class PermissionValidator:
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, ClassVar, Deque, Generic, TypeVar
+from sqlalchemy.orm import Session
+from src.database.get_db import get_db
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class BatchWriter(Generic[T]):
+    # Acumula linhas em memória e grava em lote numa thread própria: uma sessão
+    # e um commit por lote em vez de um commit por linha no caminho do chat.
+    # Lotes saem quando atingem `batch_size` ou a cada `flush_interval` segundos.
+    _instances: ClassVar[list["BatchWriter[object]"]] = []
+
+    def __init__(
+        self,
+        name: str,
+        write_batch: Callable[[Session, list[T]], None],
+        batch_size: int,
+        flush_interval: float,
+        max_pending: int,
+    ) -> None:
+        self.name = name
+        self._write_batch = write_batch
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._max_pending = max(self._batch_size, max_pending)
+        self._pending: Deque[T] = deque()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._closing = False
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failures = 0
+        BatchWriter._instances.append(self)  # type: ignore[arg-type]
+
+    def add(self, item: T) -> None:
+        with self._condition:
+            if len(self._pending) >= self._max_pending:
+                # Banco lento ou fora do ar: descarta o mais antigo para não
+                # crescer sem limite
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(item)
+            self._ensure_started()
+            if len(self._pending) >= self._batch_size:
+                self._condition.notify()
+
+    def flush(self) -> None:
+        while True:
+            with self._condition:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout: float = 10.0) -> None:
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+        with self._condition:
+            self._thread = None
+            self._closing = False
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
+
+    @classmethod
+    def close_all(cls) -> None:
+        for writer in cls._instances:
+            writer.close()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None and not self._closing:
+            self._thread = threading.Thread(
+                target=self._run, name=f"batch-writer-{self.name}", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closing or len(self._pending) >= self._batch_size,
+                    timeout=self._flush_interval,
+                )
+                if self._closing:
+                    return
+                batch = self._take_batch()
+            if batch:
+                self._write(batch)
+
+    def _take_batch(self) -> list[T]:
+        count = min(self._batch_size, len(self._pending))
+        return [self._pending.popleft() for _ in range(count)]
+
+    def _write(self, batch: list[T]) -> None:
+        try:
+            with get_db() as session:
+                self._write_batch(session, batch)
+                session.commit()
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failures += 1
+            logger.warning(
+                f"Falha ao gravar lote de {len(batch)} itens em {self.name}: {e}"
+            )
+
+
+class DurableBatchWriter(Generic[T, R]):
+    # Group commit: junta as linhas de todas as conexões num único INSERT e
+    # num único commit, e cada chamador espera o commit do lote em que a sua
+    # linha entrou. Nada é descartado; o lote sai ao atingir `batch_size` ou
+    # `flush_interval` segundos depois da primeira linha pendente
+    _instances: ClassVar[list["DurableBatchWriter[Any, Any]"]] = []
+
+    def __init__(
+        self,
+        name: str,
+        write_batch: Callable[[Session, list[T]], list[R]],
+        batch_size: int,
+        flush_interval: float,
+    ) -> None:
+        self.name = name
+        self._write_batch = write_batch
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._pending: Deque[tuple[T, Future[R]]] = deque()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._closing = False
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        DurableBatchWriter._instances.append(self)
+
+    def submit(self, item: T) -> Future[R]:
+        future: Future[R] = Future()
+        with self._condition:
+            if self._closing:
+                raise RuntimeError(f"Gravação em {self.name} encerrada")
+            self._pending.append((item, future))
+            self._ensure_started()
+            self._condition.notify()
+        return future
+
+    async def write(self, item: T) -> R:
+        return await asyncio.wrap_future(self.submit(item))
+
+    def close(self, timeout: float = 10.0) -> None:
+        # Para de aceitar linhas e grava tudo o que estiver pendente
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        while True:
+            with self._condition:
+                batch = self._take_batch()
+            if not batch:
+                break
+            self._write(batch)
+        with self._condition:
+            self._thread = None
+            self._closing = False
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "written": self.written,
+            "dropped": 0,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
+
+    @classmethod
+    def close_all(cls) -> None:
+        for writer in cls._instances:
+            writer.close()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name=f"durable-writer-{self.name}", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closing or self._pending)
+                if not self._pending:
+                    return
+                # Espera um pouco para juntar mais linhas no mesmo commit
+                self._condition.wait_for(
+                    lambda: self._closing or len(self._pending) >= self._batch_size,
+                    timeout=self._flush_interval,
+                )
+                batch = self._take_batch()
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Se a thread morrer, todo submit seguinte fica esperando
+                self.failures += 1
+                logger.warning(f"Erro inesperado na gravação em {self.name}: {e}")
+
+    def _take_batch(self) -> list[tuple[T, Future[R]]]:
+        count = min(self._batch_size, len(self._pending))
+        batch = [self._pending.popleft() for _ in range(count)]
+        for _, future in batch:
+            # A partir daqui o chamador não consegue mais cancelar o future (o
+            # cancelamento de quem espera com wrap_future cancela o future). Um
+            # future já cancelado ainda tem a linha gravada, só não recebe o
+            # resultado
+            future.set_running_or_notify_cancel()
+        return batch
+
+    def _write(self, batch: list[tuple[T, Future[R]]]) -> None:
+        try:
+            results = self._commit([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self.failures += 1
+                logger.warning(f"Falha ao gravar em {self.name}: {e}")
+                _set_exception(batch[0][1], e)
+                return
+            # Uma linha ruim não pode derrubar as outras do lote
+            for entry in batch:
+                self._write([entry])
+            return
+        for (_, future), result in zip(batch, results):
+            _set_result(future, result)
+
+    def _commit(self, items: list[T]) -> list[R]:
+        with get_db() as session:
+            results = self._write_batch(session, items)
+            session.commit()
+        self.written += len(items)
+        self.batches += 1
+        return results
+
+
+# O future pode ter sido cancelado antes de ser marcado como em andamento
+def _set_result(future: "Future[R]", result: R) -> None:
+    try:
+        future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def _set_exception(future: "Future[R]", exception: Exception) -> None:
+    try:
+        future.set_exception(exception)
+    except InvalidStateError:
+        pass
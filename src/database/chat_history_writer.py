@@ -0,0 +1,28 @@
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from sqlalchemy.orm import Session
+from src.database.batch_writer import DurableBatchWriter
+from src.database.models import ChatHistory
+from src.settings import Settings
+
+settings = Settings()
+
+
+@dataclass
+class ChatHistoryRow:
+    chat_id: int
+    message: str
+    is_user_message: bool
+    message_date: datetime
+
+
+def insert_chat_history(session: Session, rows: list[ChatHistoryRow]) -> list[int]:
+    return ChatHistory.insert_many(session, [asdict(row) for row in rows])
+
+
+chat_history_writer: DurableBatchWriter[ChatHistoryRow, int] = DurableBatchWriter(
+    "chat_history",
+    insert_chat_history,
+    batch_size=settings.CHAT_HISTORY_BATCH_SIZE,
+    flush_interval=settings.CHAT_HISTORY_FLUSH_INTERVAL,
+)
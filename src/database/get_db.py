@@ -1,3 +1,6 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 
@@ -8,7 +11,25 @@ settings = Settings()
 engine = create_engine(settings.DATABASE_URL)
 SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+T = TypeVar("T")
+
+# Pool limitado: no máximo DATABASE_THREAD_POOL_SIZE conexões em uso pelo código
+# assíncrono, abaixo do tamanho do pool do engine
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DATABASE_THREAD_POOL_SIZE, thread_name_prefix="db"
+)
+
 
 def get_db() -> Session:
     db = SessionFactory()
     return db
+
+
+async def run_in_session(step: Callable[[Session], T]) -> T:
+    # Roda um passo síncrono de banco fora do event loop, com uma sessão curta:
+    # a conexão volta ao pool antes de qualquer espera pelo provedor
+    def run() -> T:
+        with get_db() as session:
+            return step(session)
+
+    return await asyncio.get_running_loop().run_in_executor(db_executor, run)
@@ -1,16 +1,20 @@
 from __future__ import annotations
+import hashlib
+import json
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 from sqlalchemy import (
     ARRAY,
     Column,
     ForeignKey,
     Boolean,
     DateTime,
+    Index,
     Integer,
     String,
     Table,
     func,
+    insert,
     select,
     text,
     Float,
@@ -88,6 +92,14 @@ class Agent(Base):  # type: ignore[valid-type, misc]
     )
     image_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     enabled: Mapped[bool] = mapped_column(Boolean, server_default=text("TRUE"))
+    faq_top_k: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    faq_token_budget: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    response_cache_enabled: Mapped[bool] = mapped_column(
+        Boolean, server_default=text("TRUE")
+    )
+    faq_short_circuit_enabled: Mapped[bool] = mapped_column(
+        Boolean, server_default=text("FALSE")
+    )
 
     users = relationship(
         "User",
@@ -139,6 +151,7 @@ class Chat(Base):  # type: ignore[valid-type, misc]
 
 class ChatHistory(Base):  # type: ignore[valid-type, misc]
     __tablename__ = "chat_history"
+    __table_args__ = (Index("ix_chat_history_chat_id_id", "chat_id", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     chat_id: Mapped[int] = mapped_column(ForeignKey("chat.id"))
@@ -163,6 +176,100 @@ class ChatHistory(Base):  # type: ignore[valid-type, misc]
         session.add(chat_history)
         session.commit()
 
+    @staticmethod
+    def insert_many(session: Session, rows: list[dict[str, Any]]) -> list[int]:
+        # Um INSERT com várias linhas; os ids voltam na ordem das linhas
+        query = insert(ChatHistory).returning(
+            ChatHistory.id, sort_by_parameter_order=True
+        )
+        return list(session.execute(query, rows).scalars().all())
+
+    @staticmethod
+    def get_recent_history(
+        session: Session, chat_id: int, limit: int, after_id: int | None = None
+    ) -> list[ChatHistory]:
+        query = select(ChatHistory).where(ChatHistory.chat_id == chat_id)
+        if after_id is not None:
+            query = query.where(ChatHistory.id > after_id)
+        query = query.order_by(ChatHistory.id.desc()).limit(limit)
+        result = session.execute(query)
+        return list(reversed(result.scalars().all()))
+
+    @staticmethod
+    def get_history_range(
+        session: Session,
+        chat_id: int,
+        after_id: int | None,
+        up_to_id: int | None,
+        limit: int,
+    ) -> list[ChatHistory]:
+        # Paginação por chave (id), sem OFFSET
+        query = select(ChatHistory).where(ChatHistory.chat_id == chat_id)
+        if up_to_id is not None:
+            query = query.where(ChatHistory.id <= up_to_id)
+        if after_id is not None:
+            query = query.where(ChatHistory.id > after_id)
+        query = query.order_by(ChatHistory.id).limit(limit)
+        result = session.execute(query)
+        return list(result.scalars().all())
+
+
+class ChatSummary(Base):  # type: ignore[valid-type, misc]
+    __tablename__ = "chat_summary"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(ForeignKey("chat.id"), unique=True)
+    summary: Mapped[str] = mapped_column(String)
+    # Última mensagem de ChatHistory já incorporada ao resumo
+    last_message_id: Mapped[int] = mapped_column(Integer)
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+
+    @staticmethod
+    def get_by_chat_id(session: Session, chat_id: int) -> ChatSummary | None:
+        query = select(ChatSummary).where(ChatSummary.chat_id == chat_id)
+        result = session.execute(query)
+        return result.scalars().first()
+
+    @staticmethod
+    def save(
+        session: Session, chat_id: int, summary: str, last_message_id: int
+    ) -> None:
+        chat_summary = ChatSummary.get_by_chat_id(session, chat_id)
+        if chat_summary is None:
+            chat_summary = ChatSummary(chat_id=chat_id)
+            session.add(chat_summary)
+        chat_summary.summary = summary
+        chat_summary.last_message_id = last_message_id
+        chat_summary.updated_at = datetime.now()
+        session.commit()
+
+
+class ChatUsage(Base):  # type: ignore[valid-type, misc]
+    # Uma linha por turno respondido; sem chaves estrangeiras para que o
+    # histórico de consumo sobreviva à remoção de agentes e chats
+    __tablename__ = "chat_usage"
+    __table_args__ = (
+        Index("ix_chat_usage_created_at", "created_at"),
+        Index("ix_chat_usage_agent_id_created_at", "agent_id", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(Integer)
+    user_id: Mapped[int] = mapped_column(Integer)
+    agent_id: Mapped[int] = mapped_column(Integer)
+    knowledge_base_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # llm, coalesced, response_cache, faq, cancelled ou summary (chamada de
+    # resumo da conversa, que não é um turno)
+    source: Mapped[str] = mapped_column(String(16))
+    streamed: Mapped[bool] = mapped_column(Boolean)
+    prompt_tokens: Mapped[int] = mapped_column(Integer)
+    completion_tokens: Mapped[int] = mapped_column(Integer)
+    tokens_estimated: Mapped[bool] = mapped_column(Boolean)
+    upstream_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    queue_wait_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    total_ms: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+
 
 class KnowledgeBase(Base):  # type: ignore[valid-type, misc]
     __tablename__ = "knowledge_base"
@@ -170,3 +277,20 @@ class KnowledgeBase(Base):  # type: ignore[valid-type, misc]
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     data: Mapped[str] = mapped_column(JSON, nullable=False)
+    version: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+    @staticmethod
+    def compute_version(data: Any) -> str:
+        if isinstance(data, str):
+            data = json.loads(data)
+        content = json.dumps(data, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get_version(self) -> str:
+        return self.version or KnowledgeBase.compute_version(self.data)
+
+    def get_questions_and_answers(self) -> tuple[list[str], list[str]]:
+        data: Any = self.data
+        if isinstance(data, str):
+            data = json.loads(data)
+        return list(data.get("questions") or []), list(data.get("answers") or [])
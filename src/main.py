@@ -1,8 +1,14 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 from fastapi import FastAPI
 from fastapi.responses import RedirectResponse
-from src.database.get_db import engine
+from src.ai.http_client import AiHttpClient
+from src.database.batch_writer import BatchWriter, DurableBatchWriter
+from src.database.get_db import db_executor, engine
 from src.database.models import Base
 from src.middlewares.logging import log_requests
+from src.modules.connection_manager import ConnectionManager
 from src.routers import (
     auth,
     example,
@@ -24,7 +30,19 @@ logging.basicConfig(
 Base.metadata.create_all(bind=engine)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await ConnectionManager().start()
+    yield
+    await ConnectionManager().stop()
+    await AiHttpClient.close()
+    # Grava o que ainda estiver pendente nos lotes antes de encerrar
+    await asyncio.to_thread(BatchWriter.close_all)
+    await asyncio.to_thread(DurableBatchWriter.close_all)
+    db_executor.shutdown(wait=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/", include_in_schema=False)
@@ -1,5 +1,6 @@
 from typing import Any
 from sqlalchemy import select
+from src.modules.connection_manager import ConnectionManager
 from src.modules.knowledge_base_handler import KnowledgeBaseHandler
 from src.schemas.basic_response import BasicResponse, GetAgentBasicResponse
 from src.database.models import Agent, Group, KnowledgeBase, User
@@ -27,6 +28,10 @@ class CreateAgent:
         file: UploadFile | None,
         knowledge_base_name: str | None,
         enabled: bool,
+        faq_top_k: int | None = None,
+        faq_token_budget: int | None = None,
+        response_cache_enabled: bool = True,
+        faq_short_circuit_enabled: bool = False,
     ):
         self._session = session
         self._file = file
@@ -36,6 +41,10 @@ class CreateAgent:
         self._behavior = behavior
         self._temperature = temperature
         self._top_p = top_p
+        self._faq_top_k = faq_top_k
+        self._faq_token_budget = faq_token_budget
+        self._response_cache_enabled = response_cache_enabled
+        self._faq_short_circuit_enabled = faq_short_circuit_enabled
         self._image_id = image_id
         self._groups = groups or []
         self._knowledge_base_name = knowledge_base_name
@@ -135,13 +144,18 @@ class CreateAgent:
 
     def _create_knowledge_base(self) -> None:
         knowledge_base = dict(
-            name=self._knowledge_base_name, data=self._questions_and_answers
+            name=self._knowledge_base_name,
+            data=self._questions_and_answers,
+            version=KnowledgeBase.compute_version(self._questions_and_answers),
         )
         self._knowledge_base = KnowledgeBase(**knowledge_base)
         try:
             self._session.add(self._knowledge_base)
             self._session.flush()
             self._session.refresh(self._knowledge_base)
+            ConnectionManager().ai_cache_changed(
+                "knowledge_base", self._knowledge_base.id
+            )
         except Exception as e:
             print(e)
             raise HTTPException(
@@ -157,6 +171,10 @@ class CreateAgent:
                 theme=self._theme,
                 temperature=self._temperature,
                 top_p=self._top_p,
+                faq_top_k=self._faq_top_k,
+                faq_token_budget=self._faq_token_budget,
+                response_cache_enabled=self._response_cache_enabled,
+                faq_short_circuit_enabled=self._faq_short_circuit_enabled,
                 image_id=self._image_id,
                 knowledge_base_id=self._knowledge_base.id,
                 groups=self._groups,
@@ -169,6 +187,10 @@ class CreateAgent:
                 theme=self._theme,
                 temperature=self._temperature,
                 top_p=self._top_p,
+                faq_top_k=self._faq_top_k,
+                faq_token_budget=self._faq_token_budget,
+                response_cache_enabled=self._response_cache_enabled,
+                faq_short_circuit_enabled=self._faq_short_circuit_enabled,
                 image_id=self._image_id,
                 groups=self._groups,
             )
@@ -185,6 +207,10 @@ class CreateAgent:
                 behavior=self._agent.behavior,
                 temperature=self._agent.temperature,
                 top_p=self._agent.top_p,
+                faq_top_k=self._agent.faq_top_k,
+                faq_token_budget=self._agent.faq_token_budget,
+                response_cache_enabled=self._agent.response_cache_enabled,
+                faq_short_circuit_enabled=self._agent.faq_short_circuit_enabled,
                 image_id=self._agent.image_id,
                 knowledge_base_id=self._agent.knowledge_base_id,
                 groups=[group.id for group in self._agent.groups],
@@ -254,6 +280,10 @@ class GetAgents:
                     behavior=agent.behavior,
                     temperature=agent.temperature,
                     top_p=agent.top_p,
+                    faq_top_k=agent.faq_top_k,
+                    faq_token_budget=agent.faq_token_budget,
+                    response_cache_enabled=agent.response_cache_enabled,
+                    faq_short_circuit_enabled=agent.faq_short_circuit_enabled,
                     image_id=agent.image_id,
                     knowledge_base_id=agent.knowledge_base_id,
                     enabled=agent.enabled,
@@ -302,6 +332,10 @@ class GetAgent:
                 behavior=self._agent.behavior,
                 temperature=self._agent.temperature,
                 top_p=self._agent.top_p,
+                faq_top_k=self._agent.faq_top_k,
+                faq_token_budget=self._agent.faq_token_budget,
+                response_cache_enabled=self._agent.response_cache_enabled,
+                faq_short_circuit_enabled=self._agent.faq_short_circuit_enabled,
                 image_id=self._agent.image_id,
                 knowledge_base_id=self._agent.knowledge_base_id,
                 enabled=self._agent.enabled,
@@ -325,6 +359,12 @@ class UpdateAgent:
         enabled: bool,
         file: UploadFile | None,
         knowledge_base_name: str | None,
+        faq_top_k: int | None = None,
+        faq_token_budget: int | None = None,
+        response_cache_enabled: bool | None = None,
+        faq_short_circuit_enabled: bool | None = None,
+        reset_faq_top_k: bool = False,
+        reset_faq_token_budget: bool = False,
     ) -> None:
         self._session = session
         self._agent_id = agent_id
@@ -335,6 +375,12 @@ class UpdateAgent:
         self._behavior = behavior
         self._temperature = temperature
         self._top_p = top_p
+        self._faq_top_k = faq_top_k
+        self._faq_token_budget = faq_token_budget
+        self._response_cache_enabled = response_cache_enabled
+        self._faq_short_circuit_enabled = faq_short_circuit_enabled
+        self._reset_faq_top_k = reset_faq_top_k
+        self._reset_faq_token_budget = reset_faq_token_budget
         self._image_id = image_id
         self._groups = groups or []
         self._knowledge_base_name = knowledge_base_name
@@ -420,13 +466,16 @@ class UpdateAgent:
 
     def _create_knowledge_base(self) -> None:
         knowledge_base = dict(
-            name=self._knowledge_base_name, data=self._questions_and_answers
+            name=self._knowledge_base_name,
+            data=self._questions_and_answers,
+            version=KnowledgeBase.compute_version(self._questions_and_answers),
         )
         self._knowledge_base = KnowledgeBase(**knowledge_base)
         self._session.add(self._knowledge_base)
         self._session.flush()
         self._session.refresh(self._knowledge_base)
         self._knowledge_base_id = self._knowledge_base.id
+        ConnectionManager().ai_cache_changed("knowledge_base", self._knowledge_base.id)
 
     async def update_agent(self) -> AgentResponse:
         with self._session as db:
@@ -444,6 +493,20 @@ class UpdateAgent:
             agent.temperature = self._temperature
             agent.enabled = self._enabled
             agent.top_p = self._top_p
+            # None: o campo não foi enviado e o valor atual é mantido; o reset
+            # volta ao padrão global
+            if self._reset_faq_top_k:
+                agent.faq_top_k = None
+            elif self._faq_top_k is not None:
+                agent.faq_top_k = self._faq_top_k
+            if self._reset_faq_token_budget:
+                agent.faq_token_budget = None
+            elif self._faq_token_budget is not None:
+                agent.faq_token_budget = self._faq_token_budget
+            if self._response_cache_enabled is not None:
+                agent.response_cache_enabled = self._response_cache_enabled
+            if self._faq_short_circuit_enabled is not None:
+                agent.faq_short_circuit_enabled = self._faq_short_circuit_enabled
             agent.image_id = self._image_id
 
             if not (self._knowledge_base_id or self._file):
@@ -468,6 +531,7 @@ class UpdateAgent:
 
             db.commit()
             db.refresh(agent)
+            ConnectionManager().ai_cache_changed("agent", agent.id)
 
             return AgentResponse(
                 id=agent.id,
@@ -476,6 +540,10 @@ class UpdateAgent:
                 behavior=agent.behavior,
                 temperature=agent.temperature,
                 top_p=agent.top_p,
+                faq_top_k=agent.faq_top_k,
+                faq_token_budget=agent.faq_token_budget,
+                response_cache_enabled=agent.response_cache_enabled,
+                faq_short_circuit_enabled=agent.faq_short_circuit_enabled,
                 image_id=agent.image_id,
                 knowledge_base_id=agent.knowledge_base_id,
                 enabled=agent.enabled,
@@ -493,6 +561,7 @@ class DeleteAgent:
             self._get_agent()
             self._delete_agent()
             self._session.commit()
+            ConnectionManager().ai_cache_changed("agent", self._agent_id)
             return BasicResponse(message="Agente deletado com sucesso.")
         except HTTPException as e:
             self._session.rollback()
@@ -1,5 +1,6 @@
 from typing import Any
 from sqlalchemy import select, text, update
+from src.modules.connection_manager import ConnectionManager
 from src.database.models import Agent, Chat, ChatHistory, User
 from src.schemas.basic_response import BasicResponse
 from src.schemas.chat import (
@@ -168,6 +169,7 @@ class RouterDeleteChat:
             update(Chat).values(enabled=False).where(Chat.id == self._chat_id)
         )
         session.commit()
+        ConnectionManager().ai_cache_changed("chat", self._chat_id)
 
 
 class RouterGetChatHistory:
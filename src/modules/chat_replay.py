@@ -0,0 +1,98 @@
+from fastapi import WebSocketException, status
+from sqlalchemy.orm import Session
+from src.ai.chat_resolution import ChatResolution, get_chat_resolution
+from src.database.get_db import run_in_session
+from src.database.models import ChatHistory
+from src.modules.connection_manager import ClientConnection, ConnectionManager
+from src.schemas.ai import ChatHistoryFrame, ChatResumed
+from src.schemas.chat_payload import ResumePayload
+from src.settings import Settings
+
+settings = Settings()
+
+
+class ChatReplay:
+    # Retomada de um chat depois de reconectar: envia só as mensagens com id
+    # maior que o último visto pelo cliente e passa a receber os turnos do chat,
+    # inclusive a resposta que estava em andamento quando a conexão caiu
+    def __init__(
+        self,
+        connection: ClientConnection,
+        payload: ResumePayload,
+        resolutions: dict[int, ChatResolution],
+    ) -> None:
+        self._connection = connection
+        self._payload = payload
+        self._resolutions = resolutions
+        self._last_message_id = payload.last_message_id
+        self._replayed = 0
+        self._truncated = False
+
+    async def execute(self) -> ChatResumed:
+        resolution = await run_in_session(self._resolve_chat)
+        # Inscreve antes de ler o banco: um turno que termine durante a leitura
+        # chega pelo chat (o cliente descarta ids repetidos)
+        ConnectionManager().bind(
+            self._connection, self._payload.chat_id, resolution.user_id
+        )
+        await self._replay_history()
+        resumed = ChatResumed(
+            chat_id=self._payload.chat_id,
+            last_message_id=self._last_message_id,
+            replayed=self._replayed,
+            truncated=self._truncated,
+        )
+        await ConnectionManager().send_frame(resumed.model_dump(), self._connection)
+        return resumed
+
+    def _resolve_chat(self, session: Session) -> ChatResolution:
+        resolution = get_chat_resolution(
+            session, self._payload.chat_id, self._resolutions
+        )
+        if not resolution:
+            raise WebSocketException(
+                reason=f"Chat com o id {self._payload.chat_id} não existe!",
+                code=status.WS_1003_UNSUPPORTED_DATA,
+            )
+        user = self._connection.user
+        if not resolution.belongs_to(user.id if user else None):
+            raise WebSocketException(
+                reason="Você não possui acesso a esse chat",
+                code=status.WS_1008_POLICY_VIOLATION,
+            )
+        return resolution
+
+    async def _replay_history(self) -> None:
+        page_size = max(1, settings.WS_RESUME_PAGE_SIZE)
+        while True:
+            remaining = settings.WS_RESUME_MAX_MESSAGES - self._replayed
+            if remaining <= 0:
+                self._truncated = await run_in_session(self._has_more_rows)
+                return
+            rows = await run_in_session(
+                lambda session: self._load_page(session, min(page_size, remaining))
+            )
+            for row in rows:
+                frame = ChatHistoryFrame(
+                    chat_id=row.chat_id,
+                    message_id=row.id,
+                    message=row.message,
+                    is_user_message=row.is_user_message,
+                    message_date=int(row.message_date.timestamp()),
+                )
+                if not await ConnectionManager().send_frame(
+                    frame.model_dump(), self._connection
+                ):
+                    return
+                self._last_message_id = row.id
+                self._replayed += 1
+            if len(rows) < min(page_size, remaining):
+                return
+
+    def _load_page(self, session: Session, limit: int) -> list[ChatHistory]:
+        return ChatHistory.get_history_range(
+            session, self._payload.chat_id, self._last_message_id, None, limit
+        )
+
+    def _has_more_rows(self, session: Session) -> bool:
+        return bool(self._load_page(session, 1))
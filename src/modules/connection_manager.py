@@ -1,25 +1,425 @@
-from typing import Any
-from fastapi import WebSocket
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Coroutine, Iterable
+from fastapi import WebSocket, status
 
-from src.schemas.ai import AiResponse
+from src.ai.cache_invalidation import AiCacheInvalidator, AiCacheScope
+from src.auth.auth_utils import CurrentUserCache
+from src.modules.message_broker import (
+    BrokerMessage,
+    BrokerTarget,
+    MessageBroker,
+    create_broker,
+)
+from src.schemas.ai import AiResponse, AiStreamChunk, AiStreamEnd
+from src.schemas.auth import CurrentUser, TokenClaims
+from src.settings import Settings, singleton
 
+settings = Settings()
 
+logger = logging.getLogger(__name__)
+
+
+def serialize_message(message: AiResponse | str | dict[str, Any]) -> str:
+    if isinstance(message, AiResponse):
+        message = message.model_dump()
+    # Mesmo formato de WebSocket.send_json
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class ClientConnection:
+    # Um socket com fila de saída limitada e uma tarefa escritora própria: quem
+    # envia só enfileira, então um cliente lento não segura os outros
+    def __init__(self, connection_id: int, websocket: WebSocket) -> None:
+        self.id = connection_id
+        self.websocket = websocket
+        self.user_id: int | None = None
+        # Usuário autenticado no handshake (None com NO_AUTH), guardado pela
+        # vida toda da conexão; só é revalidado quando o token expira
+        self.user: CurrentUser | None = None
+        self.token_expires_at: int | None = None
+        self.chat_ids: set[int] = set()
+        self.dropped = 0
+        self.closed = False
+        self._queue: asyncio.Queue[str] = asyncio.Queue(
+            maxsize=settings.WS_SEND_QUEUE_SIZE
+        )
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def enqueue(self, text: str) -> bool:
+        # Retorna False quando a mensagem não pôde ser entregue à fila
+        if self.closed:
+            return False
+        if self._queue.full():
+            # "drop" descarta a mensagem mais antiga, "disconnect" deixa o
+            # ConnectionManager fechar a conexão do cliente lento
+            if settings.WS_SLOW_CLIENT_POLICY == "disconnect":
+                return False
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+        self._queue.put_nowait(text)
+        return True
+
+    async def put(self, text: str, timeout: float) -> bool:
+        # Envio que espera vaga na fila em vez de aplicar a política de cliente
+        # lento, para rajadas grandes como a reposição do histórico
+        if self.closed:
+            return False
+        try:
+            await asyncio.wait_for(self._queue.put(text), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return not self.closed
+
+    async def drain(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def close(self, code: int, reason: str | None = None) -> None:
+        self.stop()
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            # O cliente já pode ter ido embora
+            pass
+
+    def stop(self) -> None:
+        self.closed = True
+        self._writer.cancel()
+
+    async def _write_loop(self) -> None:
+        while True:
+            text = await self._queue.get()
+            try:
+                await self.websocket.send_text(text)
+            except Exception as e:
+                logger.info(f"Falha ao enviar para a conexão {self.id}: {e}")
+                self.closed = True
+                return
+            finally:
+                self._queue.task_done()
+
+
+@singleton
 class ConnectionManager:
+    # Registro das conexões indexado por conexão, usuário e chat. Todas as
+    # operações de registro são O(1) e os envios só enfileiram
     def __init__(self) -> None:
-        self.active_connections: list[WebSocket] = []
+        self._connection_ids = itertools.count(1)
+        self.active_connections: dict[int, ClientConnection] = {}
+        self._by_user: dict[int, set[int]] = {}
+        self._by_chat: dict[int, set[int]] = {}
+        # Último bind de cada chat em outro worker, só pelo tempo da carência
+        self._remote_binds: OrderedDict[int, float] = OrderedDict()
+        self._background: set["asyncio.Task[None]"] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.slow_disconnects = 0
+        self.revoked = 0
+        self.dropped = 0
+        self.broker: MessageBroker = create_broker()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        await self.broker.start(self._on_broker_message)
+
+    async def stop(self) -> None:
+        await self.broker.close()
 
-    async def connect(self, websocket: WebSocket) -> None:
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user: CurrentUser | None = None,
+        claims: TokenClaims | None = None,
+    ) -> ClientConnection:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        connection = ClientConnection(next(self._connection_ids), websocket)
+        self.active_connections[connection.id] = connection
+        if user is not None and claims is not None:
+            self.authenticate(connection, user, claims)
+        return connection
+
+    def authenticate(
+        self, connection: ClientConnection, user: CurrentUser, claims: TokenClaims
+    ) -> None:
+        connection.user = user
+        connection.token_expires_at = claims.expires_at
+        self._bind_user(connection, user.id)
+
+    def user_changed(self, user_id: int, deactivated: bool = False) -> None:
+        # Chamado pelas rotas de usuário, que rodam em threads: descarta o cache
+        # aqui e agenda no event loop o resto (neste worker e, pelo broker, nos
+        # demais), incluindo fechar as conexões de um usuário desativado
+        CurrentUserCache().invalidate(user_id)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(
+                self._publish_user_changed, user_id, deactivated
+            )
 
-    def disconnect(self, websocket: WebSocket) -> None:
-        self.active_connections.remove(websocket)
+    def ai_cache_changed(self, scope: AiCacheScope, target_id: int) -> None:
+        # Agente, base ou chat alterado: descarta os caches de IA aqui e, pelo
+        # broker, nos demais workers. Pode ser chamado de threads, como
+        # user_changed
+        AiCacheInvalidator.changed(scope, target_id)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(
+                self._publish_ai_cache_changed, scope, target_id
+            )
+
+    def disconnect(self, connection: ClientConnection) -> None:
+        if self.active_connections.pop(connection.id, None) is None:
+            return
+        connection.stop()
+        self.dropped += connection.dropped
+        if connection.user_id is not None:
+            _discard_index(self._by_user, connection.user_id, connection.id)
+        for chat_id in connection.chat_ids:
+            _discard_index(self._by_chat, chat_id, connection.id)
+
+    def has_chat_connections(self, chat_id: int, since: float | None = None) -> bool:
+        # Conexões deste worker ou, com `since` (time.monotonic), um bind do chat
+        # feito em outro worker depois desse instante
+        if self._by_chat.get(chat_id):
+            return True
+        bound_at = self._remote_binds.get(chat_id)
+        return since is not None and bound_at is not None and bound_at >= since
+
+    async def close(
+        self, connection: ClientConnection, code: int, reason: str | None = None
+    ) -> None:
+        # Entrega o que já estava na fila (ex.: a mensagem de erro) antes de fechar
+        await connection.drain(settings.WS_CLOSE_DRAIN_TIMEOUT)
+        await connection.close(code, reason)
+        self.disconnect(connection)
+
+    def bind(
+        self, connection: ClientConnection, chat_id: int, user_id: int | None = None
+    ) -> None:
+        # Um turno que termina depois da desconexão não pode recolocar a conexão
+        # nos índices
+        if connection.closed or connection.id not in self.active_connections:
+            return
+        if chat_id not in connection.chat_ids:
+            connection.chat_ids.add(chat_id)
+            self._by_chat.setdefault(chat_id, set()).add(connection.id)
+            self._run_in_background(
+                self.broker.publish(
+                    BrokerMessage("chat_bound", chat_id, "", self.broker.origin)
+                )
+            )
+        if user_id is not None:
+            self._bind_user(connection, user_id)
+
+    def _bind_user(self, connection: ClientConnection, user_id: int) -> None:
+        if connection.closed or connection.id not in self.active_connections:
+            return
+        if connection.user_id != user_id:
+            if connection.user_id is not None:
+                _discard_index(self._by_user, connection.user_id, connection.id)
+            connection.user_id = user_id
+            self._by_user.setdefault(user_id, set()).add(connection.id)
 
     async def send_personal_message(
-        self, message: AiResponse | str | dict[str, Any], websocket: WebSocket
+        self, message: AiResponse | str | dict[str, Any], connection: ClientConnection
+    ) -> None:
+        self._send(connection, serialize_message(message))
+
+    async def send_stream_chunk(
+        self, chat_id: int, content: str, connection: ClientConnection
     ) -> None:
-        await websocket.send_json(message)
+        chunk = AiStreamChunk(chat_id=chat_id, content=content)
+        self._send(connection, serialize_message(chunk.model_dump()))
+
+    async def send_stream_end(
+        self, chat_id: int, ai_response: AiResponse, connection: ClientConnection
+    ) -> None:
+        end = AiStreamEnd(
+            chat_id=chat_id,
+            answer=ai_response.answer,
+            response_date=ai_response.response_date,
+            message_id=ai_response.message_id,
+        )
+        self._send(connection, serialize_message(end.model_dump()))
+
+    async def send_frame(
+        self, message: AiResponse | str | dict[str, Any], connection: ClientConnection
+    ) -> bool:
+        return await connection.put(
+            serialize_message(message), settings.WS_SEND_TIMEOUT
+        )
+
+    async def send_to_user(
+        self, user_id: int, message: AiResponse | str | dict[str, Any]
+    ) -> int:
+        return await self._publish("user", user_id, message)
+
+    async def send_to_chat(
+        self,
+        chat_id: int,
+        message: AiResponse | str | dict[str, Any],
+        exclude: ClientConnection | None = None,
+    ) -> int:
+        return await self._publish("chat", chat_id, message, exclude)
+
+    async def broadcast(self, message: str) -> int:
+        return await self._publish("broadcast", None, message)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "connections": len(self.active_connections),
+            "users": len(self._by_user),
+            "chats": len(self._by_chat),
+            "queued": sum(
+                connection.queued for connection in self.active_connections.values()
+            ),
+            "dropped": self.dropped
+            + sum(
+                connection.dropped for connection in self.active_connections.values()
+            ),
+            "slow_disconnects": self.slow_disconnects,
+            "revoked": self.revoked,
+            "broker": self.broker.stats(),
+        }
+
+    async def _publish(
+        self,
+        target: BrokerTarget,
+        target_id: int | None,
+        message: AiResponse | str | dict[str, Any],
+        exclude: ClientConnection | None = None,
+    ) -> int:
+        # Entrega já nas conexões deste worker e avisa os demais pelo broker;
+        # retorna quantas conexões locais receberam
+        broker_message = BrokerMessage(
+            target, target_id, serialize_message(message), self.broker.origin
+        )
+        sent = self._fan_out(broker_message, exclude)
+        await self.broker.publish(broker_message)
+        return sent
+
+    def _on_broker_message(self, message: BrokerMessage) -> None:
+        if message.target == "user_changed":
+            self._apply_user_changed(message)
+            return
+        if message.target == "chat_bound":
+            self._apply_chat_bound(message)
+            return
+        if message.target == "ai_cache_changed":
+            if message.target_id is not None:
+                AiCacheInvalidator.changed(message.text, message.target_id)
+            return
+        self._fan_out(message)
+
+    def _publish_user_changed(self, user_id: int, deactivated: bool) -> None:
+        message = BrokerMessage(
+            "user_changed",
+            user_id,
+            "deactivated" if deactivated else "updated",
+            self.broker.origin,
+        )
+        self._apply_user_changed(message)
+        self._run_in_background(self.broker.publish(message))
+
+    def _publish_ai_cache_changed(self, scope: AiCacheScope, target_id: int) -> None:
+        message = BrokerMessage(
+            "ai_cache_changed", target_id, scope, self.broker.origin
+        )
+        self._run_in_background(self.broker.publish(message))
+
+    def _apply_user_changed(self, message: BrokerMessage) -> None:
+        if message.target_id is None:
+            return
+        CurrentUserCache().invalidate(message.target_id)
+        if message.text != "deactivated":
+            return
+        for connection_id in list(self._by_user.get(message.target_id, ())):
+            connection = self.active_connections.get(connection_id)
+            if connection is None or connection.user is None:
+                continue
+            self.revoked += 1
+            connection.stop()
+            self._run_in_background(
+                self._close_in_background(
+                    connection, status.WS_1008_POLICY_VIOLATION, "Usuário desativado"
+                )
+            )
+
+    def _apply_chat_bound(self, message: BrokerMessage) -> None:
+        if message.target_id is None:
+            return
+        now = time.monotonic()
+        self._remote_binds[message.target_id] = now
+        self._remote_binds.move_to_end(message.target_id)
+        # Um bind mais antigo que a carência não decide mais nenhum cancelamento
+        while self._remote_binds:
+            chat_id, bound_at = next(iter(self._remote_binds.items()))
+            if now - bound_at <= settings.WS_DISCONNECT_GRACE_SECONDS:
+                break
+            del self._remote_binds[chat_id]
+
+    def _get_target_connection_ids(self, message: BrokerMessage) -> Iterable[int]:
+        if message.target == "user" and message.target_id is not None:
+            return self._by_user.get(message.target_id, ())
+        if message.target == "chat" and message.target_id is not None:
+            return self._by_chat.get(message.target_id, ())
+        if message.target == "broadcast":
+            return self.active_connections
+        return ()
+
+    def _fan_out(
+        self, message: BrokerMessage, exclude: ClientConnection | None = None
+    ) -> int:
+        # A mensagem já vem serializada e aqui só se enfileira: as tarefas
+        # escritoras de cada conexão enviam em paralelo
+        sent = 0
+        for connection_id in list(self._get_target_connection_ids(message)):
+            connection = self.active_connections.get(connection_id)
+            if connection is None or connection is exclude:
+                continue
+            if self._send(connection, message.text):
+                sent += 1
+        return sent
+
+    def _send(self, connection: ClientConnection, text: str) -> bool:
+        if connection.enqueue(text):
+            return True
+        if not connection.closed:
+            # Fila cheia com a política "disconnect": o cliente não acompanha
+            self.slow_disconnects += 1
+            connection.stop()
+            self._run_in_background(
+                self._close_in_background(
+                    connection, status.WS_1008_POLICY_VIOLATION, "Cliente lento demais"
+                )
+            )
+        return False
+
+    def _run_in_background(self, coroutine: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _close_in_background(
+        self, connection: ClientConnection, code: int, reason: str
+    ) -> None:
+        await connection.close(code, reason)
+        self.disconnect(connection)
+
 
-    async def broadcast(self, message: str) -> None:
-        for connection in self.active_connections:
-            await connection.send_text(message)
+def _discard_index(index: dict[int, set[int]], key: int, connection_id: int) -> None:
+    connection_ids = index.get(key)
+    if connection_ids is None:
+        return
+    connection_ids.discard(connection_id)
+    if not connection_ids:
+        del index[key]
@@ -7,6 +7,7 @@ from src.schemas.knowledge_base import (
     GetKnowledgeBaseResponse,
     GetKnowledgeBaseMetadataResponse,
 )
+from src.modules.connection_manager import ConnectionManager
 from src.database.models import KnowledgeBase
 from src.schemas.basic_response import BasicResponse
 from io import StringIO
@@ -44,13 +45,16 @@ class UploadKnowledgeBase:
                 questions.append(question.strip())
                 answers.append(answer.strip())
 
+        data = {"questions": questions, "answers": answers}
         kb = KnowledgeBase(
             name=self.name,
-            data=json.dumps({"questions": questions, "answers": answers}),
+            data=json.dumps(data),
+            version=KnowledgeBase.compute_version(data),
         )
         self.session.add(kb)
         self.session.commit()
         self.session.refresh(kb)
+        ConnectionManager().ai_cache_changed("knowledge_base", kb.id)
 
         return PostKnowledgeBaseResponse(id=kb.id, name=kb.name)
 
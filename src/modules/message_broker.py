@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Literal
+from src.database.get_db import engine
+from src.settings import Settings
+
+settings = Settings()
+
+logger = logging.getLogger(__name__)
+
+# Limite do payload de NOTIFY no PostgreSQL
+NOTIFY_MAX_BYTES = 7999
+
+# "user_changed" não vai aos sockets: avisa os workers que um usuário foi
+# alterado ou desativado (text = "updated" ou "deactivated"). "chat_bound"
+# também não: avisa que uma conexão de outro worker passou a ouvir o chat.
+# "ai_cache_changed" descarta os caches de IA (text = agent, knowledge_base
+# ou chat)
+BrokerTarget = Literal[
+    "broadcast", "user", "chat", "user_changed", "chat_bound", "ai_cache_changed"
+]
+
+
+@dataclass(frozen=True)
+class BrokerMessage:
+    target: BrokerTarget
+    target_id: int | None
+    # Mensagem já serializada, pronta para ir ao socket
+    text: str
+    origin: str
+
+
+# Entrega local; só enfileira nas conexões, por isso é síncrona
+BrokerHandler = Callable[[BrokerMessage], None]
+
+
+class MessageBroker(ABC):
+    # Entrega mensagens endereçadas a um usuário, chat ou a todos para os
+    # outros workers. Cada worker entrega localmente o que ele mesmo publica e
+    # ignora o eco das próprias mensagens
+    def __init__(self) -> None:
+        self.origin = uuid.uuid4().hex
+        self._handler: BrokerHandler | None = None
+        self.published = 0
+        self.received = 0
+        self.failures = 0
+
+    async def start(self, handler: BrokerHandler) -> None:
+        self._handler = handler
+
+    @abstractmethod
+    async def publish(self, message: BrokerMessage) -> None: ...
+
+    async def close(self) -> None:
+        self._handler = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "published": self.published,
+            "received": self.received,
+            "failures": self.failures,
+        }
+
+    def _deliver(self, message: BrokerMessage) -> None:
+        if message.origin == self.origin or self._handler is None:
+            return
+        self.received += 1
+        try:
+            self._handler(message)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Falha ao entregar mensagem do broker: {e}")
+
+
+class InProcessBroker(MessageBroker):
+    # Um único worker: não há ninguém para avisar
+    async def publish(self, message: BrokerMessage) -> None:
+        self.published += 1
+
+
+class PostgresBroker(MessageBroker):
+    # LISTEN/NOTIFY numa conexão dedicada, fora do pool. O socket da conexão é
+    # observado pelo event loop, então receber não ocupa threads. A publicação
+    # usa outra conexão e uma única thread para manter a ordem das mensagens
+    def __init__(self, channel: str) -> None:
+        super().__init__()
+        self._channel = channel
+        self._listen_connection: Any = None
+        self._publish_connection: Any = None
+        self._publisher = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="broker-publish"
+        )
+        self._listener: asyncio.Task[None] | None = None
+        self._lost: asyncio.Event | None = None
+
+    async def start(self, handler: BrokerHandler) -> None:
+        await super().start(handler)
+        self._listener = asyncio.create_task(self._listen_forever())
+
+    async def publish(self, message: BrokerMessage) -> None:
+        payload = json.dumps(asdict(message), ensure_ascii=False)
+        if len(payload.encode()) > NOTIFY_MAX_BYTES:
+            self.failures += 1
+            logger.warning(
+                f"Mensagem para {message.target} {message.target_id} excede o "
+                "limite do NOTIFY e foi entregue só neste worker"
+            )
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._publisher, self._notify, payload
+            )
+            self.published += 1
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Falha ao publicar no canal {self._channel}: {e}")
+
+    async def close(self) -> None:
+        await super().close()
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        self._publisher.shutdown(wait=True)
+        for connection in (self._listen_connection, self._publish_connection):
+            if connection is not None:
+                connection.close()
+        self._listen_connection = None
+        self._publish_connection = None
+
+    def _connect(self) -> Any:
+        # Conexão do driver tirada do pool para não prender uma vaga dele
+        pooled = engine.raw_connection()
+        connection: Any = pooled.driver_connection
+        pooled.detach()
+        connection.autocommit = True
+        return connection
+
+    def _notify(self, payload: str) -> None:
+        if self._publish_connection is None or self._publish_connection.closed:
+            self._publish_connection = self._connect()
+        try:
+            with self._publish_connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", (self._channel, payload))
+        except Exception:
+            self._publish_connection.close()
+            self._publish_connection = None
+            raise
+
+    async def _listen_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self._listen_connection = await loop.run_in_executor(
+                    self._publisher, self._connect
+                )
+                with self._listen_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self._channel}"')
+                self._lost = asyncio.Event()
+                fd = self._listen_connection.fileno()
+                loop.add_reader(fd, self._on_readable)
+                try:
+                    await self._lost.wait()
+                finally:
+                    loop.remove_reader(fd)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Falha ao escutar o canal {self._channel}: {e}")
+            if self._listen_connection is not None:
+                self._listen_connection.close()
+                self._listen_connection = None
+            self.failures += 1
+            # Mensagens publicadas enquanto a conexão estava caída se perdem
+            await asyncio.sleep(settings.WS_BROKER_RECONNECT_SECONDS)
+
+    def _on_readable(self) -> None:
+        try:
+            self._listen_connection.poll()
+        except Exception as e:
+            logger.warning(f"Conexão do canal {self._channel} caiu: {e}")
+            if self._lost:
+                self._lost.set()
+            return
+        notifies = self._listen_connection.notifies
+        while notifies:
+            notify = notifies.pop(0)
+            try:
+                message = BrokerMessage(**json.loads(notify.payload))
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Mensagem inválida no canal {self._channel}: {e}")
+                continue
+            self._deliver(message)
+
+
+def create_broker() -> MessageBroker:
+    if settings.WS_BROKER == "postgres":
+        return PostgresBroker(settings.WS_BROKER_CHANNEL)
+    if settings.WS_BROKER == "memory":
+        return InProcessBroker()
+    raise ValueError(f"WS_BROKER inválido: {settings.WS_BROKER}")
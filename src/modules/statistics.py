@@ -1,9 +1,27 @@
 from datetime import datetime
+from src.ai.admission import AdmissionController
+from src.ai.response_cache import ResponseCache
+from src.ai.single_flight import UpstreamSingleFlight
+from src.ai.upstream_router import UpstreamRouter
+from src.ai.chat_resolution import ChatResolutionCache
+from src.ai.usage_tracker import usage_writer
+from src.database.chat_history_writer import chat_history_writer
+from src.modules.connection_manager import ConnectionManager
 from src.schemas.statistics import (
+    AdmissionStatisticsResponse,
+    AiRuntimeStatisticsResponse,
+    BatchWriterStatisticsResponse,
+    ChatResolutionStatisticsResponse,
+    ConnectionStatisticsResponse,
+    CoalescingStatisticsResponse,
     GeneralStatisticsResponse,
     GeneralStatisticsRequest,
     UserInteractionsRequest,
     UserInteractionsResponse,
+    ResponseCacheStatisticsResponse,
+    UpstreamStatisticsResponse,
+    UsageStatisticsRequest,
+    UsageStatisticsResponse,
 )
 from src.schemas.basic_response import BasicResponse
 from sqlalchemy.orm import Session
@@ -152,4 +170,134 @@ class UserInteractions:
             for row in result
         ]
 
-        return response
\ No newline at end of file
+        return response
+
+
+class AiRuntimeStatistics:
+    def execute(self) -> BasicResponse[AiRuntimeStatisticsResponse]:
+        return BasicResponse(
+            data=AiRuntimeStatisticsResponse(
+                response_cache=ResponseCacheStatisticsResponse.model_validate(
+                    ResponseCache().stats()
+                ),
+                coalescing=CoalescingStatisticsResponse.model_validate(
+                    UpstreamSingleFlight().stats()
+                ),
+                upstream=UpstreamStatisticsResponse.model_validate(
+                    UpstreamRouter().stats()
+                ),
+                admission=AdmissionStatisticsResponse.model_validate(
+                    AdmissionController().stats()
+                ),
+                usage_writer=BatchWriterStatisticsResponse.model_validate(
+                    usage_writer.stats()
+                ),
+                history_writer=BatchWriterStatisticsResponse.model_validate(
+                    chat_history_writer.stats()
+                ),
+                connections=ConnectionStatisticsResponse.model_validate(
+                    ConnectionManager().stats()
+                ),
+                chat_resolution=ChatResolutionStatisticsResponse.model_validate(
+                    ChatResolutionCache().stats()
+                ),
+            )
+        )
+
+
+# Dimensão -> (coluna de agrupamento, join para o nome, coluna do nome)
+USAGE_DIMENSIONS = {
+    "agents": ("u.agent_id", "LEFT JOIN agent g ON g.id = u.agent_id", "g.name"),
+    "knowledge-bases": (
+        "u.knowledge_base_id",
+        "LEFT JOIN knowledge_base g ON g.id = u.knowledge_base_id",
+        "g.name",
+    ),
+    "users": ("u.user_id", 'LEFT JOIN "user" g ON g.id = u.user_id', "g.name"),
+    "chats": ("u.chat_id", "", "CAST(NULL AS VARCHAR)"),
+}
+
+
+class UsageStatistics:
+    def __init__(
+        self, session: Session, dimension: str, params: UsageStatisticsRequest
+    ) -> None:
+        self._session = session
+        self._dimension = dimension
+        self._params = params
+
+    def execute(self) -> BasicResponse[list[UsageStatisticsResponse]]:
+        try:
+            return BasicResponse(data=self._get_usage())
+        except Exception as e:
+            raise HTTPException(
+                detail=f"Erro ao buscar o consumo: {e}.",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+    def _get_usage(self) -> list[UsageStatisticsResponse]:
+        group_column, name_join, name_column = USAGE_DIMENSIONS[self._dimension]
+        query = text(f"""
+            SELECT
+                {group_column} AS id,
+                {name_column} AS name,
+                COUNT(*) FILTER (WHERE u.source <> 'summary') AS turns,
+                COUNT(*) FILTER (WHERE u.source = 'llm') AS llm_calls,
+                COUNT(*) FILTER (
+                    WHERE u.source NOT IN ('llm', 'cancelled', 'summary')
+                ) AS cache_hits,
+                COUNT(*) FILTER (WHERE u.source = 'cancelled') AS cancelled,
+                COUNT(*) FILTER (WHERE u.source = 'summary') AS summaries,
+                COALESCE(SUM(u.prompt_tokens), 0) AS prompt_tokens,
+                COALESCE(SUM(u.completion_tokens), 0) AS completion_tokens,
+                AVG(u.prompt_tokens) FILTER (WHERE u.source = 'llm') AS avg_prompt_tokens,
+                AVG(u.upstream_ms) FILTER (WHERE u.source <> 'summary') AS avg_upstream_ms,
+                PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY u.upstream_ms)
+                    FILTER (WHERE u.source <> 'summary') AS p95_upstream_ms,
+                AVG(u.queue_wait_ms) FILTER (WHERE u.source <> 'summary') AS avg_queue_wait_ms,
+                AVG(u.total_ms) FILTER (WHERE u.source <> 'summary') AS avg_total_ms
+            FROM
+                chat_usage u
+            {name_join}
+            WHERE
+                (:start_date IS NULL OR u.created_at >= CAST(:start_date AS TIMESTAMP))
+                AND (:end_date IS NULL OR u.created_at <= CAST(:end_date AS TIMESTAMP))
+                AND (:agent_id IS NULL OR u.agent_id = :agent_id)
+            GROUP BY 1, 2
+            ORDER BY prompt_tokens DESC
+            LIMIT :limit
+        """)
+        result = self._session.execute(
+            query,
+            {
+                "start_date": self._params.start_date,
+                "end_date": self._params.end_date,
+                "agent_id": self._params.agent_id,
+                "limit": self._params.limit,
+            },
+        ).fetchall()
+        return [
+            UsageStatisticsResponse(
+                id=row.id,
+                name=row.name,
+                turns=row.turns,
+                llm_calls=row.llm_calls,
+                cache_hits=row.cache_hits,
+                cache_hit_ratio=row.cache_hits / row.turns if row.turns else 0.0,
+                cancelled=row.cancelled,
+                summaries=row.summaries,
+                prompt_tokens=row.prompt_tokens,
+                completion_tokens=row.completion_tokens,
+                total_tokens=row.prompt_tokens + row.completion_tokens,
+                avg_prompt_tokens=_to_float(row.avg_prompt_tokens),
+                avg_upstream_ms=_to_float(row.avg_upstream_ms),
+                p95_upstream_ms=_to_float(row.p95_upstream_ms),
+                avg_queue_wait_ms=_to_float(row.avg_queue_wait_ms),
+                avg_total_ms=float(row.avg_total_ms or 0),
+            )
+            for row in result
+        ]
+
+
+def _to_float(value: Any) -> float | None:
+    return float(value) if value is not None else None
@@ -4,6 +4,7 @@ from sqlalchemy import select, update
 from src.constants import Role
 from src.auth.auth_utils import Auth
 from src.database.models import Agent, User
+from src.modules.connection_manager import ConnectionManager
 from src.schemas.basic_response import BasicResponse
 from src.schemas.user import GetUserResponse, PostUser, PutUserRequest
 from fastapi import HTTPException, status
@@ -143,6 +144,8 @@ class UpdateUser:
             self._get_selected_agents()
             self._update_user()
             self._session.commit()
+            if self._user:
+                ConnectionManager().user_changed(self._user.id)
             return BasicResponse()
         except HTTPException as e:
             raise e
@@ -189,6 +192,7 @@ class DeactivateUser:
         try:
             self._deactivate_user()
             self._session.commit()
+            ConnectionManager().user_changed(self._user_id, deactivated=True)
             return BasicResponse()
         except Exception as e:
             raise HTTPException(
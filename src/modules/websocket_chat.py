@@ -1,111 +1,398 @@
+import asyncio
+import time
+from concurrent.futures import Future
 from datetime import datetime
+from typing import Callable
 from fastapi import WebSocketException, status
-from sqlalchemy import select
 from sqlalchemy.orm import Session
-from src.ai.ai_service import GeminiComunicationHandler
-from src.database.models import Agent, Chat, ChatHistory, KnowledgeBase
-from src.schemas.ai import AiResponse
+from src.ai.ai_service import DeltaCallback, GeminiComunicationHandler, UpstreamUsage
+from src.ai.chat_resolution import (
+    AgentSnapshot,
+    ChatResolution,
+    KnowledgeBaseHandle,
+    get_chat_resolution,
+)
+from src.ai.conversation_memory import ConversationMemory
+from src.ai.conversation_summary import ConversationSummarizer
+from src.ai.faq_retrieval import FaqIndex, FaqIndexRegistry
+from src.ai.prompt_cache import SystemPromptCache
+from src.ai.resilience import UpstreamUnavailableError
+from src.ai.response_cache import (
+    ResponseCache,
+    ResponseCacheKey,
+    build_response_cache_key,
+)
+from src.ai.usage_tracker import TurnUsage, to_milliseconds, usage_writer
+from src.database.chat_history_writer import ChatHistoryRow, chat_history_writer
+from src.database.get_db import run_in_session
+from src.database.models import ChatHistory, ChatSummary
+from src.schemas.ai import AiResponse, ChatHistoryFrame
 from src.schemas.chat_payload import ChatPayload
+from src.settings import Settings
+
+settings = Settings()
+
+# Gravado no histórico no lugar da resposta que o cliente interrompeu
+CANCELLED_ANSWER_MARKER = "[resposta interrompida]"
+
+# Chamado no event loop com o dono do chat, depois de conferir o acesso e
+# antes de consultar o provedor
+ResolvedCallback = Callable[[int | None], None]
 
 
 class AiHandler:
-    def __init__(self, session: Session, payload: ChatPayload) -> None:
-        self._session = session
+    def __init__(
+        self,
+        payload: ChatPayload,
+        on_delta: DeltaCallback | None = None,
+        memory: ConversationMemory | None = None,
+        resolutions: dict[int, ChatResolution] | None = None,
+        authenticated_user_id: int | None = None,
+        on_resolved: ResolvedCallback | None = None,
+    ) -> None:
         self._payload = payload
-        self._knowledge_base: KnowledgeBase | None = None
-        self._agent: Agent | None = None
+        self._authenticated_user_id = authenticated_user_id
+        self._on_delta = on_delta
+        self._on_resolved = on_resolved
+        self._memory = memory or ConversationMemory(settings.AI_HISTORY_TOKEN_BUDGET)
+        # Resoluções já usadas nesta conexão, na frente do cache do processo
+        self._resolutions = resolutions if resolutions is not None else {}
+        self._knowledge_base: KnowledgeBaseHandle | None = None
+        self._agent: AgentSnapshot | None = None
+        self._faq_index: FaqIndex | None = None
         self._ai_response: AiResponse | None = None
+        self._user_message_id: int | None = None
+        self._user_message_write: Future[int] | None = None
+        self._agent_id: int | None = None
+        self._user_id: int | None = None
+        self._answer_source = "llm"
+        self._cache_key: ResponseCacheKey | None = None
+        self._stored_answer: str | None = None
+        self._system_prompt: str | None = None
+        self._upstream_usage: UpstreamUsage | None = None
+        self._upstream: GeminiComunicationHandler | None = None
+        self._started_at = time.perf_counter()
+
+    @property
+    def user_id(self) -> int | None:
+        return self._user_id
 
-    def execute(self) -> AiResponse:
+    async def execute(self) -> AiResponse:
+        self._started_at = time.perf_counter()
         try:
-            with self._session as session:
-                self._verify_chat_exists(session)
-                self._format_user_message()
-                self._add_user_message_to_history(session)
-                self._load_knowledge_base(session)
-                self._get_agent(session)
-                self._send_message_to_ai()
-                if not self._ai_response:
-                    raise WebSocketException(
-                        code=status.WS_1011_INTERNAL_ERROR,
-                        reason="Erro ao consultar o agente",
-                    )
-                self._add_ai_response_to_history(session)
-                return self._ai_response
+            # Os passos de banco rodam no pool de threads, cada um com a própria
+            # sessão; nenhuma conexão fica presa enquanto o provedor responde
+            await run_in_session(self._prepare_turn)
+            if self._on_resolved:
+                self._on_resolved(self._user_id)
+            # A pergunta é gravada em paralelo com a chamada ao provedor
+            self._add_user_message_to_history()
+            await self._send_message_to_ai()
+            if not self._ai_response:
+                raise WebSocketException(
+                    code=status.WS_1011_INTERNAL_ERROR,
+                    reason="Erro ao consultar o agente",
+                )
+            self._record_usage()
+            ai_message_id = await self._add_ai_response_to_history()
+            self._ai_response.message_id = ai_message_id
+            self._append_turn_to_memory(ai_message_id)
+            self._schedule_summary()
+            return self._ai_response
+        except asyncio.CancelledError:
+            self._record_cancelled_turn()
+            raise
+        except UpstreamUnavailableError as e:
+            raise WebSocketException(
+                code=status.WS_1013_TRY_AGAIN_LATER,
+                reason=str(e),
+            )
         except Exception as e:
             raise WebSocketException(
                 code=status.WS_1011_INTERNAL_ERROR,
                 reason=f"Erro ao consultar o agente: {e}",
             )
 
-    def _verify_chat_exists(self, session: Session) -> None:
-        if not Chat.get_chat_by_id(session, self._payload.chat_id):
+    def _prepare_turn(self, session: Session) -> None:
+        self._resolve_chat(session)
+        self._format_user_message()
+        self._load_conversation_history(session)
+        self._load_faq_index(session)
+        self._prepare_answer()
+
+    def _resolve_chat(self, session: Session) -> None:
+        chat_id = self._payload.chat_id
+        resolution = get_chat_resolution(session, chat_id, self._resolutions)
+        if not resolution:
             raise WebSocketException(
-                reason=f"Chat com o id {self._payload.chat_id} não existe!",
+                reason=f"Chat com o id {chat_id} não existe!",
                 code=status.WS_1003_UNSUPPORTED_DATA,
             )
+        if not resolution.belongs_to(self._authenticated_user_id):
+            raise WebSocketException(
+                reason="Você não possui acesso a esse chat",
+                code=status.WS_1008_POLICY_VIOLATION,
+            )
+        if not resolution.knowledge_base:
+            raise WebSocketException(
+                reason="Não foi possível encontrar a base de conhecimento do agente!",
+                code=status.WS_1013_TRY_AGAIN_LATER,
+            )
+        self._user_id = resolution.user_id
+        self._agent = resolution.agent
+        self._agent_id = resolution.agent.id
+        self._knowledge_base = resolution.knowledge_base
 
     def _format_user_message(self) -> None:
         self._payload.message = self._payload.message.strip()
 
-    def _add_user_message_to_history(self, session: Session) -> None:
-        ChatHistory.add_chat_history(
+    def _load_conversation_history(self, session: Session) -> None:
+        if self._memory.is_loaded(self._payload.chat_id):
+            return
+        chat_summary = ChatSummary.get_by_chat_id(session, self._payload.chat_id)
+        history = ChatHistory.get_recent_history(
             session,
             self._payload.chat_id,
-            self._payload.message,
-            True,
-            self._payload.message_date,
+            settings.AI_HISTORY_MAX_MESSAGES,
+            chat_summary.last_message_id if chat_summary else None,
+        )
+        self._memory.load(
+            self._payload.chat_id,
+            history,
+            chat_summary.summary if chat_summary else None,
         )
 
-    def _load_knowledge_base(self, session: Session) -> None:
-        query = (
-            select(KnowledgeBase)
-            .join(Chat, Chat.id == self._payload.chat_id)
-            .join(Agent, Agent.id == Chat.agent_id)
-            .where(KnowledgeBase.id == Agent.knowledge_base_id)
+    def _add_user_message_to_history(self) -> None:
+        self._user_message_write = chat_history_writer.submit(
+            ChatHistoryRow(
+                chat_id=self._payload.chat_id,
+                message=self._payload.message,
+                is_user_message=True,
+                message_date=self._payload.message_date,
+            )
         )
-        result = session.execute(query)
-        self._knowledge_base = result.scalars().first()
-        if not self._knowledge_base:
-            raise WebSocketException(
-                reason="Não foi possível encontrar a base de conhecimento do agente!",
-                code=status.WS_1013_TRY_AGAIN_LATER,
+
+    def _load_faq_index(self, session: Session) -> None:
+        # Monta o índice aqui, fora do event loop, quando a versão da base
+        # ainda não está em memória
+        knowledge_base = self._knowledge_base
+        if knowledge_base:
+            self._faq_index = FaqIndexRegistry.get_index(
+                knowledge_base.id,
+                knowledge_base.version,
+                lambda: knowledge_base.load_questions_and_answers(session),
             )
+            if self._agent and self._agent.faq_short_circuit_enabled:
+                self._faq_index.ensure_vectors()
 
-    def _get_agent(self, session: Session) -> None:
-        query = (
-            select(Agent)
-            .join(Chat, Chat.id == self._payload.chat_id)
-            .where(Agent.id == Chat.agent_id)
+    def _prepare_answer(self) -> None:
+        # Cache, atalho do FAQ e recorte do contexto percorrem o índice da base;
+        # numa base grande isso leva centenas de ms e por isso roda aqui, na
+        # thread de banco, e não no event loop
+        if not self._agent or not self._knowledge_base or self._faq_index is None:
+            return
+        self._cache_key = self._get_cache_key(self._agent, self._knowledge_base.version)
+        if self._cache_key:
+            cached_response = ResponseCache().get(self._cache_key)
+            if cached_response:
+                self._answer_source = "response_cache"
+                self._stored_answer = cached_response.answer
+                return
+        faq_answer = self._find_faq_answer(self._agent, self._faq_index)
+        if faq_answer:
+            self._answer_source = "faq"
+            self._stored_answer = faq_answer
+            return
+        self._system_prompt = self._build_system_prompt(
+            self._agent, self._knowledge_base, self._faq_index
         )
-        result = session.execute(query)
-        self._agent = result.scalars().first()
-        if not self._agent:
-            raise WebSocketException(
-                reason="Não foi possível encontrar o agente!",
-                code=status.WS_1013_TRY_AGAIN_LATER,
-            )
 
-    def _send_message_to_ai(self) -> None:
-        if self._agent and self._knowledge_base:
-            questions = list(self._knowledge_base.data["questions"])  # type: ignore[index]
-            answers = list(self._knowledge_base.data["answers"])  # type: ignore[index]
-            ai_answer, response_date = GeminiComunicationHandler(
+    async def _send_message_to_ai(self) -> None:
+        if self._stored_answer is not None:
+            await self._use_stored_answer(self._stored_answer)
+            return
+        if self._agent and self._system_prompt is not None:
+            handler = GeminiComunicationHandler(
                 self._agent,
                 self._payload.message,
-                questions,
-                answers,
-            ).execute()
+                self._system_prompt,
+                self._on_delta,
+                self._memory.get_messages(self._payload.chat_id),
+            )
+            self._upstream = handler
+            ai_answer, response_date = await handler.execute()
+            self._upstream_usage = handler.usage
+            if handler.usage.coalesced:
+                self._answer_source = "coalesced"
             self._ai_response = AiResponse(
                 answer=ai_answer, response_date=response_date
             )
+            if self._cache_key:
+                ResponseCache().set(self._cache_key, ai_answer, response_date)
 
-    def _add_ai_response_to_history(self, session: Session) -> None:
+    def _get_cache_key(
+        self, agent: AgentSnapshot, knowledge_base_version: str
+    ) -> ResponseCacheKey | None:
+        if not agent.response_cache_enabled:
+            return None
+        # A chave não considera a conversa: uma pergunta de continuação ("e
+        # quanto custa?") depende do que veio antes e não pode ser respondida
+        # (nem guardada) com a resposta de outra conversa
+        if self._memory.get_messages(self._payload.chat_id):
+            return None
+        return build_response_cache_key(
+            agent, knowledge_base_version, self._payload.message
+        )
+
+    def _find_faq_answer(self, agent: AgentSnapshot, faq_index: FaqIndex) -> str | None:
+        if not agent.faq_short_circuit_enabled:
+            return None
+        match = faq_index.match_question(self._payload.message)
+        if match is None:
+            return None
+        doc_id, similarity = match
+        if similarity < settings.AI_FAQ_SHORT_CIRCUIT_THRESHOLD:
+            return None
+        return faq_index.answers[doc_id]
+
+    async def _use_stored_answer(self, answer: str) -> None:
+        if self._on_delta:
+            await self._on_delta(answer)
+        self._ai_response = AiResponse(answer=answer, response_date=int(time.time()))
+
+    def _build_system_prompt(
+        self,
+        agent: AgentSnapshot,
+        knowledge_base: KnowledgeBaseHandle,
+        faq_index: FaqIndex,
+    ) -> str:
+        top_k = (
+            agent.faq_top_k if agent.faq_top_k is not None else settings.AI_FAQ_TOP_K
+        )
+        if top_k <= 0:
+            return SystemPromptCache().get_full_prompt(
+                agent, knowledge_base.id, knowledge_base.version, faq_index
+            )
+        token_budget = (
+            agent.faq_token_budget
+            if agent.faq_token_budget is not None
+            else settings.AI_FAQ_TOKEN_BUDGET
+        )
+        header = SystemPromptCache().get_header(
+            agent, knowledge_base.id, knowledge_base.version
+        )
+        return header + faq_index.select_context(
+            self._payload.message, top_k, token_budget
+        )
+
+    async def _add_ai_response_to_history(self) -> int | None:
+        # A resposta só é confirmada ao cliente depois do commit das duas linhas
+        if not self._ai_response or not self._user_message_write:
+            return None
+        ai_message_write = chat_history_writer.submit(
+            ChatHistoryRow(
+                chat_id=self._payload.chat_id,
+                message=self._ai_response.answer,
+                is_user_message=False,
+                message_date=datetime.fromtimestamp(self._ai_response.response_date),
+            )
+        )
+        user_message_id: int = await asyncio.wrap_future(self._user_message_write)
+        self._user_message_id = user_message_id
+        ai_message_id: int = await asyncio.wrap_future(ai_message_write)
+        return ai_message_id
+
+    def _append_turn_to_memory(self, ai_message_id: int | None) -> None:
         if self._ai_response:
-            ChatHistory.add_chat_history(
-                session,
+            self._memory.append(
                 self._payload.chat_id,
-                self._ai_response.answer,
-                False,
-                datetime.fromtimestamp(self._ai_response.response_date),
+                {"role": "user", "content": self._payload.message},
+                self._user_message_id,
+            )
+            self._memory.append(
+                self._payload.chat_id,
+                {"role": "assistant", "content": self._ai_response.answer},
+                ai_message_id,
+            )
+
+    def get_history_frames(self) -> list[ChatHistoryFrame]:
+        # As duas linhas do turno, para as outras conexões do mesmo chat
+        if (
+            not self._ai_response
+            or self._ai_response.message_id is None
+            or self._user_message_id is None
+        ):
+            return []
+        return [
+            ChatHistoryFrame(
+                chat_id=self._payload.chat_id,
+                message_id=self._user_message_id,
+                message=self._payload.message,
+                is_user_message=True,
+                message_date=int(self._payload.message_date.timestamp()),
+            ),
+            ChatHistoryFrame(
+                chat_id=self._payload.chat_id,
+                message_id=self._ai_response.message_id,
+                message=self._ai_response.answer,
+                is_user_message=False,
+                message_date=self._ai_response.response_date,
+            ),
+        ]
+
+    def _record_cancelled_turn(self) -> None:
+        # Cliente desconectou ou mandou "cancel": a chamada ao provedor já foi
+        # abortada; fica no histórico o trecho enviado com a marca de
+        # interrupção, sem esperar o commit
+        if self._user_message_write is None or self._ai_response is not None:
+            return
+        partial_answer = self._upstream.partial_answer if self._upstream else ""
+        answer = f"{partial_answer}\n\n{CANCELLED_ANSWER_MARKER}".lstrip()
+        chat_history_writer.submit(
+            ChatHistoryRow(
+                chat_id=self._payload.chat_id,
+                message=answer,
+                is_user_message=False,
+                message_date=datetime.now(),
+            )
+        )
+        self._memory.append(
+            self._payload.chat_id, {"role": "user", "content": self._payload.message}
+        )
+        self._memory.append(
+            self._payload.chat_id, {"role": "assistant", "content": answer}
+        )
+        self._answer_source = "cancelled"
+        if self._upstream:
+            self._upstream_usage = self._upstream.usage
+        self._record_usage()
+
+    def _record_usage(self) -> None:
+        if self._agent_id is None or self._user_id is None:
+            return
+        usage = self._upstream_usage or UpstreamUsage()
+        usage_writer.add(
+            TurnUsage(
+                chat_id=self._payload.chat_id,
+                user_id=self._user_id,
+                agent_id=self._agent_id,
+                knowledge_base_id=(
+                    self._knowledge_base.id if self._knowledge_base else None
+                ),
+                source=self._answer_source,
+                streamed=self._on_delta is not None,
+                prompt_tokens=usage.prompt_tokens or 0,
+                completion_tokens=usage.completion_tokens or 0,
+                tokens_estimated=usage.tokens_estimated,
+                upstream_ms=to_milliseconds(usage.upstream_seconds),
+                queue_wait_ms=to_milliseconds(usage.queue_wait_seconds),
+                total_ms=round((time.perf_counter() - self._started_at) * 1000),
+                created_at=datetime.now(),
+            )
+        )
+
+    def _schedule_summary(self) -> None:
+        if self._agent_id is not None:
+            ConversationSummarizer.schedule(
+                self._payload.chat_id, self._agent_id, self._memory
             )
@@ -0,0 +1,256 @@
+import asyncio
+import functools
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+from fastapi import WebSocketException, status
+from pydantic import ValidationError
+from src.ai.chat_resolution import ChatResolution
+from src.auth.auth_utils import Auth
+from src.ai.conversation_memory import ConversationMemory
+from src.modules.chat_replay import ChatReplay
+from src.modules.connection_manager import ClientConnection, ConnectionManager
+from src.modules.websocket_chat import AiHandler
+from src.schemas.ai import (
+    AiAnswer,
+    ChatCancelled,
+    ChatError,
+    ConnectionAuthenticated,
+)
+from src.schemas.chat_payload import (
+    AuthPayload,
+    CancelPayload,
+    ChatPayload,
+    ResumePayload,
+)
+from src.settings import Settings
+
+settings = Settings()
+
+logger = logging.getLogger(__name__)
+
+# Referência às tasks que cancelam turnos de conexões já fechadas
+_abandoned_sessions: set["asyncio.Task[None]"] = set()
+
+
+class ChatConnectionSession:
+    # Vários chats numa mesma conexão: cada quadro traz o chat_id, os turnos de
+    # chats diferentes correm em paralelo e os do mesmo chat ficam em fila. Um
+    # erro num chat vira um quadro "error" e a conexão segue aberta; nos quadros
+    # sem "type" (formato antigo) o erro fecha a conexão, como antes
+    def __init__(self, connection: ClientConnection) -> None:
+        self._connection = connection
+        self._memory = ConversationMemory(settings.AI_HISTORY_TOKEN_BUDGET)
+        self._resolutions: dict[int, ChatResolution] = {}
+        self._turns: dict[int, list[asyncio.Task[None]]] = {}
+        self._in_flight = 0
+
+    async def handle(self, data: Any) -> None:
+        if not isinstance(data, dict):
+            raise _invalid_data()
+        try:
+            frame_type = data.get("type")
+            if frame_type == "auth":
+                await self._authenticate(AuthPayload(**data).token)
+                return
+            self._check_token()
+            if frame_type == "cancel":
+                await self.cancel(CancelPayload(**data).chat_id)
+            elif frame_type == "resume":
+                resume = ResumePayload(**data)
+                self._start(resume.chat_id, lambda: self._resume(resume))
+            elif frame_type in ("message", None):
+                payload = ChatPayload(**data, message_date=datetime.now())
+                legacy = frame_type is None
+                self._start(
+                    payload.chat_id,
+                    lambda: self._answer(payload, legacy),
+                    legacy,
+                )
+            else:
+                raise _invalid_data()
+        except ValidationError:
+            raise _invalid_data()
+
+    async def cancel(self, chat_id: int) -> None:
+        if self._cancel_turns(chat_id):
+            await ConnectionManager().send_frame(
+                ChatCancelled(chat_id=chat_id).model_dump(), self._connection
+            )
+
+    def close(self) -> None:
+        # A conexão caiu: os turnos em andamento continuam durante a carência
+        # para quem retomar o chat (resume) receber a resposta. Depois dela só
+        # são cancelados os turnos de chats que ninguém voltou a ouvir, nem
+        # neste worker nem em outro (o bind é avisado pelo broker)
+        if not self._turns:
+            return
+        task = asyncio.create_task(self._cancel_abandoned_turns(time.monotonic()))
+        _abandoned_sessions.add(task)
+        task.add_done_callback(_abandoned_sessions.discard)
+
+    async def _cancel_abandoned_turns(self, closed_at: float) -> None:
+        await asyncio.sleep(settings.WS_DISCONNECT_GRACE_SECONDS)
+        for chat_id in list(self._turns):
+            if not ConnectionManager().has_chat_connections(chat_id, closed_at):
+                self._cancel_turns(chat_id)
+
+    def _cancel_turns(self, chat_id: int) -> bool:
+        tasks = self._turns.pop(chat_id, [])
+        for task in tasks:
+            task.cancel()
+        return bool(tasks)
+
+    async def _authenticate(self, token: str) -> None:
+        # Novo token para a mesma conexão: só o mesmo usuário pode renová-lo
+        current_user = self._connection.user
+        if current_user is None:
+            return
+        user, claims = await Auth.authenticate_token(token)
+        if user.id != current_user.id:
+            raise WebSocketException(
+                code=status.WS_1008_POLICY_VIOLATION, reason="Credenciais inválidas"
+            )
+        ConnectionManager().authenticate(self._connection, user, claims)
+        await ConnectionManager().send_frame(
+            ConnectionAuthenticated(
+                user_id=user.id, expires_at=claims.expires_at
+            ).model_dump(),
+            self._connection,
+        )
+
+    def _check_token(self) -> None:
+        # O usuário fica guardado na conexão; só a expiração é conferida a cada
+        # quadro, sem ir ao banco
+        expires_at = self._connection.token_expires_at
+        if expires_at is not None and time.time() >= expires_at:
+            raise WebSocketException(
+                code=status.WS_1008_POLICY_VIOLATION, reason="Token expirado"
+            )
+
+    def _start(
+        self,
+        chat_id: int,
+        run: Callable[[], Awaitable[None]],
+        legacy: bool = False,
+    ) -> None:
+        if self._in_flight >= settings.WS_MAX_IN_FLIGHT_PER_CONNECTION:
+            error = WebSocketException(
+                code=status.WS_1013_TRY_AGAIN_LATER,
+                reason="Muitas mensagens em andamento nesta conexão",
+            )
+            run = functools.partial(self._report_error, chat_id, error)
+        chat_tasks = self._turns.setdefault(chat_id, [])
+        previous = chat_tasks[-1] if chat_tasks else None
+        task = asyncio.create_task(self._run(chat_id, previous, run, legacy))
+        chat_tasks.append(task)
+        self._in_flight += 1
+        task.add_done_callback(lambda done: self._finish(chat_id, done))
+
+    def _finish(self, chat_id: int, task: "asyncio.Task[None]") -> None:
+        self._in_flight -= 1
+        chat_tasks = self._turns.get(chat_id)
+        if chat_tasks and task in chat_tasks:
+            chat_tasks.remove(task)
+            if not chat_tasks:
+                del self._turns[chat_id]
+
+    async def _run(
+        self,
+        chat_id: int,
+        previous: "asyncio.Task[None] | None",
+        run: Callable[[], Awaitable[None]],
+        legacy: bool,
+    ) -> None:
+        # Turnos do mesmo chat em ordem: espera o anterior, qualquer que seja o
+        # resultado dele
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await run()
+        except asyncio.CancelledError:
+            raise
+        except WebSocketException as e:
+            if legacy:
+                await ConnectionManager().close(self._connection, e.code, e.reason)
+            else:
+                await self._report_error(chat_id, e)
+        except Exception as e:
+            if legacy:
+                await ConnectionManager().send_personal_message(
+                    f"Ocorreu um erro inesperado: {e}. Tente novamente.",
+                    self._connection,
+                )
+                await ConnectionManager().close(
+                    self._connection, status.WS_1000_NORMAL_CLOSURE
+                )
+            else:
+                await self._report_error(chat_id, e)
+
+    async def _answer(self, payload: ChatPayload, legacy: bool) -> None:
+        manager = ConnectionManager()
+        on_delta = None
+        if payload.stream:
+
+            async def on_delta(content: str) -> None:
+                await manager.send_stream_chunk(
+                    payload.chat_id, content, self._connection
+                )
+
+        # O chat é vinculado à conexão logo depois de conferido o acesso, antes
+        # da resposta: assim a conexão conta como ouvinte durante todo o turno
+        def on_resolved(user_id: int | None) -> None:
+            manager.bind(self._connection, payload.chat_id, user_id)
+
+        user = self._connection.user
+        handler = AiHandler(
+            payload,
+            on_delta,
+            self._memory,
+            self._resolutions,
+            user.id if user else None,
+            on_resolved,
+        )
+        ai_response = await handler.execute()
+        if payload.stream:
+            await manager.send_stream_end(
+                payload.chat_id, ai_response, self._connection
+            )
+        elif legacy:
+            await manager.send_personal_message(
+                ai_response.model_dump(), self._connection
+            )
+        else:
+            answer = AiAnswer(chat_id=payload.chat_id, **ai_response.model_dump())
+            await manager.send_personal_message(answer.model_dump(), self._connection)
+        # As outras conexões do chat (outro aparelho ou uma reconexão que chegou
+        # antes do fim da resposta) recebem as mensagens novas do turno
+        for frame in handler.get_history_frames():
+            await manager.send_to_chat(
+                payload.chat_id, frame.model_dump(), exclude=self._connection
+            )
+
+    async def _resume(self, payload: ResumePayload) -> None:
+        await ChatReplay(self._connection, payload, self._resolutions).execute()
+
+    async def _report_error(self, chat_id: int, error: Exception) -> None:
+        if isinstance(error, WebSocketException):
+            frame = ChatError(chat_id=chat_id, code=error.code, reason=error.reason)
+        else:
+            logger.warning(f"Erro no chat {chat_id}: {error}")
+            frame = ChatError(
+                chat_id=chat_id,
+                code=status.WS_1011_INTERNAL_ERROR,
+                reason=f"Ocorreu um erro inesperado: {error}. Tente novamente.",
+            )
+        await ConnectionManager().send_personal_message(
+            frame.model_dump(), self._connection
+        )
+
+
+def _invalid_data() -> WebSocketException:
+    return WebSocketException(
+        reason="Dados recebidos não estão de acordo com o esperado!",
+        code=status.WS_1003_UNSUPPORTED_DATA,
+    )
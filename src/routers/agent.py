@@ -45,6 +45,10 @@ async def post_agent(
     behavior: Optional[str] = Form(None),
     temperature: float = Form(...),
     top_p: float = Form(...),
+    faq_top_k: Optional[int] = Form(None, ge=1),
+    faq_token_budget: Optional[int] = Form(None, ge=1),
+    response_cache_enabled: bool = Form(True),
+    faq_short_circuit_enabled: bool = Form(False),
     image_id: int = Form(None),
     groups: Optional[List[int]] = Form(default_factory=list),
     knowledge_base_id: Optional[int] = Form(None),
@@ -67,6 +71,10 @@ async def post_agent(
         file,
         knowledge_base_name,
         True,
+        faq_top_k,
+        faq_token_budget,
+        response_cache_enabled,
+        faq_short_circuit_enabled,
     ).execute()
 
 
@@ -78,6 +86,15 @@ async def put_agent(
     behavior: Optional[str] = Form(None),
     temperature: float = Form(...),
     top_p: float = Form(...),
+    # Campos omitidos mantêm o valor atual do agente
+    faq_top_k: Optional[int] = Form(None, ge=1),
+    faq_token_budget: Optional[int] = Form(None, ge=1),
+    response_cache_enabled: Optional[bool] = Form(None),
+    faq_short_circuit_enabled: Optional[bool] = Form(None),
+    # Voltam faq_top_k / faq_token_budget ao padrão global (AI_FAQ_TOP_K /
+    # AI_FAQ_TOKEN_BUDGET); têm prioridade sobre o valor enviado
+    reset_faq_top_k: bool = Form(False),
+    reset_faq_token_budget: bool = Form(False),
     image_id: int = Form(None),
     groups: Optional[List[int]] = Form(default_factory=list),
     knowledge_base_id: Optional[int] = Form(None),
@@ -102,6 +119,12 @@ async def put_agent(
         enabled,
         file,
         knowledge_base_name,
+        faq_top_k,
+        faq_token_budget,
+        response_cache_enabled,
+        faq_short_circuit_enabled,
+        reset_faq_top_k,
+        reset_faq_token_budget,
     ).execute()
 
 
@@ -1,9 +1,17 @@
 from sqlalchemy.orm import Session
 from src.database.get_db import get_db
-from src.modules.statistics import GeneralStatistics, UserInteractions
+from src.modules.statistics import (
+    AiRuntimeStatistics,
+    GeneralStatistics,
+    UsageStatistics,
+    UserInteractions,
+)
 from src.schemas.statistics import (
+    AiRuntimeStatisticsResponse,
     GeneralStatisticsRequest,
     GeneralStatisticsResponse,
+    UsageStatisticsRequest,
+    UsageStatisticsResponse,
     UserInteractionsRequest,
     UserInteractionsResponse,
 )
@@ -28,3 +36,42 @@ def get_user_interactions(
     db: Session = Depends(get_db)
 ) -> list[UserInteractionsResponse]:
     return UserInteractions(db, params).execute()
+
+
+@router.get("/ai-runtime")
+async def get_ai_runtime_statistics() -> BasicResponse[AiRuntimeStatisticsResponse]:
+    # No event loop, que é quem altera as conexões e a fila de admissão: numa
+    # thread a leitura poderia pegar essas estruturas no meio de uma mudança
+    return AiRuntimeStatistics().execute()
+
+
+@router.get("/usage/agents")
+def get_usage_by_agent(
+    params: UsageStatisticsRequest = Depends(),
+    session: Session = Depends(get_db),
+) -> BasicResponse[list[UsageStatisticsResponse]]:
+    return UsageStatistics(session, "agents", params).execute()
+
+
+@router.get("/usage/knowledge-bases")
+def get_usage_by_knowledge_base(
+    params: UsageStatisticsRequest = Depends(),
+    session: Session = Depends(get_db),
+) -> BasicResponse[list[UsageStatisticsResponse]]:
+    return UsageStatistics(session, "knowledge-bases", params).execute()
+
+
+@router.get("/usage/users")
+def get_usage_by_user(
+    params: UsageStatisticsRequest = Depends(),
+    session: Session = Depends(get_db),
+) -> BasicResponse[list[UsageStatisticsResponse]]:
+    return UsageStatistics(session, "users", params).execute()
+
+
+@router.get("/usage/chats")
+def get_usage_by_chat(
+    params: UsageStatisticsRequest = Depends(),
+    session: Session = Depends(get_db),
+) -> BasicResponse[list[UsageStatisticsResponse]]:
+    return UsageStatistics(session, "chats", params).execute()
@@ -1,18 +1,16 @@
-from datetime import datetime
 from fastapi import (
     APIRouter,
-    Depends,
     WebSocket,
     WebSocketDisconnect,
     WebSocketException,
     status,
 )
-from src.database.get_db import get_db
-from src.modules.websocket_chat import AiHandler
+from src.auth.auth_utils import Auth
 from src.modules.connection_manager import ConnectionManager
-from src.schemas.chat_payload import ChatPayload
-from sqlalchemy.orm import Session
-from pydantic import ValidationError
+from src.modules.websocket_session import ChatConnectionSession
+from src.settings import Settings
+
+settings = Settings()
 
 router = APIRouter(prefix="/ws")
 
@@ -20,27 +18,24 @@ manager = ConnectionManager()
 
 
 @router.websocket("/chat")
-async def websocket_endpoint(
-    websocket: WebSocket, session: Session = Depends(get_db)
-) -> None:
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket) -> None:
+    # Autentica antes de aceitar: sem token válido o handshake é recusado
+    user, claims = await Auth.get_websocket_user(websocket) or (None, None)
+    connection = await manager.connect(websocket, user, claims)
+    session = ChatConnectionSession(connection)
     try:
         while True:
             data = await websocket.receive_json()
-            try:
-                payload = ChatPayload(**data, message_date=datetime.now())
-            except ValidationError:
-                raise WebSocketException(
-                    reason="Dados recebidos não estão de acordo com o esperado!",
-                    code=status.WS_1003_UNSUPPORTED_DATA,
-                )
-            ai_response = AiHandler(session, payload).execute()
-            await manager.send_personal_message(ai_response.model_dump(), websocket)
+            await session.handle(data)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except WebSocketException as we:
-        await websocket.close(code=we.code, reason=we.reason)
+        await manager.close(connection, we.code, we.reason)
     except Exception as e:
         await manager.send_personal_message(
-            f"Ocorreu um erro inesperado: {e}. Tente novamente.", websocket
+            f"Ocorreu um erro inesperado: {e}. Tente novamente.", connection
         )
+        await manager.close(connection, status.WS_1000_NORMAL_CLOSURE)
+    finally:
+        session.close()
+        manager.disconnect(connection)
@@ -18,6 +18,10 @@ class AgentResponse(BaseModel):
     behavior: str | None
     temperature: float
     top_p: float
+    faq_top_k: int | None = None
+    faq_token_budget: int | None = None
+    response_cache_enabled: bool = True
+    faq_short_circuit_enabled: bool = False
     image_id: int | None
     groups: Optional[List[int]] = Field(default_factory=lambda: [])
     knowledge_base_id: Optional[int]
@@ -34,6 +38,10 @@ class PostAgent(BaseModel):
     behavior: Optional[str] = None
     temperature: float = Field(default=0.5)
     top_p: float = Field(default=0.5)
+    faq_top_k: Optional[int] = Field(default=None, ge=1)
+    faq_token_budget: Optional[int] = Field(default=None, ge=1)
+    response_cache_enabled: bool = True
+    faq_short_circuit_enabled: bool = False
     groups: Optional[List[int]] = []
     knowledge_base_id: Optional[int]
     enabled: bool
@@ -1,6 +1,64 @@
+from typing import Literal
 from pydantic import BaseModel
 
 
 class AiResponse(BaseModel):
     answer: str
     response_date: int  # NOTE: UNIX TIMESTAMP
+    message_id: int | None = None
+
+
+class AiAnswer(AiResponse):
+    type: Literal["answer"] = "answer"
+    chat_id: int
+
+
+class AiStreamChunk(BaseModel):
+    type: Literal["chunk"] = "chunk"
+    chat_id: int
+    content: str
+
+
+class AiStreamEnd(BaseModel):
+    type: Literal["end"] = "end"
+    chat_id: int
+    answer: str
+    response_date: int  # NOTE: UNIX TIMESTAMP
+    message_id: int | None = None
+
+
+class ChatHistoryFrame(BaseModel):
+    type: Literal["history"] = "history"
+    chat_id: int
+    message_id: int
+    message: str
+    is_user_message: bool
+    message_date: int  # NOTE: UNIX TIMESTAMP
+
+
+class ChatResumed(BaseModel):
+    type: Literal["resumed"] = "resumed"
+    chat_id: int
+    last_message_id: int | None
+    replayed: int
+    # Havia mais mensagens que o limite: o cliente deve recarregar o histórico
+    truncated: bool
+
+
+class ChatCancelled(BaseModel):
+    type: Literal["cancelled"] = "cancelled"
+    chat_id: int
+
+
+class ChatError(BaseModel):
+    type: Literal["error"] = "error"
+    chat_id: int
+    code: int
+    reason: str
+
+
+class ConnectionAuthenticated(BaseModel):
+    type: Literal["authenticated"] = "authenticated"
+    user_id: int
+    # Timestamp em que o token expira; antes disso, envie {"type": "auth"}
+    expires_at: int
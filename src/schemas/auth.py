@@ -15,3 +15,9 @@ class CurrentUser(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class TokenClaims(BaseModel):
+    user_id: int
+    # Timestamp (segundos) em que o token expira
+    expires_at: int
@@ -1,8 +1,29 @@
 from datetime import datetime
+from typing import Literal
 from pydantic import BaseModel
 
 
 class ChatPayload(BaseModel):
+    # Sem "type" é o formato antigo, de um chat por conexão
+    type: Literal["message"] = "message"
     chat_id: int
     message: str
     message_date: datetime
+    stream: bool = False
+
+
+class ResumePayload(BaseModel):
+    type: Literal["resume"]
+    chat_id: int
+    last_message_id: int | None = None
+
+
+class CancelPayload(BaseModel):
+    type: Literal["cancel"]
+    chat_id: int
+
+
+class AuthPayload(BaseModel):
+    # Renova o token de uma conexão aberta antes que ele expire
+    type: Literal["auth"]
+    token: str
@@ -38,3 +38,129 @@ class UserInteractionsResponse(BaseModel):
     user_iteractions: int
     iteractions_with_agents: int
     agent_last_iteraction: Optional[datetime]
+
+
+class UsageStatisticsRequest(BaseModel):
+    start_date: str | None = None
+    end_date: str | None = None
+    agent_id: int | None = None
+    limit: int = 50
+
+
+class UsageStatisticsResponse(BaseModel):
+    id: int | None
+    name: str | None
+    turns: int
+    llm_calls: int
+    cache_hits: int
+    cache_hit_ratio: float
+    # Turnos interrompidos pelo cliente (desconexão ou "cancel")
+    cancelled: int
+    # Chamadas de resumo da conversa: entram nos tokens, não nos turnos
+    summaries: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    avg_prompt_tokens: float | None
+    avg_upstream_ms: float | None
+    p95_upstream_ms: float | None
+    avg_queue_wait_ms: float | None
+    avg_total_ms: float
+
+
+class ResponseCacheStatisticsResponse(BaseModel):
+    entries: int
+    size_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
+
+
+class CoalescingStatisticsResponse(BaseModel):
+    in_flight: int
+    leaders: int
+    coalesced: int
+    abandoned: int
+
+
+class UpstreamEndpointStatisticsResponse(BaseModel):
+    name: str
+    url: str
+    model: str
+    weight: float
+    state: str
+    consecutive_failures: int
+    times_opened: int
+    rejected: int
+    requests: int
+    failures: int
+    timeouts: int
+    in_flight: int
+    latency_ewma_ms: float
+    error_rate: float
+    health_score: float
+
+
+class UpstreamStatisticsResponse(BaseModel):
+    retries: int
+    rejected: int
+    hedged: int
+    hedge_wins: int
+    endpoints: list[UpstreamEndpointStatisticsResponse]
+
+
+class AdmissionStatisticsResponse(BaseModel):
+    queue_depth: int
+    in_flight: int
+    admitted: int
+    rejected: int
+    timed_out: int
+    avg_wait_ms: float
+    p95_wait_ms: float
+    max_wait_ms: float
+
+
+class BatchWriterStatisticsResponse(BaseModel):
+    pending: int
+    written: int
+    dropped: int
+    batches: int
+    failures: int
+
+
+class BrokerStatisticsResponse(BaseModel):
+    backend: str
+    published: int
+    received: int
+    failures: int
+
+
+class ConnectionStatisticsResponse(BaseModel):
+    connections: int
+    users: int
+    chats: int
+    queued: int
+    dropped: int
+    slow_disconnects: int
+    # Conexões fechadas porque o usuário foi desativado
+    revoked: int
+    broker: BrokerStatisticsResponse
+
+
+class ChatResolutionStatisticsResponse(BaseModel):
+    entries: int
+    hits: int
+    misses: int
+    invalidations: int
+
+
+class AiRuntimeStatisticsResponse(BaseModel):
+    response_cache: ResponseCacheStatisticsResponse
+    coalescing: CoalescingStatisticsResponse
+    upstream: UpstreamStatisticsResponse
+    admission: AdmissionStatisticsResponse
+    usage_writer: BatchWriterStatisticsResponse
+    history_writer: BatchWriterStatisticsResponse
+    connections: ConnectionStatisticsResponse
+    chat_resolution: ChatResolutionStatisticsResponse
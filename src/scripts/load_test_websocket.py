@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from src.auth.auth_utils import NO_AUTH, Auth
+from src.database.get_db import get_db
+from src.database.models import Agent, Chat, KnowledgeBase, User
+
+# Gerador de carga para /ws/chat. Usa os chats criados por populate_db (e, com
+# --chats, cria mais chats entre os usuários e agentes já existentes) e envia as
+# perguntas da base de conhecimento de cada agente, autenticado como o dono de
+# cada chat (o token é gerado com o SECRET_KEY local). Ex.: com o servidor LLM
+# simulado (src/scripts/stub_llm_server.py) rodando:
+#   python -m src.scripts.load_test_websocket --connections 50 --messages 20 --rate 100
+
+
+@dataclass
+class ScriptedChat:
+    chat_id: int
+    user_id: int
+    questions: list[str]
+
+
+@dataclass
+class LatencySummary:
+    count: int = 0
+    mean_ms: float = 0.0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    max_ms: float = 0.0
+
+
+@dataclass
+class LoadTestResult:
+    url: str
+    connections: int
+    stream: bool
+    target_rate: float
+    duration_seconds: float
+    sent: int
+    completed: int
+    errors: int
+    throughput_per_second: float
+    time_to_first_byte: LatencySummary
+    full_response: LatencySummary
+    error_samples: list[str] = field(default_factory=list)
+
+
+def summarize(samples: list[float]) -> LatencySummary:
+    if not samples:
+        return LatencySummary()
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        # Posto mais próximo: sempre um valor realmente observado
+        index = min(len(ordered) - 1, max(0, math.ceil(p * len(ordered)) - 1))
+        return ordered[index] * 1000
+
+    return LatencySummary(
+        count=len(ordered),
+        mean_ms=sum(ordered) / len(ordered) * 1000,
+        p50_ms=percentile(0.50),
+        p95_ms=percentile(0.95),
+        p99_ms=percentile(0.99),
+        max_ms=ordered[-1] * 1000,
+    )
+
+
+class LoadTestWebsocket:
+    def __init__(
+        self,
+        url: str,
+        connections: int,
+        messages_per_connection: int,
+        rate: float,
+        stream: bool,
+        chats: int,
+        response_timeout: float,
+    ) -> None:
+        self._url = url
+        self._connections = connections
+        self._messages_per_connection = messages_per_connection
+        self._rate = rate
+        self._stream = stream
+        self._chats = chats
+        self._response_timeout = response_timeout
+        self._scripted_chats: list[ScriptedChat] = []
+        self._send_slots = itertools.count()
+        self._started_at = 0.0
+        self._ttfb: list[float] = []
+        self._full: list[float] = []
+        self._sent = 0
+        self._errors = 0
+        self._error_samples: list[str] = []
+
+    async def execute(self) -> LoadTestResult:
+        with get_db() as session:
+            self._ensure_chats(session)
+            self._load_scripted_chats(session)
+        if not self._scripted_chats:
+            raise RuntimeError("Nenhum chat encontrado. Rode src.scripts.populate_db")
+        self._started_at = time.perf_counter()
+        await asyncio.gather(
+            *(self._run_connection(index) for index in range(self._connections))
+        )
+        return self._build_result(time.perf_counter() - self._started_at)
+
+    def _ensure_chats(self, session: Session) -> None:
+        existing = session.execute(select(Chat.id)).scalars().all()
+        missing = self._chats - len(existing)
+        if missing <= 0:
+            return
+        users = session.execute(select(User.id).order_by(User.id)).scalars().all()
+        agents = session.execute(select(Agent.id).order_by(Agent.id)).scalars().all()
+        if not users or not agents:
+            return
+        pairs = itertools.cycle(itertools.product(users, agents))
+        session.add_all(
+            Chat(user_id=user_id, agent_id=agent_id)
+            for user_id, agent_id in itertools.islice(pairs, missing)
+        )
+        session.commit()
+
+    def _load_scripted_chats(self, session: Session) -> None:
+        query = (
+            select(Chat.id, Chat.user_id, KnowledgeBase)
+            .join(Agent, Agent.id == Chat.agent_id)
+            .join(KnowledgeBase, KnowledgeBase.id == Agent.knowledge_base_id)
+            .where(Chat.enabled.is_(True))
+            .order_by(Chat.id)
+        )
+        for chat_id, user_id, knowledge_base in session.execute(query).all():
+            questions, _ = knowledge_base.get_questions_and_answers()
+            if questions:
+                self._scripted_chats.append(ScriptedChat(chat_id, user_id, questions))
+
+    def _get_url(self, scripted_chat: ScriptedChat) -> str:
+        if NO_AUTH:
+            return self._url
+        token = Auth.create_access_token(
+            {"sub": str(scripted_chat.user_id)}, user_roles=[]
+        )
+        separator = "&" if "?" in self._url else "?"
+        return f"{self._url}{separator}token={token}"
+
+    async def _run_connection(self, index: int) -> None:
+        scripted_chat = self._scripted_chats[index % len(self._scripted_chats)]
+        try:
+            async with connect(
+                self._get_url(scripted_chat), max_size=None
+            ) as websocket:
+                for turn in range(self._messages_per_connection):
+                    question = scripted_chat.questions[
+                        (index + turn) % len(scripted_chat.questions)
+                    ]
+                    await self._wait_for_send_slot()
+                    if not await self._send_and_measure(
+                        websocket, scripted_chat.chat_id, question
+                    ):
+                        return
+        except (OSError, ConnectionClosed, InvalidHandshake) as e:
+            self._record_error(f"conexão {index}: {e}")
+
+    async def _wait_for_send_slot(self) -> None:
+        # Agenda global: a n-ésima mensagem sai no máximo em n / rate segundos,
+        # somando todas as conexões. Cada conexão ainda espera a própria resposta
+        # antes de pegar o próximo horário, então com respostas lentas a taxa
+        # real fica abaixo da pedida
+        if self._rate <= 0:
+            return
+        slot = next(self._send_slots)
+        delay = self._started_at + slot / self._rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send_and_measure(
+        self, websocket: ClientConnection, chat_id: int, question: str
+    ) -> bool:
+        sent_at = time.perf_counter()
+        await websocket.send(
+            json.dumps(
+                {"chat_id": chat_id, "message": question, "stream": self._stream}
+            )
+        )
+        self._sent += 1
+        first_byte_at: float | None = None
+        try:
+            while True:
+                frame = json.loads(
+                    await asyncio.wait_for(websocket.recv(), self._response_timeout)
+                )
+                if not isinstance(frame, dict):
+                    # Erro inesperado: o servidor manda uma string e encerra a conexão
+                    self._record_error(str(frame))
+                    return False
+                frame_type = frame.get("type")
+                if frame_type is not None and frame.get("chat_id") != chat_id:
+                    continue
+                if frame_type in ("history", "resumed"):
+                    # Turnos de outras conexões do mesmo chat, não a resposta
+                    continue
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                if frame_type == "chunk":
+                    continue
+                if frame_type not in (None, "answer", "end"):
+                    self._record_error(f"chat {chat_id}: {frame}")
+                    return False
+                break
+        except asyncio.TimeoutError:
+            self._record_error(
+                f"chat {chat_id}: sem resposta em {self._response_timeout}s"
+            )
+            return False
+        except ConnectionClosed as e:
+            self._record_error(f"chat {chat_id}: conexão fechada ({e})")
+            return False
+        self._ttfb.append(first_byte_at - sent_at)
+        self._full.append(time.perf_counter() - sent_at)
+        return True
+
+    def _record_error(self, message: str) -> None:
+        self._errors += 1
+        if len(self._error_samples) < 10:
+            self._error_samples.append(message)
+
+    def _build_result(self, duration: float) -> LoadTestResult:
+        return LoadTestResult(
+            url=self._url,
+            connections=self._connections,
+            stream=self._stream,
+            target_rate=self._rate,
+            duration_seconds=duration,
+            sent=self._sent,
+            completed=len(self._full),
+            errors=self._errors,
+            throughput_per_second=len(self._full) / duration if duration else 0.0,
+            time_to_first_byte=summarize(self._ttfb),
+            full_response=summarize(self._full),
+            error_samples=self._error_samples,
+        )
+
+
+def print_report(result: LoadTestResult) -> None:
+    print(
+        f"{result.url} | conexões: {result.connections} | stream: {result.stream} | "
+        f"taxa alvo: {result.target_rate or 'sem limite'}/s"
+    )
+    print(
+        f"enviadas: {result.sent} | concluídas: {result.completed} | "
+        f"erros: {result.errors} | duração: {result.duration_seconds:.2f}s | "
+        f"vazão: {result.throughput_per_second:.1f}/s"
+    )
+    for label, summary in (
+        ("primeiro byte", result.time_to_first_byte),
+        ("resposta completa", result.full_response),
+    ):
+        print(
+            f"{label:>17}: p50 {summary.p50_ms:8.1f}ms | p95 {summary.p95_ms:8.1f}ms | "
+            f"p99 {summary.p99_ms:8.1f}ms | máx {summary.max_ms:8.1f}ms | "
+            f"média {summary.mean_ms:8.1f}ms"
+        )
+    for sample in result.error_samples:
+        print(f"  erro: {sample}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Teste de carga do /ws/chat")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/chat")
+    parser.add_argument("--connections", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=10, help="por conexão")
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="mensagens/s no total (0 = livre)"
+    )
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument(
+        "--chats", type=int, default=0, help="cria chats até ter pelo menos N"
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="saída em JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = asyncio.run(
+        LoadTestWebsocket(
+            url=args.url,
+            connections=args.connections,
+            messages_per_connection=args.messages,
+            rate=args.rate,
+            stream=args.stream,
+            chats=args.chats,
+            response_timeout=args.timeout,
+        ).execute()
+    )
+    if args.json:
+        output: dict[str, Any] = asdict(result)
+        print(json.dumps(output, indent=2, ensure_ascii=False))
+    else:
+        print_report(result)
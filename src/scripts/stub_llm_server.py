@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+import uvicorn
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# Servidor local compatível com /v1/chat/completions (OpenAI) para medir o
+# caminho do chat sem depender de um provedor pago. Uso:
+#   python -m src.scripts.stub_llm_server --port 8765 --latency-ms 400
+#   AI_API_URL=http://127.0.0.1:8765/v1/chat/completions
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+VOCABULARY = (
+    "acesso sistema senha suporte equipe chamado rede computador usuario conta "
+    "configuracao servidor arquivo permissao prazo politica empresa departamento "
+    "atendimento solicitacao procedimento documento cadastro aplicativo dados "
+    "seguranca backup impressora email portal relatorio"
+).split()
+
+
+@dataclass
+class StubLlmConfig:
+    latency_distribution: str = "lognormal"
+    latency_ms: float = 300.0
+    latency_jitter_ms: float = 150.0
+    tokens_per_second: float = 50.0
+    response_tokens: int = 60
+    error_429_rate: float = 0.0
+    error_500_rate: float = 0.0
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 300.0
+    retry_after_seconds: int = 1
+    seed: int | None = None
+
+
+class StubLlmBehavior:
+    def __init__(self, config: StubLlmConfig) -> None:
+        self._config = config
+        self._random = random.Random(config.seed)
+        self.requests = 0
+        self.errors_429 = 0
+        self.errors_500 = 0
+        self.timeouts = 0
+
+    def sample_latency(self) -> float:
+        # Tempo até o primeiro token, em segundos
+        mean = self._config.latency_ms / 1000
+        spread = self._config.latency_jitter_ms / 1000
+        distribution = self._config.latency_distribution
+        if distribution == "uniform":
+            latency = self._random.uniform(mean - spread, mean + spread)
+        elif distribution == "normal":
+            latency = self._random.gauss(mean, spread)
+        elif distribution == "lognormal":
+            # Mediana em `mean`; a cauda longa imita o p99 de provedores reais
+            sigma = math.log1p(spread / mean) if mean > 0 else 0.0
+            latency = mean * self._random.lognormvariate(0, sigma)
+        elif distribution == "exponential":
+            latency = self._random.expovariate(1 / mean) if mean > 0 else 0.0
+        else:
+            latency = mean
+        return max(0.0, latency)
+
+    def pick_failure(self) -> str | None:
+        roll = self._random.random()
+        for failure, rate in (
+            ("429", self._config.error_429_rate),
+            ("500", self._config.error_500_rate),
+            ("timeout", self._config.timeout_rate),
+        ):
+            if roll < rate:
+                return failure
+            roll -= rate
+        return None
+
+    def build_answer_tokens(
+        self, messages: list[dict[str, Any]], limit: int
+    ) -> list[str]:
+        # Mesma conversa, mesma resposta: o texto sai de um hash das mensagens
+        question = next(
+            (
+                m.get("content", "")
+                for m in reversed(messages)
+                if m.get("role") == "user"
+            ),
+            "",
+        )
+        digest = hashlib.sha256(
+            json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).digest()
+        generator = random.Random(digest)
+        tokens = ["Resposta", "simulada", "para:", f"{question[:60]!r}."]
+        while len(tokens) < self._config.response_tokens:
+            tokens.append(generator.choice(VOCABULARY))
+        return [f"{token} " for token in tokens[: max(1, limit)]]
+
+    @property
+    def token_interval(self) -> float:
+        rate = self._config.tokens_per_second
+        return 1 / rate if rate > 0 else 0.0
+
+    @property
+    def timeout_seconds(self) -> float:
+        return self._config.timeout_seconds
+
+    @property
+    def retry_after_seconds(self) -> int:
+        return self._config.retry_after_seconds
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "requests": self.requests,
+            "errors_429": self.errors_429,
+            "errors_500": self.errors_500,
+            "timeouts": self.timeouts,
+        }
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def create_app(config: StubLlmConfig) -> FastAPI:
+    behavior = StubLlmBehavior(config)
+    app = FastAPI(title="Stub LLM")
+
+    @app.get("/health")
+    async def health() -> dict[str, str]:
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats() -> dict[str, int]:
+        return behavior.stats()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Response:
+        body = await request.json()
+        behavior.requests += 1
+        failure = behavior.pick_failure()
+        if failure == "429":
+            behavior.errors_429 += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit simulado"}},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(behavior.retry_after_seconds)},
+            )
+        if failure == "500":
+            behavior.errors_500 += 1
+            return JSONResponse(
+                {"error": {"message": "Erro interno simulado"}},
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        if failure == "timeout":
+            behavior.timeouts += 1
+            await asyncio.sleep(behavior.timeout_seconds)
+
+        messages = body.get("messages") or []
+        tokens = behavior.build_answer_tokens(
+            messages, int(body.get("max_tokens") or 500)
+        )
+        created = int(time.time())
+        completion_id = f"chatcmpl-stub-{behavior.requests}"
+        usage = {
+            "prompt_tokens": sum(
+                estimate_tokens(str(m.get("content", ""))) for m in messages
+            ),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        latency = behavior.sample_latency()
+
+        if body.get("stream"):
+            include_usage = bool(
+                (body.get("stream_options") or {}).get("include_usage")
+            )
+            return StreamingResponse(
+                _stream_chunks(
+                    behavior,
+                    body,
+                    tokens,
+                    created,
+                    completion_id,
+                    latency,
+                    usage if include_usage else None,
+                ),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(latency + behavior.token_interval * len(tokens))
+        return JSONResponse(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+        )
+
+    return app
+
+
+async def _stream_chunks(
+    behavior: StubLlmBehavior,
+    body: dict[str, Any],
+    tokens: list[str],
+    created: int,
+    completion_id: str,
+    latency: float,
+    usage: dict[str, int] | None,
+) -> AsyncIterator[str]:
+    def event(choices: list[dict[str, Any]], **extra: Any) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": body.get("model", "stub"),
+            "choices": choices,
+            **extra,
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    await asyncio.sleep(latency)
+    yield event([{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}])
+    for token in tokens:
+        yield event([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+        await asyncio.sleep(behavior.token_interval)
+    yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    if usage is not None:
+        yield event([], usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+def parse_args() -> tuple[str, int, StubLlmConfig]:
+    parser = argparse.ArgumentParser(description="Servidor LLM simulado (OpenAI)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal"
+    )
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--error-429-rate", type=float, default=0.0)
+    parser.add_argument("--error-500-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=300.0)
+    parser.add_argument("--retry-after-seconds", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    config = StubLlmConfig(
+        latency_distribution=args.latency_distribution,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_429_rate=args.error_429_rate,
+        error_500_rate=args.error_500_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        retry_after_seconds=args.retry_after_seconds,
+        seed=args.seed,
+    )
+    return args.host, args.port, config
+
+
+if __name__ == "__main__":
+    host, port, config = parse_args()
+    uvicorn.run(create_app(config), host=host, port=port, log_level="warning")
@@ -0,0 +1,6 @@
+import os
+
+# Settings exige as variáveis do provedor; os testes não chamam o provedor real
+os.environ.setdefault("AI_API_KEY", "test")
+os.environ.setdefault("AI_API_URL", "http://127.0.0.1:8765/v1/chat/completions")
+os.environ.setdefault("AI_MODEL", "test")
@@ -0,0 +1,89 @@
+import asyncio
+from collections import defaultdict
+import pytest
+from src.ai.admission import (
+    AdmissionController,
+    AdmissionRejectedError,
+    Priority,
+    TokenBucket,
+)
+
+
+@pytest.fixture
+def admission(monkeypatch: pytest.MonkeyPatch) -> AdmissionController:
+    # Sem limite de taxa, duas chamadas simultâneas (uma por agente), fila de
+    # dois lugares e espera curta
+    admission = AdmissionController()
+    monkeypatch.setattr(admission, "_bucket", TokenBucket(0, 1))
+    monkeypatch.setattr(admission, "_max_concurrency", 2)
+    monkeypatch.setattr(admission, "_max_per_agent", 1)
+    monkeypatch.setattr(admission, "_queue_size", 2)
+    monkeypatch.setattr(admission, "_queue_timeout", 0.1)
+    monkeypatch.setattr(admission, "_queue", [])
+    monkeypatch.setattr(admission, "_active", defaultdict(int))
+    monkeypatch.setattr(admission, "_active_total", 0)
+    monkeypatch.setattr(admission, "_timer", None)
+    return admission
+
+
+def test_queued_requests_are_admitted_by_priority(
+    admission: AdmissionController,
+) -> None:
+    admitted: list[str] = []
+
+    async def request(name: str, priority: Priority) -> None:
+        async with admission.slot(1, priority):
+            admitted.append(name)
+            await asyncio.sleep(0.01)
+
+    async def scenario() -> None:
+        first = asyncio.create_task(request("primeira", Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        background = asyncio.create_task(request("resumo", Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(request("chat", Priority.INTERACTIVE))
+        await asyncio.gather(first, background, interactive)
+
+    asyncio.run(scenario())
+
+    assert admitted == ["primeira", "chat", "resumo"]
+
+
+def test_agent_at_its_limit_does_not_block_other_agents(
+    admission: AdmissionController,
+) -> None:
+    async def scenario() -> float:
+        await admission.acquire(1)
+        blocked = asyncio.create_task(admission.acquire(1))
+        await asyncio.sleep(0)
+        waited = await admission.acquire(2)
+        blocked.cancel()
+        await asyncio.gather(blocked, return_exceptions=True)
+        return waited
+
+    # Entra na fila atrás do agente 1, mas é liberado sem esperar por ele
+    assert asyncio.run(scenario()) < 0.05
+
+
+def test_queue_wait_times_out(admission: AdmissionController) -> None:
+    async def scenario() -> None:
+        await admission.acquire(1)
+        await admission.acquire(1)
+
+    with pytest.raises(AdmissionRejectedError):
+        asyncio.run(scenario())
+    assert admission.stats()["queue_depth"] == 0
+
+
+def test_full_queue_rejects_immediately(
+    admission: AdmissionController, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(admission, "_queue_size", 0)
+    monkeypatch.setattr(admission, "_queue_timeout", 10)
+
+    async def scenario() -> None:
+        await admission.acquire(1)
+        await admission.acquire(1)
+
+    with pytest.raises(AdmissionRejectedError):
+        asyncio.run(asyncio.wait_for(scenario(), timeout=1))
@@ -0,0 +1,49 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Any, Iterator
+import pytest
+from src.database import batch_writer
+from src.database.batch_writer import DurableBatchWriter
+
+
+class FakeSession:
+    def commit(self) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_db(monkeypatch: pytest.MonkeyPatch) -> None:
+    @contextmanager
+    def get_db() -> Iterator[FakeSession]:
+        yield FakeSession()
+
+    monkeypatch.setattr(batch_writer, "get_db", get_db)
+
+
+def test_cancelled_waiter_does_not_stop_the_writer(fake_db: None) -> None:
+    # Um turno cancelado enquanto espera o commit (cancel ou desconexão) não
+    # pode derrubar a thread: as gravações seguintes ficariam esperando
+    written: list[int] = []
+
+    def write_batch(session: Any, items: list[int]) -> list[int]:
+        written.extend(items)
+        return items
+
+    writer: DurableBatchWriter[int, int] = DurableBatchWriter(
+        "test", write_batch, batch_size=100, flush_interval=0.2
+    )
+
+    async def scenario() -> int:
+        waiter = asyncio.ensure_future(writer.write(1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0.4)
+        return await asyncio.wait_for(writer.write(2), timeout=2)
+
+    try:
+        assert asyncio.run(scenario()) == 2
+        # A linha do chamador cancelado também é gravada
+        assert written == [1, 2]
+        assert writer.failures == 0
+    finally:
+        writer.close()
@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable
+import pytest
+from src.modules.chat_replay import ChatReplay, settings
+from src.modules.connection_manager import ConnectionManager
+from src.schemas.ai import ChatResumed
+from src.schemas.chat_payload import ResumePayload
+
+HISTORY = [
+    SimpleNamespace(
+        id=message_id,
+        chat_id=1,
+        message=f"mensagem {message_id}",
+        is_user_message=message_id % 2 == 1,
+        message_date=datetime(2024, 1, 1),
+    )
+    for message_id in range(1, 6)
+]
+
+
+@pytest.fixture
+def sent_frames(monkeypatch: pytest.MonkeyPatch) -> list[dict[str, Any]]:
+    # Histórico de cinco mensagens em memória, lido em páginas de duas
+    frames: list[dict[str, Any]] = []
+
+    async def run_in_session(step: Callable[[Any], Any]) -> Any:
+        return step(None)
+
+    def load_page(self: ChatReplay, session: Any, limit: int) -> list[Any]:
+        last_id = self._last_message_id or 0
+        return [row for row in HISTORY if row.id > last_id][:limit]
+
+    async def send_frame(message: dict[str, Any], connection: Any) -> bool:
+        frames.append(message)
+        return True
+
+    monkeypatch.setattr("src.modules.chat_replay.run_in_session", run_in_session)
+    monkeypatch.setattr(
+        ChatReplay, "_resolve_chat", lambda self, _: SimpleNamespace(user_id=1)
+    )
+    monkeypatch.setattr(ChatReplay, "_load_page", load_page)
+    manager = ConnectionManager()
+    monkeypatch.setattr(manager, "bind", lambda *_: None)
+    monkeypatch.setattr(manager, "send_frame", send_frame)
+    monkeypatch.setattr(settings, "WS_RESUME_PAGE_SIZE", 2)
+    return frames
+
+
+def _resume(last_message_id: int | None) -> ChatResumed:
+    payload = ResumePayload(type="resume", chat_id=1, last_message_id=last_message_id)
+    connection: Any = SimpleNamespace(user=None)
+    return asyncio.run(ChatReplay(connection, payload, {}).execute())
+
+
+def test_replay_stops_at_the_limit_and_reports_truncation(
+    sent_frames: list[dict[str, Any]], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "WS_RESUME_MAX_MESSAGES", 3)
+
+    resumed = _resume(None)
+
+    assert [frame["message_id"] for frame in sent_frames[:-1]] == [1, 2, 3]
+    assert resumed.replayed == 3
+    assert resumed.last_message_id == 3
+    assert resumed.truncated
+
+
+def test_replay_sends_only_messages_after_the_last_seen(
+    sent_frames: list[dict[str, Any]], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "WS_RESUME_MAX_MESSAGES", 10)
+
+    resumed = _resume(2)
+
+    assert [frame["message_id"] for frame in sent_frames[:-1]] == [3, 4, 5]
+    assert resumed.last_message_id == 5
+    assert not resumed.truncated
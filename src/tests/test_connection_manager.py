@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Any
+from src.ai.chat_resolution import (
+    AgentSnapshot,
+    ChatResolution,
+    ChatResolutionCache,
+)
+from src.modules.connection_manager import ConnectionManager
+from src.modules.message_broker import BrokerMessage
+
+
+class FakeWebSocket:
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, text: str) -> None:
+        pass
+
+    async def close(self, code: int, reason: str | None = None) -> None:
+        pass
+
+
+def test_bind_after_disconnect_does_not_register_the_connection() -> None:
+    # Um turno que termina depois da desconexão não pode deixar o chat com um
+    # ouvinte morto (o cancelamento do fim da carência dependeria dele)
+    manager = ConnectionManager()
+
+    async def scenario() -> None:
+        websocket: Any = FakeWebSocket()
+        connection = await manager.connect(websocket)
+        manager.disconnect(connection)
+        manager.bind(connection, 42, 7)
+        assert not manager.has_chat_connections(42)
+        assert manager.stats()["users"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_chat_bound_on_another_worker_counts_as_listener() -> None:
+    # Um resume em outro worker durante a carência mantém o turno vivo
+    manager = ConnectionManager()
+
+    async def scenario() -> None:
+        disconnected_at = time.monotonic()
+        manager._on_broker_message(BrokerMessage("chat_bound", 43, "", "outro"))
+        assert manager.has_chat_connections(43, disconnected_at)
+        assert not manager.has_chat_connections(43, time.monotonic() + 1)
+        assert not manager.has_chat_connections(44, disconnected_at)
+
+    asyncio.run(scenario())
+
+
+def test_ai_cache_change_from_another_worker_drops_the_resolution() -> None:
+    agent = AgentSnapshot(
+        id=9,
+        name="agente",
+        theme="pedidos",
+        behavior=None,
+        temperature=0.5,
+        top_p=0.9,
+        faq_top_k=None,
+        faq_token_budget=None,
+        response_cache_enabled=False,
+        faq_short_circuit_enabled=False,
+    )
+    resolution = ChatResolution(
+        chat_id=45,
+        user_id=1,
+        agent=agent,
+        knowledge_base=None,
+        expires_at=time.monotonic() + 60,
+    )
+    ChatResolutionCache().set(resolution)
+
+    ConnectionManager()._on_broker_message(
+        BrokerMessage("ai_cache_changed", agent.id, "agent", "outro")
+    )
+
+    assert ChatResolutionCache().get(45) is None
+    assert not resolution.is_valid()
@@ -0,0 +1,49 @@
+import asyncio
+from typing import Any
+import pytest
+from src.ai import conversation_summary
+from src.ai.ai_service import UpstreamUsage
+from src.ai.chat_resolution import AgentSnapshot
+from src.ai.conversation_memory import ConversationMemory
+from src.ai.conversation_summary import ChatSummaryUpdater
+from src.ai.usage_tracker import TurnUsage, usage_writer
+
+
+class FakeUpstream:
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.usage = UpstreamUsage(
+            prompt_tokens=900, completion_tokens=60, upstream_seconds=1.2
+        )
+
+    async def execute(self) -> tuple[str, int]:
+        return " resumo ", 0
+
+
+def test_summary_calls_are_recorded_as_usage(monkeypatch: pytest.MonkeyPatch) -> None:
+    recorded: list[TurnUsage] = []
+    monkeypatch.setattr(conversation_summary, "GeminiComunicationHandler", FakeUpstream)
+    monkeypatch.setattr(usage_writer, "add", recorded.append)
+    agent = AgentSnapshot(
+        id=4,
+        name="agente",
+        theme="pedidos",
+        behavior=None,
+        temperature=0.5,
+        top_p=0.9,
+        faq_top_k=None,
+        faq_token_budget=None,
+        response_cache_enabled=False,
+        faq_short_circuit_enabled=False,
+    )
+    updater = ChatSummaryUpdater(7, agent.id, ConversationMemory(1000), 100)
+    updater._user_id = 3
+    updater._knowledge_base_id = 2
+
+    assert asyncio.run(updater._summarize(agent, [])) == "resumo"
+
+    [usage] = recorded
+    assert (usage.chat_id, usage.user_id, usage.agent_id) == (7, 3, 4)
+    assert usage.knowledge_base_id == 2
+    assert usage.source == "summary"
+    assert (usage.prompt_tokens, usage.completion_tokens) == (900, 60)
+    assert usage.upstream_ms == 1200
@@ -0,0 +1,40 @@
+from src.ai.faq_retrieval import FaqIndex, LexicalIndex, format_faq_pair
+
+
+def test_lexical_search_ranks_matching_questions_first() -> None:
+    index = LexicalIndex(
+        ["Como cancelar meu pedido?", "Qual o prazo de entrega?", "Como pagar?"],
+        ["Pelo aplicativo.", "Até cinco dias úteis.", "Com cartão ou pix."],
+    )
+
+    results = index.search("prazo da entrega", 2)
+
+    assert [doc_id for doc_id, _ in results] == [1]
+    assert index.search("pergunta sem relação", 2) == []
+
+
+def test_select_context_skips_pairs_over_budget_and_keeps_smaller_ones() -> None:
+    long_answer = "Entrega expressa disponível. " * 40
+    index = FaqIndex(
+        ["Qual o prazo da entrega expressa?", "Qual o prazo da entrega normal?"],
+        [long_answer, "Cinco dias."],
+        "lexical",
+    )
+
+    context = index.select_context("prazo da entrega expressa", 2, 30)
+
+    assert context == format_faq_pair("Qual o prazo da entrega normal?", "Cinco dias.")
+
+
+def test_match_question_rejects_negated_or_different_numbers() -> None:
+    index = FaqIndex(
+        ["Como cancelar meu pedido?", "Posso parcelar em 12 vezes?"],
+        ["Pelo aplicativo.", "Sim, no cartão."],
+        "lexical",
+    )
+    index.ensure_vectors()
+
+    match = index.match_question("como cancelar meu pedido")
+    assert match is not None and match[0] == 0
+    assert index.match_question("Como NÃO cancelar meu pedido?") is None
+    assert index.match_question("Posso parcelar em 3 vezes?") is None
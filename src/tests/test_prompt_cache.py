@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from dataclasses import replace
+import pytest
+from src.ai.chat_resolution import AgentSnapshot
+from src.ai.faq_retrieval import FaqIndex
+from src.ai.prompt_cache import SystemPromptCache, settings
+
+AGENT = AgentSnapshot(
+    id=1,
+    name="Agente",
+    theme="pedidos",
+    behavior=None,
+    temperature=0.7,
+    top_p=1.0,
+    faq_top_k=None,
+    faq_token_budget=None,
+    response_cache_enabled=True,
+    faq_short_circuit_enabled=True,
+)
+
+
+@pytest.fixture
+def prompt_cache(monkeypatch: pytest.MonkeyPatch) -> SystemPromptCache:
+    cache = SystemPromptCache()
+    monkeypatch.setattr(cache, "_prompts", OrderedDict())
+    monkeypatch.setattr(settings, "AI_PROMPT_CACHE_SIZE", 2)
+    return cache
+
+
+def test_prompt_is_rebuilt_when_the_agent_or_knowledge_base_changes(
+    prompt_cache: SystemPromptCache,
+) -> None:
+    faq_index = FaqIndex(["Como cancelar?"], ["Pelo aplicativo."], "lexical")
+    prompt = prompt_cache.get_full_prompt(AGENT, 10, "v1", faq_index)
+    assert prompt_cache.get_full_prompt(AGENT, 10, "v1", faq_index) is prompt
+
+    changed_agent = replace(AGENT, theme="entregas")
+    assert "entregas" in prompt_cache.get_header(changed_agent, 10, "v1")
+
+    new_index = FaqIndex(["Como trocar?"], ["Na loja."], "lexical")
+    new_prompt = prompt_cache.get_full_prompt(changed_agent, 10, "v2", new_index)
+    assert "Como trocar?" in new_prompt
+    assert "Como cancelar?" not in new_prompt
+
+
+def test_cache_keeps_only_the_most_recent_agents(
+    prompt_cache: SystemPromptCache,
+) -> None:
+    for agent_id in (1, 2, 3):
+        prompt_cache.get_header(replace(AGENT, id=agent_id), 10, "v1")
+
+    assert [key[0] for key in prompt_cache._prompts] == [2, 3]
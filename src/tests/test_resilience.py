@@ -0,0 +1,63 @@
+import pytest
+from src.ai.resilience import CircuitBreaker, RetryPolicy, parse_retry_after
+
+
+def test_circuit_opens_after_consecutive_failures() -> None:
+    breaker = CircuitBreaker(failure_threshold=3, recovery_seconds=60)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_half_open_circuit_lets_a_single_probe_through(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=60)
+    breaker.record_failure()
+    # Simula o fim do tempo de recuperação
+    monkeypatch.setattr(breaker, "_opened_at", breaker._opened_at - 60)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_circuit(monkeypatch: pytest.MonkeyPatch) -> None:
+    breaker = CircuitBreaker(failure_threshold=3, recovery_seconds=60)
+    for _ in range(3):
+        breaker.record_failure()
+    monkeypatch.setattr(breaker, "_opened_at", breaker._opened_at - 60)
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+
+def test_retry_delay_honors_retry_after_up_to_the_ceiling() -> None:
+    policy = RetryPolicy(
+        max_attempts=3, backoff_base=0.5, backoff_max=4, attempt_timeout=10
+    )
+
+    assert policy.get_delay(0, retry_after=2) == 2
+    assert policy.get_delay(0, retry_after=30) is None
+    for attempt in range(5):
+        delay = policy.get_delay(attempt)
+        assert delay is not None
+        assert 0 <= delay <= min(4, 0.5 * 2**attempt)
+
+
+def test_parse_retry_after_accepts_seconds_and_dates() -> None:
+    assert parse_retry_after("7") == 7
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("amanhã") is None
+    assert parse_retry_after(None) is None
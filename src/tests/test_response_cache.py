@@ -0,0 +1,40 @@
+from collections import OrderedDict
+import pytest
+from src.ai.response_cache import ResponseCache, ResponseCacheKey
+
+
+@pytest.fixture
+def cache(monkeypatch: pytest.MonkeyPatch) -> ResponseCache:
+    # Cache vazio com no máximo duas respostas
+    cache = ResponseCache()
+    monkeypatch.setattr(cache, "_entries", OrderedDict())
+    monkeypatch.setattr(cache, "_bytes", 0)
+    monkeypatch.setattr(cache, "_max_entries", 2)
+    monkeypatch.setattr(cache, "_ttl", 60)
+    return cache
+
+
+def _key(question: str) -> ResponseCacheKey:
+    return (1, "tema", None, 0.7, 1.0, "v1", question)
+
+
+def test_least_recently_used_answer_is_evicted(cache: ResponseCache) -> None:
+    cache.set(_key("a"), "resposta a", 1)
+    cache.set(_key("b"), "resposta b", 1)
+    assert cache.get(_key("a")) is not None
+
+    cache.set(_key("c"), "resposta c", 1)
+
+    assert cache.get(_key("b")) is None
+    assert cache.get(_key("a")) is not None
+    assert cache.get(_key("c")) is not None
+
+
+def test_expired_answer_is_not_returned(
+    cache: ResponseCache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(cache, "_ttl", 0)
+    cache.set(_key("a"), "resposta a", 1)
+
+    assert cache.get(_key("a")) is None
+    assert cache.stats()["entries"] == 0
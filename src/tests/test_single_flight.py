@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from src.ai.single_flight import Completion, UpstreamSingleFlight
+
+
+@pytest.fixture
+def single_flight(monkeypatch: pytest.MonkeyPatch) -> UpstreamSingleFlight:
+    single_flight = UpstreamSingleFlight()
+    monkeypatch.setattr(single_flight, "_in_flight", {})
+    monkeypatch.setattr(single_flight, "_waiters", {})
+    return single_flight
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call(
+    single_flight: UpstreamSingleFlight,
+) -> None:
+    calls: list[str] = []
+
+    async def request() -> Completion:
+        calls.append("chamada")
+        await asyncio.sleep(0.05)
+        return Completion(answer="resposta", created=1)
+
+    async def scenario() -> Completion:
+        first = asyncio.create_task(single_flight.run("chave", request))
+        second = asyncio.create_task(single_flight.run("chave", request))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    completion = asyncio.run(scenario())
+
+    assert completion.answer == "resposta"
+    assert calls == ["chamada"]
+
+
+def test_shared_call_is_cancelled_when_every_waiter_gives_up(
+    single_flight: UpstreamSingleFlight,
+) -> None:
+    upstream_cancelled = False
+
+    async def request() -> Completion:
+        nonlocal upstream_cancelled
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            upstream_cancelled = True
+            raise
+        return Completion(answer="resposta", created=1)
+
+    async def scenario() -> None:
+        waiters = [
+            asyncio.create_task(single_flight.run("chave", request)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        # Deixa a task da chamada processar o cancelamento
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+    assert upstream_cancelled
+    assert single_flight.stats()["in_flight"] == 0
@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from src.ai.resilience import RetryPolicy, UpstreamError, UpstreamUnavailableError
+from src.ai.upstream_router import UpstreamEndpoint, UpstreamRouter, load_endpoints
+
+
+@pytest.fixture
+def router(monkeypatch: pytest.MonkeyPatch) -> UpstreamRouter:
+    # Endpoints novos (circuito fechado) e sem espera entre as tentativas
+    router = UpstreamRouter()
+    monkeypatch.setattr(router, "endpoints", load_endpoints())
+    monkeypatch.setattr(
+        router,
+        "retry_policy",
+        RetryPolicy(max_attempts=3, backoff_base=0, backoff_max=1, attempt_timeout=1),
+    )
+    monkeypatch.setattr(router, "_hedge_delay", 0)
+    return router
+
+
+def test_retryable_failures_become_unavailable_after_the_last_attempt(
+    router: UpstreamRouter,
+) -> None:
+    attempts: list[str] = []
+
+    async def request(endpoint: UpstreamEndpoint) -> str:
+        attempts.append(endpoint.name)
+        raise UpstreamError("500", status_code=500)
+
+    with pytest.raises(UpstreamUnavailableError):
+        asyncio.run(router.call(request))
+    assert len(attempts) == 3
+
+
+def test_request_errors_are_not_retried(router: UpstreamRouter) -> None:
+    attempts: list[str] = []
+
+    async def request(endpoint: UpstreamEndpoint) -> str:
+        attempts.append(endpoint.name)
+        raise UpstreamError("400", status_code=400, retryable=False)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(router.call(request))
+    assert len(attempts) == 1
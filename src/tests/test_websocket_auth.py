@@ -0,0 +1,88 @@
+import asyncio
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Any, Callable
+import pytest
+from fastapi import WebSocketException, status
+from src.auth.auth_utils import Auth, CurrentUserCache
+from src.modules.websocket_session import ChatConnectionSession
+from src.schemas.auth import CurrentUser
+
+USER = CurrentUser(id=7, email="ana@example.com", name="Ana", role=[1], enabled=True)
+
+
+@pytest.fixture
+def database_loads(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    # Só o USER existe (e está ativo) no "banco"; devolve os ids consultados
+    loads: list[int] = []
+
+    async def run_in_session(step: Callable[[Any], Any]) -> Any:
+        return step(None)
+
+    def load_current_user(session: Any, user_id: int) -> CurrentUser | None:
+        loads.append(user_id)
+        if user_id != USER.id:
+            return None
+        CurrentUserCache().set(USER)
+        return USER
+
+    monkeypatch.setattr("src.auth.auth_utils.run_in_session", run_in_session)
+    monkeypatch.setattr(Auth, "load_current_user", load_current_user)
+    monkeypatch.setattr("src.auth.auth_utils.NO_AUTH", False)
+    CurrentUserCache().invalidate(USER.id)
+    return loads
+
+
+def _token(user_id: int, expires_delta: timedelta = timedelta(minutes=5)) -> str:
+    return Auth.create_access_token({"sub": str(user_id)}, [1], expires_delta)
+
+
+def _assert_rejected(token: str | None) -> None:
+    with pytest.raises(WebSocketException) as error:
+        asyncio.run(Auth.authenticate_token(token))
+    assert error.value.code == status.WS_1008_POLICY_VIOLATION
+
+
+def test_valid_token_hits_the_database_only_once(database_loads: list[int]) -> None:
+    token = _token(USER.id)
+
+    for _ in range(3):
+        user, claims = asyncio.run(Auth.authenticate_token(token))
+        assert user == USER
+        assert claims.user_id == USER.id
+
+    assert database_loads == [USER.id]
+
+
+@pytest.mark.usefixtures("database_loads")
+def test_missing_invalid_expired_or_unknown_tokens_are_rejected() -> None:
+    _assert_rejected(None)
+    _assert_rejected("não é um jwt")
+    _assert_rejected(_token(USER.id, timedelta(minutes=-1)))
+    _assert_rejected(_token(8))
+
+
+@pytest.mark.usefixtures("database_loads")
+def test_websocket_token_is_read_from_query_string_or_header() -> None:
+    from_query: Any = SimpleNamespace(
+        query_params={"token": _token(USER.id)}, headers={}
+    )
+    from_header: Any = SimpleNamespace(
+        query_params={}, headers={"authorization": f"Bearer {_token(USER.id)}"}
+    )
+
+    for websocket in (from_query, from_header):
+        authenticated = asyncio.run(Auth.get_websocket_user(websocket))
+        assert authenticated is not None
+        assert authenticated[0] == USER
+
+
+def test_frames_after_token_expiry_close_the_connection() -> None:
+    # O usuário fica na conexão; só a expiração do token é conferida
+    connection: Any = SimpleNamespace(user=USER, token_expires_at=int(time.time()) - 1)
+    session = ChatConnectionSession(connection)
+
+    with pytest.raises(WebSocketException) as error:
+        asyncio.run(session.handle({"type": "cancel", "chat_id": 1}))
+    assert error.value.code == status.WS_1008_POLICY_VIOLATION
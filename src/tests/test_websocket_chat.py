@@ -0,0 +1,157 @@
+import asyncio
+import time
+from datetime import datetime
+import pytest
+from typing import Any
+from sqlalchemy.orm import Session
+from src.ai.ai_service import UpstreamUsage
+from src.ai.chat_resolution import AgentSnapshot, KnowledgeBaseHandle
+from src.ai.faq_retrieval import FaqIndex
+from src.modules.websocket_chat import AiHandler
+from src.schemas.ai import AiResponse
+from src.schemas.chat_payload import ChatPayload
+
+SLOW_DATABASE_SECONDS = 0.5
+SLOW_RETRIEVAL_SECONDS = 0.3
+
+
+def _payload(chat_id: int) -> ChatPayload:
+    return ChatPayload(chat_id=chat_id, message="Olá", message_date=datetime.now())
+
+
+@pytest.fixture
+def slow_chat_pipeline(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Banco síncrono lento só no chat 1 e provedor instantâneo: se algum passo
+    # de banco rodar no event loop, o chat 2 fica parado esperando o chat 1
+    def prepare_turn(self: AiHandler, session: Session) -> None:
+        if self._payload.chat_id == 1:
+            time.sleep(SLOW_DATABASE_SECONDS)
+
+    async def send_message_to_ai(self: AiHandler) -> None:
+        self._ai_response = AiResponse(
+            answer=f"resposta {self._payload.chat_id}",
+            response_date=int(time.time()),
+        )
+
+    async def add_ai_response_to_history(self: AiHandler) -> None:
+        return None
+
+    monkeypatch.setattr(AiHandler, "_prepare_turn", prepare_turn)
+    monkeypatch.setattr(AiHandler, "_send_message_to_ai", send_message_to_ai)
+    monkeypatch.setattr(AiHandler, "_add_user_message_to_history", lambda _: None)
+    monkeypatch.setattr(
+        AiHandler, "_add_ai_response_to_history", add_ai_response_to_history
+    )
+    monkeypatch.setattr(AiHandler, "_record_usage", lambda _: None)
+    monkeypatch.setattr(AiHandler, "_schedule_summary", lambda _: None)
+    monkeypatch.setattr(
+        "src.database.get_db.SessionFactory", lambda: Session(), raising=True
+    )
+
+
+@pytest.mark.usefixtures("slow_chat_pipeline")
+def test_concurrent_chats_progress_independently() -> None:
+    finished: dict[int, float] = {}
+
+    async def run_chat(chat_id: int) -> None:
+        response = await AiHandler(_payload(chat_id)).execute()
+        assert response.answer == f"resposta {chat_id}"
+        finished[chat_id] = time.perf_counter()
+
+    async def run_both() -> float:
+        started_at = time.perf_counter()
+        slow_chat = asyncio.create_task(run_chat(1))
+        await asyncio.sleep(0)
+        await run_chat(2)
+        fast_elapsed = time.perf_counter() - started_at
+        await slow_chat
+        return fast_elapsed
+
+    fast_elapsed = asyncio.run(run_both())
+
+    assert finished[2] < finished[1]
+    assert fast_elapsed < SLOW_DATABASE_SECONDS / 2
+
+
+class FakeUpstream:
+    def __init__(self, agent: AgentSnapshot, question: str, *args: Any) -> None:
+        self.usage = UpstreamUsage()
+        self.partial_answer = ""
+
+    async def execute(self) -> tuple[str, int]:
+        return "resposta do provedor", int(time.time())
+
+
+@pytest.fixture
+def large_knowledge_base(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Numa base grande o atalho e o recorte do contexto levam centenas de ms;
+    # aqui a busca é simplesmente lenta
+    agent = AgentSnapshot(
+        id=1,
+        name="agente",
+        theme="pedidos",
+        behavior=None,
+        temperature=0.5,
+        top_p=0.9,
+        faq_top_k=3,
+        faq_token_budget=500,
+        response_cache_enabled=False,
+        faq_short_circuit_enabled=True,
+    )
+
+    def resolve_chat(self: AiHandler, session: Session) -> None:
+        self._user_id = 1
+        self._agent = agent
+        self._agent_id = agent.id
+        self._knowledge_base = KnowledgeBaseHandle(id=1, version="v1")
+
+    def load_faq_index(self: AiHandler, session: Session) -> None:
+        self._faq_index = FaqIndex(["Como cancelar?"], ["No app."], "lexical")
+
+    def slow_search(self: FaqIndex, query: str, top_k: int) -> list[int]:
+        time.sleep(SLOW_RETRIEVAL_SECONDS)
+        return [0]
+
+    def slow_match(self: FaqIndex, query: str) -> tuple[int, float] | None:
+        time.sleep(SLOW_RETRIEVAL_SECONDS)
+        return None
+
+    async def add_ai_response_to_history(self: AiHandler) -> None:
+        return None
+
+    monkeypatch.setattr(AiHandler, "_resolve_chat", resolve_chat)
+    monkeypatch.setattr(AiHandler, "_load_conversation_history", lambda *_: None)
+    monkeypatch.setattr(AiHandler, "_load_faq_index", load_faq_index)
+    monkeypatch.setattr(FaqIndex, "search", slow_search)
+    monkeypatch.setattr(FaqIndex, "match_question", slow_match)
+    monkeypatch.setattr(
+        "src.modules.websocket_chat.GeminiComunicationHandler", FakeUpstream
+    )
+    monkeypatch.setattr(AiHandler, "_add_user_message_to_history", lambda _: None)
+    monkeypatch.setattr(
+        AiHandler, "_add_ai_response_to_history", add_ai_response_to_history
+    )
+    monkeypatch.setattr(AiHandler, "_record_usage", lambda _: None)
+    monkeypatch.setattr(AiHandler, "_schedule_summary", lambda _: None)
+    monkeypatch.setattr(
+        "src.database.get_db.SessionFactory", lambda: Session(), raising=True
+    )
+
+
+@pytest.mark.usefixtures("large_knowledge_base")
+def test_faq_retrieval_does_not_block_the_event_loop() -> None:
+    async def run_turn() -> float:
+        longest_pause = 0.0
+        turn = asyncio.create_task(AiHandler(_payload(1)).execute())
+        last_tick = time.perf_counter()
+        while not turn.done():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            longest_pause = max(longest_pause, now - last_tick)
+            last_tick = now
+        assert (await turn).answer == "resposta do provedor"
+        return longest_pause
+
+    longest_pause = asyncio.run(run_turn())
+
+    assert longest_pause < SLOW_RETRIEVAL_SECONDS / 2